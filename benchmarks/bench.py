@@ -0,0 +1,404 @@
+"""Benchmarks for the list, search, detail and write paths
+
+Seeds SQLite databases with synthetic contacts and times the operations the
+application performs, through the same library calls:
+
+    load_contacts            count and first page of the full list
+    scroll_jump / scroll_page  far jump (OFFSET) and next page (keyset)
+    sort[<column>]           next page (keyset) of the list sorted by a heading
+    search[<fields>]         SearchPageSource for every combination of fields
+    search[text]             ranked "Any Field" search
+    search[fuzzy]            "Sounds like" search for misspelled full names
+    store_load               every contact read into a ContactStore
+    store_search[<fields>]   the field searches answered from the ContactStore
+    display_contact_details  full record by id
+    prefetch_neighbours      full records of the rows around a selection
+    duplicate_check          near-match lookup the dialog runs before adding a contact
+    insert / update / delete single writes, each followed by the re-read the dialog does
+    poll_changes             change feed read after the single writes, as other clients poll it
+    snapshot_sync            incremental sync of the local snapshot after one change
+    snapshot_cold_start      open the local snapshot and read the first page, as at startup
+    bulk_insert              add_many batches, as the importer sends them
+    treeview_*               VirtualContactList rendering (--treeview, needs a display)
+
+Results are printed as JSON with p50/p95/p99 latency in milliseconds and
+operations per second, so two runs can be compared:
+
+    python benchmarks/bench.py --sizes 10000 100000 --output before.json
+    xvfb-run python benchmarks/bench.py --sizes 10000 --treeview
+
+Seeded databases are kept in --db-dir and reused by later runs with the
+same size and seed; --fresh rebuilds them.
+"""
+
+import argparse
+import itertools
+import json
+import logging
+import math
+import os
+import platform
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from phonebook.columnar import ContactStore, StorePageSource  # noqa: E402
+from phonebook.config import DEFAULTS  # noqa: E402
+from phonebook.paging import ContactPageSource, FuzzySearchSource, SearchPageSource, TextSearchSource  # noqa: E402
+from phonebook.snapshot import open_snapshot, sync_snapshot  # noqa: E402
+from phonebook.storage import SORT_COLUMNS, open_repository  # noqa: E402
+
+FIRST_NAMES = ("James", "Mary", "Robert", "Patricia", "John", "Jennifer", "Michael", "Linda", "David", "Elizabeth",
+               "Sara", "Reza", "Maryam", "Ali", "Zahra", "Hossein", "Fatemeh", "Mohammad", "Leila", "Kiarash",
+               "Chloé", "José", "Zoë", "Björn", "Ana", "Wei", "Yuki", "Olga", "Ahmed", "Priya")
+LAST_NAMES = ("Smith", "Johnson", "Williams", "Brown", "Jones", "Garcia", "Miller", "Davis", "Rodriguez", "Martinez",
+              "Hosseini", "Mohammadi", "Karimi", "Ahmadi", "Rezaei", "Sabbaghi", "Moradi", "Jafari", "Rahimi",
+              "Müller", "Schmidt", "Dubois", "Rossi", "Nowak", "Tanaka", "Wang", "Kim", "Nguyen", "Silva", "Ivanova")
+COMPANIES = ("Acme", "Globex", "Initech", "Umbrella", "Hooli", "Stark Industries", "Wayne Enterprises", "Tyrell",
+             "Cyberdyne", "Soylent", "Aperture", "Massive Dynamic", "", "", "")
+STREETS = ("Main St", "High St", "Park Ave", "Oak Rd", "Valiasr St", "Enghelab Sq", "Baker St", "Elm St")
+DOMAINS = ("example.com", "mail.test", "corp.example", "inbox.test")
+
+# Contacts per add_many call while seeding, and per bulk_insert sample
+SEED_BATCH = 5000
+BULK_BATCH = 1000
+
+# Rows requested for the first page: the Treeview height plus the prefetch margin
+FIRST_PAGE = 15 + 100
+SEARCH_FIELDS = ("first_name", "last_name", "phone")
+
+
+def synthetic_contact(rng, number):
+    """A plausible contact, the same for the same random state"""
+    first_name = rng.choice(FIRST_NAMES)
+    last_name = rng.choice(LAST_NAMES)
+    if rng.random() < 0.3:
+        last_name += f"-{rng.choice(LAST_NAMES)}"
+    return {
+        "first_name": first_name,
+        "last_name": last_name,
+        "phone": f"+1 {rng.randint(200, 999)} {rng.randint(200, 999)} {number % 10000:04d}",
+        "email": f"{first_name.lower()}.{last_name.lower()}{number}@{rng.choice(DOMAINS)}" if rng.random() < 0.8 else "",
+        "address": f"{rng.randint(1, 999)} {rng.choice(STREETS)}" if rng.random() < 0.6 else "",
+        "company": rng.choice(COMPANIES),
+        "notes": " ".join(rng.choice(LAST_NAMES) for _ in range(rng.randint(0, 40))),
+    }
+
+
+def percentile(samples, fraction):
+    """Nearest-rank percentile of sorted samples: the ceil(fraction * n)-th smallest"""
+    # Rounded first, 0.07 * 100 is 7.000000000000001
+    rank = math.ceil(round(fraction * len(samples), 9))
+    return samples[min(max(rank - 1, 0), len(samples) - 1)]
+
+
+def summarize(samples, items=1):
+    """Latency percentiles in ms and throughput of timed samples in seconds"""
+    ordered = sorted(samples)
+    total = sum(ordered)
+    return {
+        "count": len(ordered),
+        "p50_ms": round(percentile(ordered, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(ordered, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(ordered, 0.99) * 1000, 3),
+        "mean_ms": round(total / len(ordered) * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3),
+        "ops_per_second": round(len(ordered) / total, 1) if total else None,
+        "rows_per_second": round(len(ordered) * items / total, 1) if total and items > 1 else None,
+    }
+
+
+def timed(func, repeat):
+    """Seconds taken by each of repeat calls of func(i)"""
+    samples = []
+    for i in range(repeat):
+        started = time.perf_counter()
+        func(i)
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def seed_database(path, size, seed, fresh=False):
+    """Database with size synthetic contacts, reusing an earlier one - returns (repo, seconds seeding took)"""
+    settings = dict(DEFAULTS, backend="sqlite", sqlite_path=path)
+    if fresh:
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+    repo = open_repository(settings)
+    repo.create_schema()
+    existing = repo.count()
+    if existing == size:
+        return repo, None
+    if existing:
+        repo.close()
+        return seed_database(path, size, seed, fresh=True)
+
+    rng = random.Random(seed)
+    started = time.perf_counter()
+    for start in range(0, size, SEED_BATCH):
+        repo.add_many([synthetic_contact(rng, number) for number in range(start, min(start + SEED_BATCH, size))])
+        logging.info(f"Seeded {min(start + SEED_BATCH, size)}/{size} contacts")
+    repo.conn.execute("ANALYZE")
+    return repo, time.perf_counter() - started
+
+
+def search_terms(repo, rng, size, count):
+    """Criteria cut out of random existing contacts, so every search has results"""
+    terms = []
+    while len(terms) < count:
+        record = repo.get(rng.randint(1, size))
+        if record:
+            terms.append({
+                "first_name": record[1][:rng.randint(2, 4)],
+                "last_name": record[2][:rng.randint(3, 5)],
+                "phone": "".join(ch for ch in record[3] if ch.isdigit())[-4:],
+            })
+    return terms
+
+
+def misspell(rng, word):
+    """word with one letter dropped, doubled or swapped with its neighbour"""
+    if len(word) < 3:
+        return word
+    i = rng.randrange(1, len(word) - 1)
+    edit = rng.choice(("drop", "double", "swap"))
+    if edit == "drop":
+        return word[:i] + word[i + 1:]
+    if edit == "double":
+        return word[:i] + word[i] + word[i:]
+    return word[:i] + word[i + 1] + word[i] + word[i + 2:]
+
+
+def run_size(args, size):
+    """All measurements for one database size"""
+    path = os.path.join(args.db_dir, f"bench-{size}-{args.seed}.db")
+    repo, seed_seconds = seed_database(path, size, args.seed, args.fresh)
+    rng = random.Random(args.seed + size)
+    repeat = args.repeat
+    results = {}
+    try:
+        max_id = repo.execute("SELECT MAX(id) FROM contacts").fetchone()[0]
+        ids = [rng.randint(1, max_id) for _ in range(repeat)]
+
+        results["load_contacts"] = timed(lambda i: ContactPageSource().load(repo, FIRST_PAGE), repeat)
+
+        source = ContactPageSource()
+        total = repo.count()
+        offsets = [rng.randint(0, max(total - FIRST_PAGE, 0)) for _ in range(repeat)]
+        results["scroll_jump"] = timed(lambda i: source.fetch_at(repo, offsets[i], FIRST_PAGE), repeat)
+        anchors = [source.key(source.fetch_at(repo, offset, 1)[0]) for offset in offsets]
+        results["scroll_page"] = timed(lambda i: source.fetch_after(repo, anchors[i], 100), repeat)
+
+        # Keyset pages of every sortable column, both directions, from random positions
+        for column in SORT_COLUMNS:
+            for sort in (column, f"-{column}"):
+                sorted_source = ContactPageSource(sort=sort)
+                keys = [sorted_source.key(sorted_source.fetch_at(repo, offset, 1)[0]) for offset in offsets]
+                results[f"sort[{sort}]"] = timed(lambda i: sorted_source.fetch_after(repo, keys[i], 100), repeat)
+
+        # Every combination of the field searches, then the ranked text search
+        terms = search_terms(repo, rng, max_id, repeat)
+        for width in range(1, len(SEARCH_FIELDS) + 1):
+            for fields in itertools.combinations(SEARCH_FIELDS, width):
+                criteria = [{field: term[field] for field in fields} for term in terms]
+                results[f"search[{'+'.join(fields)}]"] = timed(
+                    lambda i: SearchPageSource(criteria[i], DEFAULTS["search_cache_rows"]).load(repo, FIRST_PAGE),
+                    repeat)
+        texts = [f"{term['first_name']} {term['last_name']}" for term in terms]
+        results["search[text]"] = timed(
+            lambda i: TextSearchSource(texts[i], {}, DEFAULTS["text_search_limit"]).load(repo, FIRST_PAGE), repeat)
+        names = []
+        for contact_id in ids:
+            record = repo.get(contact_id)
+            names.append(f"{misspell(rng, record[1])} {misspell(rng, record[2].split('-')[0])}" if record else "")
+        results["search[fuzzy]"] = timed(
+            lambda i: FuzzySearchSource(names[i], {}, DEFAULTS["text_search_limit"]).load(repo, FIRST_PAGE), repeat)
+
+        # The field searches again, over every contact in memory
+        stores = []
+        results["store_load"] = timed(lambda i: stores.append(ContactStore.load(repo)), 1)
+        store = stores[0]
+        store_megabytes = round(store.memory_size() / 1e6, 1)
+        for width in range(1, len(SEARCH_FIELDS) + 1):
+            for fields in itertools.combinations(SEARCH_FIELDS, width):
+                criteria = [{field: term[field] for field in fields} for term in terms]
+                results[f"store_search[{'+'.join(fields)}]"] = timed(
+                    lambda i: StorePageSource(store, criteria[i]).load(repo, FIRST_PAGE), repeat)
+
+        results["display_contact_details"] = timed(lambda i: repo.get_header(ids[i]), repeat)
+        neighbours = [[row[0] for row in source.fetch_at(repo, offset, 2 * DEFAULTS["contact_prefetch"])]
+                      for offset in offsets]
+        results["prefetch_neighbours"] = timed(lambda i: list(repo.iter_headers(neighbours[i])), repeat)
+        results["read_notes"] = timed(lambda i: repo.read_notes(ids[i], 0, DEFAULTS["notes_chunk_size"]), repeat)
+
+        # Writes, each followed by the re-read the contact dialog does
+        contacts = [synthetic_contact(rng, size + i) for i in range(repeat)]
+        results["duplicate_check"] = timed(lambda i: repo.find_similar(contacts[i], DEFAULTS["dedupe_threshold"]),
+                                           repeat)
+        token = repo.change_token()
+        added = []
+        results["insert"] = timed(lambda i: added.append(repo.get(repo.add(contacts[i]))[0]), repeat)
+        results["update"] = timed(lambda i: (repo.update(added[i], contacts[-1 - i]), repo.get(added[i])), repeat)
+        results["poll_changes"] = timed(lambda i: repo.changes_since(token), repeat)
+
+        # The snapshot is kept next to the database; the first run copies every contact
+        snapshot_path = os.path.join(args.db_dir, f"bench-{size}-{args.seed}-snapshot.db")
+        snapshot_settings = dict(DEFAULTS, snapshot_path=snapshot_path)
+        if seed_seconds is not None:
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(snapshot_path + suffix):
+                    os.remove(snapshot_path + suffix)
+        snapshot = open_snapshot(snapshot_settings)
+        sync_snapshot(repo, snapshot)
+        results["snapshot_sync"] = timed(lambda i: (repo.update(added[i], contacts[i]), sync_snapshot(repo, snapshot)),
+                                         repeat)
+        results["snapshot_cold_start"] = timed(lambda i: cold_start(snapshot_settings), repeat)
+        results["delete"] = timed(lambda i: repo.delete(added[i]), repeat)
+
+        # Bulk inserts are removed again so the next run sees the same table
+        batches = max(repeat // 10, 3)
+        bulk = [[synthetic_contact(rng, size + j) for j in range(BULK_BATCH)] for _ in range(batches)]
+        results["bulk_insert"] = timed(lambda i: repo.add_many(bulk[i]), batches)
+        repo.execute("DELETE FROM contact_trigrams WHERE contact_id > ?", (max_id,))
+        repo.execute("DELETE FROM contact_names WHERE contact_id > ?", (max_id,))
+        repo.execute("DELETE FROM contacts WHERE id > ?", (max_id,))
+        repo.commit()
+        sync_snapshot(repo, snapshot)
+        repo.execute("DELETE FROM contact_changes WHERE seq > ?", (token,))
+        repo.commit()
+        snapshot.close()
+
+        if args.treeview:
+            results.update(treeview_timings(repo, rng, total, repeat))
+    finally:
+        repo.close()
+
+    return {
+        "size": size,
+        "database": path,
+        "seed_seconds": round(seed_seconds, 3) if seed_seconds is not None else None,
+        "store_megabytes": store_megabytes,
+        "operations": {name: summarize(samples, BULK_BATCH if name == "bulk_insert" else 1)
+                       for name, samples in results.items()},
+    }
+
+
+def cold_start(settings):
+    """First page of the list from the snapshot, connection included"""
+    snapshot = open_snapshot(settings)
+    try:
+        return ContactPageSource().load(snapshot, FIRST_PAGE)
+    finally:
+        snapshot.close()
+
+
+class InlineExecutor:
+    """Runs queries immediately on the calling thread, so only the Treeview work is timed apart from them"""
+
+    def __init__(self, repo):
+        self.repo = repo
+
+    def submit(self, func, *args, on_success=None, on_error=None, key=None, name=None):
+        result = func(self.repo, *args)
+        if on_success:
+            on_success(result)
+
+    def cancel(self, key):
+        pass
+
+
+def treeview_timings(repo, rng, total, repeat):
+    """Time VirtualContactList resets and scrolls in a real Treeview"""
+    import tkinter as tk
+    from tkinter import ttk
+
+    from phone_book import VirtualContactList
+
+    try:
+        root = tk.Tk()
+    except tk.TclError as e:
+        logging.warning(f"Treeview timings skipped: {e}")
+        return {}
+    try:
+        columns = ("First Name", "Last Name", "Phone", "Email", "Company")
+        tree = ttk.Treeview(root, columns=columns, show="headings", height=15)
+        for column in columns:
+            tree.heading(column, text=column)
+        scrollbar = ttk.Scrollbar(root, orient=tk.VERTICAL)
+        tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        root.update()
+        view = VirtualContactList(tree, scrollbar, {}, InlineExecutor(repo))
+
+        def reset(i):
+            view.reset(ContactPageSource())
+            root.update_idletasks()
+
+        offsets = [rng.randint(0, max(total - 15, 0)) for _ in range(repeat)]
+
+        def scroll(i):
+            view.scroll_to(offsets[i])
+            root.update_idletasks()
+
+        def step(i):
+            view.scroll(3)
+            root.update_idletasks()
+
+        return {
+            "treeview_reset": timed(reset, repeat),
+            "treeview_scroll_jump": timed(scroll, repeat),
+            "treeview_scroll_step": timed(step, repeat),
+        }
+    finally:
+        root.destroy()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Phonebook benchmarks")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000],
+                        help="contacts per database (default: 10000 100000)")
+    parser.add_argument("--repeat", type=int, default=50, help="samples per operation (default: 50)")
+    parser.add_argument("--seed", type=int, default=1, help="random seed for data and queries")
+    parser.add_argument("--db-dir", default=os.path.join(tempfile.gettempdir(), "phonebook-bench"),
+                        help="where seeded databases are kept")
+    parser.add_argument("--fresh", action="store_true", help="rebuild the databases")
+    parser.add_argument("--treeview", action="store_true", help="also time the Treeview (needs a display, e.g. Xvfb)")
+    parser.add_argument("--output", help="write the JSON here instead of stdout")
+    parser.add_argument("-v", "--verbose", action="store_true", help="log progress to stderr")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING,
+                        format="%(asctime)s - %(levelname)s - %(message)s")
+    os.makedirs(args.db_dir, exist_ok=True)
+
+    report = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "sqlite": sqlite3.sqlite_version,
+        "seed": args.seed,
+        "repeat": args.repeat,
+        "results": [],
+    }
+    for size in args.sizes:
+        started = time.perf_counter()
+        report["results"].append(run_size(args, size))
+        logging.info(f"Benchmarked {size} contacts in {time.perf_counter() - started:.1f}s")
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,643 +1,2054 @@
-import tkinter as tk
-from tkinter import ttk, messagebox, scrolledtext
-import pyodbc
-import logging
-import json
-import os
-from datetime import datetime
-
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('phonebook.log'),
-        logging.StreamHandler()
-    ]
-)
-
-
-class PhoneBookApp:
-    def __init__(self, root):
-        self.root = root
-        self.root.title("Advanced Phonebook - Phone Database")
-        self.root.geometry("1200x700")
-        self.root.minsize(1000, 600)
-
-        # Default theme
-        self.current_theme = "dark"
-
-        # Database connection
-        self.setup_database()
-
-        # UI setup
-        self.setup_ui()
-
-        # Load contacts
-        self.load_contacts()
-
-        logging.info("Phonebook application started")
-
-    def setup_database(self):
-        """Connect to SQL Server database"""
-        try:
-            # Database connection settings
-            server = 'localhost'
-            database = 'phone'  
-            username = ''
-            password = ''
-
-            # Connection string
-            if username and password:
-                connection_string = f'DRIVER={{SQL Server}};SERVER={server};DATABASE={database};UID={username};PWD={password}'
-            else:
-                connection_string = f'DRIVER={{SQL Server}};SERVER={server};DATABASE={database};Trusted_Connection=yes;'
-
-            self.conn = pyodbc.connect(connection_string)
-            self.cursor = self.conn.cursor()
-
-            # Create table if not exists
-            self.create_table()
-
-            logging.info("Database connection established")
-        except Exception as e:
-            logging.error(f"Database connection error: {e}")
-            messagebox.showerror("Error", f"Database connection error: {e}")
-
-    def create_table(self):
-        """Create contacts table in database"""
-        try:
-            create_table_query = """
-            IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='contacts' AND xtype='U')
-            CREATE TABLE contacts (
-                id INT IDENTITY(1,1) PRIMARY KEY,
-                first_name NVARCHAR(50) NOT NULL,
-                last_name NVARCHAR(50) NOT NULL,
-                phone NVARCHAR(20) NOT NULL,
-                email NVARCHAR(100),
-                address NVARCHAR(255),
-                company NVARCHAR(100),
-                notes NTEXT,
-                created_date DATETIME DEFAULT GETDATE(),
-                modified_date DATETIME DEFAULT GETDATE()
-            )
-            """
-            self.cursor.execute(create_table_query)
-            self.conn.commit()
-            logging.info("Contacts table created/verified")
-        except Exception as e:
-            logging.error(f"Table creation error: {e}")
-
-    def setup_ui(self):
-        """Create user interface"""
-        # Create menu bar
-        self.create_menu()
-
-        # Main frame
-        self.main_frame = ttk.Frame(self.root, padding="10")
-        self.main_frame.pack(fill=tk.BOTH, expand=True)
-
-        # Create toolbar
-        self.create_toolbar()
-
-        # Search panel
-        self.create_search_panel()
-
-        # Contacts display panel
-        self.create_contacts_panel()
-
-        # Details panel
-        self.create_details_panel()
-
-        # Apply theme
-        self.apply_theme()
-
-    def create_menu(self):
-        """Create application menu"""
-        menubar = tk.Menu(self.root)
-        self.root.config(menu=menubar)
-
-        # File menu
-        file_menu = tk.Menu(menubar, tearoff=0)
-        menubar.add_cascade(label="File", menu=file_menu)
-        file_menu.add_command(label="Exit", command=self.root.quit)
-
-        # View menu
-        view_menu = tk.Menu(menubar, tearoff=0)
-        menubar.add_cascade(label="View", menu=view_menu)
-        view_menu.add_command(label="Show All Contacts", command=self.load_contacts)
-        view_menu.add_separator()
-        view_menu.add_command(label="Dark Theme", command=lambda: self.change_theme("dark"))
-        view_menu.add_command(label="Light Theme", command=lambda: self.change_theme("light"))
-
-        # About menu
-        about_menu = tk.Menu(menubar, tearoff=0)
-        menubar.add_cascade(label="About", menu=about_menu)
-        about_menu.add_command(label="About", command=self.show_about)
-
-    def create_toolbar(self):
-        """Create toolbar"""
-        toolbar = ttk.Frame(self.main_frame)
-        toolbar.pack(fill=tk.X, pady=(0, 10))
-
-        # Toolbar buttons
-        ttk.Button(toolbar, text="Add New", command=self.add_contact).pack(side=tk.RIGHT, padx=5)
-        ttk.Button(toolbar, text="Edit", command=self.edit_contact).pack(side=tk.RIGHT, padx=5)
-        ttk.Button(toolbar, text="Delete", command=self.delete_contact).pack(side=tk.RIGHT, padx=5)
-        ttk.Button(toolbar, text="Show Details", command=self.show_details).pack(side=tk.RIGHT, padx=5)
-
-        # Contacts count label
-        self.contacts_count_label = ttk.Label(toolbar, text="Contacts: 0")
-        self.contacts_count_label.pack(side=tk.LEFT)
-
-    def create_search_panel(self):
-        """Create search panel"""
-        search_frame = ttk.LabelFrame(self.main_frame, text="Search", padding="10")
-        search_frame.pack(fill=tk.X, pady=(0, 10))
-
-        # Search fields
-        ttk.Label(search_frame, text="First Name:").grid(row=0, column=0, sticky=tk.W, padx=(0, 5))
-        self.search_first_name = ttk.Entry(search_frame, width=20)
-        self.search_first_name.grid(row=0, column=1, padx=(0, 10))
-
-        ttk.Label(search_frame, text="Last Name:").grid(row=0, column=2, sticky=tk.W, padx=(0, 5))
-        self.search_last_name = ttk.Entry(search_frame, width=20)
-        self.search_last_name.grid(row=0, column=3, padx=(0, 10))
-
-        ttk.Label(search_frame, text="Phone:").grid(row=0, column=4, sticky=tk.W, padx=(0, 5))
-        self.search_phone = ttk.Entry(search_frame, width=20)
-        self.search_phone.grid(row=0, column=5, padx=(0, 10))
-
-        # Search buttons
-        ttk.Button(search_frame, text="Search", command=self.search_contacts).grid(row=0, column=6, padx=(10, 0))
-        ttk.Button(search_frame, text="Clear", command=self.clear_search).grid(row=0, column=7, padx=(5, 0))
-
-    def create_contacts_panel(self):
-        """Create contacts display panel"""
-        contacts_frame = ttk.LabelFrame(self.main_frame, text="Contacts", padding="10")
-        contacts_frame.pack(fill=tk.BOTH, expand=True, pady=(0, 10))
-
-        # Treeview for contacts - FIXED: Remove ID column from display
-        columns = ("First Name", "Last Name", "Phone", "Email", "Company")
-        self.contacts_tree = ttk.Treeview(contacts_frame, columns=columns, show="headings", height=15)
-
-        # Configure columns - FIXED: No ID column in display
-        self.contacts_tree.heading("First Name", text="First Name")
-        self.contacts_tree.heading("Last Name", text="Last Name")
-        self.contacts_tree.heading("Phone", text="Phone")
-        self.contacts_tree.heading("Email", text="Email")
-        self.contacts_tree.heading("Company", text="Company")
-
-        # Column widths
-        self.contacts_tree.column("First Name", width=120)
-        self.contacts_tree.column("Last Name", width=120)
-        self.contacts_tree.column("Phone", width=120)
-        self.contacts_tree.column("Email", width=150)
-        self.contacts_tree.column("Company", width=120)
-
-        # Scrollbar
-        scrollbar = ttk.Scrollbar(contacts_frame, orient=tk.VERTICAL, command=self.contacts_tree.yview)
-        self.contacts_tree.configure(yscrollcommand=scrollbar.set)
-
-        # Pack widgets
-        self.contacts_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
-
-        # Selection event
-        self.contacts_tree.bind("<<TreeviewSelect>>", self.on_contact_select)
-
-        # Store contact IDs separately
-        self.contact_ids = {}
-
-    def create_details_panel(self):
-        """Create contact details panel - IMPROVED"""
-        details_frame = ttk.LabelFrame(self.main_frame, text="Contact Details - Complete Information", padding="10")
-        details_frame.pack(fill=tk.BOTH, expand=False)
-
-        # Create a better details display
-        details_container = ttk.Frame(details_frame)
-        details_container.pack(fill=tk.BOTH, expand=True)
-
-        # Use Text widget with better formatting
-        self.details_text = scrolledtext.ScrolledText(
-            details_container,
-            height=10,
-            state=tk.DISABLED,
-            font=('Arial', 10),
-            wrap=tk.WORD
-        )
-        self.details_text.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
-
-        # Add some initial help text
-        self.details_text.config(state=tk.NORMAL)
-        self.details_text.insert(1.0, "Select a contact from the list above to view complete details...")
-        self.details_text.config(state=tk.DISABLED)
-
-    def apply_theme(self):
-        """Apply theme to UI"""
-        if self.current_theme == "dark":
-            # Dark theme colors
-            bg_color = "#2e2e2e"
-            fg_color = "#ffffff"
-            entry_bg = "#404040"
-            entry_fg = "#ffffff"
-            tree_bg = "#404040"
-            tree_fg = "#ffffff"
-            tree_selected = "#0078d7"
-        else:
-            # Light theme colors
-            bg_color = "#f0f0f0"
-            fg_color = "#000000"
-            entry_bg = "#ffffff"
-            entry_fg = "#000000"
-            tree_bg = "#ffffff"
-            tree_fg = "#000000"
-            tree_selected = "#0078d7"
-
-        # Apply colors to widgets
-        self.root.configure(bg=bg_color)
-        self.main_frame.configure(style="TFrame")
-
-        # Create style for widgets
-        style = ttk.Style()
-        style.theme_use('clam')
-
-        # Configure style for dark/light theme
-        style.configure("TFrame", background=bg_color)
-        style.configure("TLabel", background=bg_color, foreground=fg_color)
-        style.configure("TButton", background=bg_color, foreground=fg_color)
-        style.configure("TEntry", fieldbackground=entry_bg, foreground=entry_fg)
-        style.configure("TScrollbar", background=bg_color, troughcolor=bg_color)
-        style.configure("TLabelframe", background=bg_color, foreground=fg_color)
-        style.configure("TLabelframe.Label", background=bg_color, foreground=fg_color)
-
-        # Configure Treeview
-        style.configure("Treeview",
-                        background=tree_bg,
-                        foreground=tree_fg,
-                        fieldbackground=tree_bg)
-        style.map("Treeview", background=[('selected', tree_selected)])
-
-        # Configure ScrolledText
-        self.details_text.configure(bg=tree_bg, fg=tree_fg, insertbackground=fg_color)
-
-    def change_theme(self, theme):
-        """Change application theme"""
-        self.current_theme = theme
-        self.apply_theme()
-        logging.info(f"Theme changed to {theme}")
-
-    def load_contacts(self):
-        """Load all contacts from database - FIXED"""
-        try:
-            # Clear Treeview and contact_ids
-            for item in self.contacts_tree.get_children():
-                self.contacts_tree.delete(item)
-            self.contact_ids.clear()
-
-            # Execute query
-            query = "SELECT id, first_name, last_name, phone, email, company FROM contacts ORDER BY last_name, first_name"
-            self.cursor.execute(query)
-            contacts = self.cursor.fetchall()
-
-            # Add contacts to Treeview and store IDs
-            for contact in contacts:
-                contact_id = contact[0]
-                display_values = contact[1:]  # Skip ID for display
-                item_id = self.contacts_tree.insert("", tk.END, values=display_values)
-
-                # Store contact ID with tree item ID
-                self.contact_ids[item_id] = contact_id
-
-            # Update count label
-            self.contacts_count_label.config(text=f"Contacts: {len(contacts)}")
-
-            # Clear details
-            self.details_text.config(state=tk.NORMAL)
-            self.details_text.delete(1.0, tk.END)
-            self.details_text.insert(1.0, "Select a contact from the list above to view complete details...")
-            self.details_text.config(state=tk.DISABLED)
-
-            logging.info(f"Loaded {len(contacts)} contacts")
-        except Exception as e:
-            logging.error(f"Error loading contacts: {e}")
-            messagebox.showerror("Error", f"Error loading contacts: {e}")
-
-    def search_contacts(self):
-        """Search contacts based on criteria - FIXED"""
-        try:
-            # Get search criteria
-            first_name = self.search_first_name.get().strip()
-            last_name = self.search_last_name.get().strip()
-            phone = self.search_phone.get().strip()
-
-            # Build search query
-            query = "SELECT id, first_name, last_name, phone, email, company FROM contacts WHERE 1=1"
-            params = []
-
-            if first_name:
-                query += " AND first_name LIKE ?"
-                params.append(f"%{first_name}%")
-
-            if last_name:
-                query += " AND last_name LIKE ?"
-                params.append(f"%{last_name}%")
-
-            if phone:
-                query += " AND phone LIKE ?"
-                params.append(f"%{phone}%")
-
-            query += " ORDER BY last_name, first_name"
-
-            # Execute query
-            self.cursor.execute(query, params)
-            contacts = self.cursor.fetchall()
-
-            # Clear Treeview and contact_ids
-            for item in self.contacts_tree.get_children():
-                self.contacts_tree.delete(item)
-            self.contact_ids.clear()
-
-            # Add search results
-            for contact in contacts:
-                contact_id = contact[0]
-                display_values = contact[1:]  # Skip ID for display
-                item_id = self.contacts_tree.insert("", tk.END, values=display_values)
-                self.contact_ids[item_id] = contact_id
-
-            # Update count
-            self.contacts_count_label.config(text=f"Contacts: {len(contacts)}")
-
-            logging.info(f"Search found {len(contacts)} contacts")
-
-        except Exception as e:
-            logging.error(f"Search error: {e}")
-            messagebox.showerror("Error", f"Search error: {e}")
-
-    def clear_search(self):
-        """Clear search fields and show all contacts"""
-        self.search_first_name.delete(0, tk.END)
-        self.search_last_name.delete(0, tk.END)
-        self.search_phone.delete(0, tk.END)
-        self.load_contacts()
-        logging.info("Search cleared")
-
-    def on_contact_select(self, event):
-        """Handle contact selection - FIXED"""
-        selection = self.contacts_tree.selection()
-        if selection:
-            item_id = selection[0]
-            contact_id = self.contact_ids.get(item_id)
-            if contact_id:
-                self.display_contact_details(contact_id)
-
-    def display_contact_details(self, contact_id):
-        """Display detailed contact information - IMPROVED"""
-        try:
-            query = "SELECT * FROM contacts WHERE id = ?"
-            self.cursor.execute(query, (contact_id,))
-            contact = self.cursor.fetchone()
-
-            if contact:
-                # Format details better
-                details = f"""📋 CONTACT DETAILS
-─────────────────────────────
-👤 Name: {contact[1]} {contact[2]}
-📞 Phone: {contact[3]}
-📧 Email: {contact[4] if contact[4] else 'Not specified'}
-🏠 Address: {contact[5] if contact[5] else 'Not specified'}
-🏢 Company: {contact[6] if contact[6] else 'Not specified'}
-
-📝 Notes:
-{contact[7] if contact[7] else 'No notes available'}
-
-📅 Created: {contact[8]}
-🔄 Modified: {contact[9]}
-─────────────────────────────
-Contact ID: {contact[0]}"""
-
-                self.details_text.config(state=tk.NORMAL)
-                self.details_text.delete(1.0, tk.END)
-                self.details_text.insert(1.0, details)
-                self.details_text.config(state=tk.DISABLED)
-
-                logging.info(f"Displayed details for contact ID: {contact_id}")
-        except Exception as e:
-            logging.error(f"Error displaying contact details: {e}")
-            self.details_text.config(state=tk.NORMAL)
-            self.details_text.delete(1.0, tk.END)
-            self.details_text.insert(1.0, f"Error loading contact details: {e}")
-            self.details_text.config(state=tk.DISABLED)
-
-    def add_contact(self):
-        """Open add contact dialog"""
-        self.contact_dialog("Add New Contact")
-
-    def edit_contact(self):
-        """Open edit contact dialog - FIXED"""
-        selection = self.contacts_tree.selection()
-        if not selection:
-            messagebox.showwarning("Warning", "Please select a contact to edit")
-            return
-
-        item_id = selection[0]
-        contact_id = self.contact_ids.get(item_id)
-
-        if contact_id:
-            self.contact_dialog("Edit Contact", contact_id)
-        else:
-            messagebox.showerror("Error", "Could not find contact ID")
-
-    def contact_dialog(self, title, contact_id=None):
-        """Create contact add/edit dialog - IMPROVED"""
-        dialog = tk.Toplevel(self.root)
-        dialog.title(title)
-        dialog.geometry("500x500")
-        dialog.resizable(False, False)
-        dialog.transient(self.root)
-        dialog.grab_set()
-
-        # Form fields
-        fields_frame = ttk.Frame(dialog, padding="20")
-        fields_frame.pack(fill=tk.BOTH, expand=True)
-
-        ttk.Label(fields_frame, text="First Name:*").grid(row=0, column=0, sticky=tk.W, pady=5)
-        first_name_entry = ttk.Entry(fields_frame, width=30)
-        first_name_entry.grid(row=0, column=1, sticky=tk.W, pady=5, padx=(10, 0))
-
-        ttk.Label(fields_frame, text="Last Name:*").grid(row=1, column=0, sticky=tk.W, pady=5)
-        last_name_entry = ttk.Entry(fields_frame, width=30)
-        last_name_entry.grid(row=1, column=1, sticky=tk.W, pady=5, padx=(10, 0))
-
-        ttk.Label(fields_frame, text="Phone:*").grid(row=2, column=0, sticky=tk.W, pady=5)
-        phone_entry = ttk.Entry(fields_frame, width=30)
-        phone_entry.grid(row=2, column=1, sticky=tk.W, pady=5, padx=(10, 0))
-
-        ttk.Label(fields_frame, text="Email:").grid(row=3, column=0, sticky=tk.W, pady=5)
-        email_entry = ttk.Entry(fields_frame, width=30)
-        email_entry.grid(row=3, column=1, sticky=tk.W, pady=5, padx=(10, 0))
-
-        ttk.Label(fields_frame, text="Address:").grid(row=4, column=0, sticky=tk.W, pady=5)
-        address_entry = ttk.Entry(fields_frame, width=30)
-        address_entry.grid(row=4, column=1, sticky=tk.W, pady=5, padx=(10, 0))
-
-        ttk.Label(fields_frame, text="Company:").grid(row=5, column=0, sticky=tk.W, pady=5)
-        company_entry = ttk.Entry(fields_frame, width=30)
-        company_entry.grid(row=5, column=1, sticky=tk.W, pady=5, padx=(10, 0))
-
-        ttk.Label(fields_frame, text="Notes:").grid(row=6, column=0, sticky=tk.NW, pady=5)
-        notes_text = scrolledtext.ScrolledText(fields_frame, width=30, height=5)
-        notes_text.grid(row=6, column=1, sticky=tk.W, pady=5, padx=(10, 0))
-
-        # Load data if editing
-        if contact_id:
-            try:
-                query = "SELECT * FROM contacts WHERE id = ?"
-                self.cursor.execute(query, (contact_id,))
-                contact = self.cursor.fetchone()
-
-                if contact:
-                    first_name_entry.insert(0, contact[1])
-                    last_name_entry.insert(0, contact[2])
-                    phone_entry.insert(0, contact[3])
-                    email_entry.insert(0, contact[4] if contact[4] else "")
-                    address_entry.insert(0, contact[5] if contact[5] else "")
-                    company_entry.insert(0, contact[6] if contact[6] else "")
-                    notes_text.insert(1.0, contact[7] if contact[7] else "")
-            except Exception as e:
-                logging.error(f"Error loading contact for edit: {e}")
-                messagebox.showerror("Error", f"Error loading contact: {e}")
-
-        # Buttons
-        button_frame = ttk.Frame(dialog, padding="10")
-        button_frame.pack(fill=tk.X)
-
-        def save_contact():
-            try:
-                # Get form data
-                first_name = first_name_entry.get().strip()
-                last_name = last_name_entry.get().strip()
-                phone = phone_entry.get().strip()
-                email = email_entry.get().strip()
-                address = address_entry.get().strip()
-                company = company_entry.get().strip()
-                notes = notes_text.get(1.0, tk.END).strip()
-
-                # Validation
-                if not first_name or not last_name or not phone:
-                    messagebox.showerror("Error", "First Name, Last Name, and Phone are required")
-                    return
-
-                if contact_id:
-                    # Update existing contact
-                    query = """UPDATE contacts 
-                              SET first_name=?, last_name=?, phone=?, email=?, address=?, company=?, notes=?, modified_date=GETDATE()
-                              WHERE id=?"""
-                    params = (first_name, last_name, phone, email, address, company, notes, contact_id)
-                    action = "updated"
-                else:
-                    # Insert new contact
-                    query = """INSERT INTO contacts (first_name, last_name, phone, email, address, company, notes)
-                              VALUES (?, ?, ?, ?, ?, ?, ?)"""
-                    params = (first_name, last_name, phone, email, address, company, notes)
-                    action = "added"
-
-                self.cursor.execute(query, params)
-                self.conn.commit()
-
-                self.load_contacts()
-                dialog.destroy()
-
-                logging.info(f"Contact {action} successfully")
-                messagebox.showinfo("Success", f"Contact {action} successfully")
-
-            except Exception as e:
-                logging.error(f"Error saving contact: {e}")
-                messagebox.showerror("Error", f"Error saving contact: {e}")
-
-        ttk.Button(button_frame, text="Save", command=save_contact).pack(side=tk.RIGHT, padx=5)
-        ttk.Button(button_frame, text="Cancel", command=dialog.destroy).pack(side=tk.RIGHT, padx=5)
-
-    def delete_contact(self):
-        """Delete selected contact - FIXED"""
-        selection = self.contacts_tree.selection()
-        if not selection:
-            messagebox.showwarning("Warning", "Please select a contact to delete")
-            return
-
-        item_id = selection[0]
-        contact_id = self.contact_ids.get(item_id)
-
-        if not contact_id:
-            messagebox.showerror("Error", "Could not find contact ID")
-            return
-
-        # Get contact name for confirmation
-        item_values = self.contacts_tree.item(item_id, 'values')
-        contact_name = f"{item_values[0]} {item_values[1]}"
-
-        # Confirmation
-        if messagebox.askyesno("Confirm Delete", f"Are you sure you want to delete {contact_name}?"):
-            try:
-                query = "DELETE FROM contacts WHERE id = ?"
-                self.cursor.execute(query, (contact_id,))
-                self.conn.commit()
-
-                self.load_contacts()
-
-                logging.info(f"Contact {contact_name} (ID: {contact_id}) deleted")
-                messagebox.showinfo("Success", "Contact deleted successfully")
-
-            except Exception as e:
-                logging.error(f"Error deleting contact: {e}")
-                messagebox.showerror("Error", f"Error deleting contact: {e}")
-
-    def show_details(self):
-        """Show details of selected contact - FIXED"""
-        selection = self.contacts_tree.selection()
-        if not selection:
-            messagebox.showwarning("Warning", "Please select a contact to view details")
-            return
-
-        item_id = selection[0]
-        contact_id = self.contact_ids.get(item_id)
-
-        if contact_id:
-            self.display_contact_details(contact_id)
-        else:
-            messagebox.showerror("Error", "Could not find contact details")
-
-    def show_about(self):
-        """Show about information"""
-        about_text = """Advanced Phonebook Application
-
-Version: 2.0 - Fixed Edition
-Database: phone
-Developed with Python and Tkinter
-
-Fixed Issues:
-- Delete contact error resolved
-- Edit contact loading fixed  
-- Show details working properly
-- Better contact details display
-- Improved error handling
-
-© 2024 Phonebook App"""
-
-        messagebox.showinfo("About", about_text)
-        logging.info("About dialog displayed")
-
-
-def main():
-    """Main function to start the application"""
-    try:
-        root = tk.Tk()
-        app = PhoneBookApp(root)
-        root.mainloop()
-    except Exception as e:
-        logging.error(f"Application error: {e}")
-        messagebox.showerror("Fatal Error", f"Application failed to start: {e}")
-
-
-if __name__ == "__main__":
+import tkinter as tk
+from tkinter import ttk, messagebox, scrolledtext, filedialog
+import logging
+from phonebook import (BULK_FIELDS, FIELD_LENGTHS, NOTES_PREVIEW_LENGTH, ConnectionPool, ContactCache,
+                       ContactPageSource, ContactStore, ExportReport, FuzzySearchSource, ImportReport,
+                       MemoryPageSource, Metrics, PoolTimeout, QueryExecutor, SearchCache, SearchPageSource,
+                       StorePageSource, TextSearchSource, audit, create_metrics, export_contacts, import_contacts,
+                       insert_position, list_row, load_settings, merged_contact, normalize_criteria, notes_truncated,
+                       open_repository, open_snapshot, setup_logging, sort_rows, sync_snapshot)
+import json
+import os
+import time
+from datetime import datetime
+
+# Modifier bits of event.state
+SHIFT_MASK = 0x0001
+CONTROL_MASK = 0x0004
+
+class VirtualContactList:
+    """Virtual-scrolling view over the contacts Treeview
+
+    Only the rows that fit on screen are materialized as Treeview items. A
+    prefetch margin above and below the window is kept in memory and the
+    external scrollbar is driven by the total row count, so memory use and
+    redraw time do not depend on the size of the table. Pages are loaded in
+    the background through the query executor.
+    """
+
+    QUERY_KEY = "contacts"
+
+    def __init__(self, tree, scrollbar, contact_ids, executor, on_error=None, on_page=None, prefetch=100,
+                 metrics=None):
+        self.tree = tree
+        self.scrollbar = scrollbar
+        self.contact_ids = contact_ids
+        self.executor = executor
+        self.on_error = on_error
+        self.on_page = on_page
+        self.prefetch = prefetch
+        self.metrics = metrics
+
+        self.source = None
+        self.loading = None
+        self.total = 0
+        self.offset = 0
+        self.visible_count = int(tree.cget("height"))
+        self.buffer = []
+        self.buffer_start = 0
+        self.pending_index = None
+        # Ids of the selected contacts, kept while their rows are scrolled out of view
+        self.selected_ids = set()
+
+        self.scrollbar.configure(command=self.yview)
+        self.tree.bind("<Configure>", self.on_resize)
+        self.tree.bind("<MouseWheel>", self.on_mouse_wheel)
+        self.tree.bind("<Button-4>", lambda event: self.scroll(-3))
+        self.tree.bind("<Button-5>", lambda event: self.scroll(3))
+        self.tree.bind("<Up>", lambda event: self.move_selection(-1))
+        self.tree.bind("<Down>", lambda event: self.move_selection(1))
+        self.tree.bind("<Prior>", lambda event: self.move_selection(-self.visible_count))
+        self.tree.bind("<Next>", lambda event: self.move_selection(self.visible_count))
+        self.tree.bind("<Home>", lambda event: self.move_selection(-self.total))
+        self.tree.bind("<End>", lambda event: self.move_selection(self.total))
+        self.tree.bind("<Control-a>", lambda event: self.select_all())
+        self.tree.bind("<ButtonPress-1>", self.on_click, add="+")
+        self.tree.bind("<<TreeviewSelect>>", self.on_select, add="+")
+
+    def reset(self, source, on_loaded=None, name="list"):
+        """Show a new result set, starting from the top
+
+        The current rows stay on screen until the first page has arrived.
+        on_loaded is called with the total row count. name labels the
+        query in the metrics.
+        """
+        self.source = source
+        self.loading = "reset"
+        self.pending_index = None
+        # A new result keeps at most the contact the details are shown for
+        selection = self.tree.selection()
+        self.selected_ids = {self.contact_ids[selection[0]]} if selection and selection[0] in self.contact_ids else set()
+
+        def loaded(result):
+            if source is not self.source:
+                return
+            self.loading = None
+            self.total, rows = result
+            self.buffer = list(rows)
+            self.buffer_start = 0
+            self.scroll_to(0)
+            if on_loaded:
+                on_loaded(self.total)
+            if self.on_page:
+                self.on_page(self.visible_rows())
+
+        limit = self.visible_count + self.prefetch
+        self.executor.submit(source.load, limit, on_success=loaded,
+                             on_error=self.query_failed, key=self.QUERY_KEY, name=name)
+
+    def query_failed(self, error):
+        """A page request failed"""
+        self.loading = None
+        if self.on_error:
+            self.on_error(error)
+
+    def scroll(self, rows):
+        """Scroll by a number of rows"""
+        self.scroll_to(self.offset + rows)
+        return "break"
+
+    def scroll_to(self, offset):
+        """Move the visible window so that it starts at offset"""
+        max_offset = max(self.total - self.visible_count, 0)
+        self.offset = min(max(int(offset), 0), max_offset)
+        self.fill_buffer()
+        self.render()
+        self.update_scrollbar()
+
+    def yview(self, *args):
+        """Scrollbar command handler"""
+        if not args:
+            return
+        if args[0] == "moveto":
+            self.scroll_to(float(args[1]) * self.total)
+        elif args[0] == "scroll":
+            amount = int(args[1])
+            if args[2] == "pages":
+                amount *= self.visible_count
+            self.scroll(amount)
+
+    def on_mouse_wheel(self, event):
+        """Scroll on Windows/macOS mouse wheel events"""
+        steps = -int(event.delta / 120) if abs(event.delta) >= 120 else -event.delta
+        return self.scroll(steps * 3)
+
+    def on_resize(self, event):
+        """Recompute how many rows fit after the Treeview was resized"""
+        children = self.tree.get_children()
+        bbox = self.tree.bbox(children[0]) if children else None
+        if bbox:
+            heading_height, row_height = bbox[1], bbox[3]
+        else:
+            row_height = int(ttk.Style().lookup("Treeview", "rowheight") or 20)
+            heading_height = row_height + 4
+        visible_count = max((event.height - heading_height) // max(row_height, 1), 1)
+        if visible_count != self.visible_count:
+            self.visible_count = visible_count
+            self.scroll_to(self.offset)
+
+    def fill_buffer(self):
+        """Request the rows needed for the visible window plus the prefetch margin"""
+        if self.source is None or self.loading == "reset":
+            return
+        want_start = max(self.offset - self.prefetch, 0)
+        want_end = min(self.offset + self.visible_count + self.prefetch, self.total)
+        buffer_end = self.buffer_start + len(self.buffer)
+
+        if (not self.buffer or self.offset + self.visible_count <= self.buffer_start
+                or self.offset >= buffer_end) and want_end > want_start:
+            # Far jump: locate the window once, then continue with keysets.
+            # This supersedes any page that is still on its way.
+            if self.loading != ("at", want_start):
+                self.request("at", want_start, want_end - want_start)
+        elif self.loading is None:
+            # Only fetch when the margin dropped below half, then a full page
+            low_water = max(self.offset - self.prefetch // 2, 0)
+            high_water = min(self.offset + self.visible_count + self.prefetch // 2, self.total)
+            if buffer_end < high_water:
+                self.request("after", self.source.key(self.buffer[-1]), want_end - buffer_end + self.prefetch)
+            elif self.buffer_start > low_water:
+                self.request("before", self.source.key(self.buffer[0]),
+                             self.buffer_start - want_start + self.prefetch)
+
+    def request(self, kind, anchor, limit):
+        """Fetch a page in the background"""
+        source = self.source
+        self.loading = (kind, anchor)
+
+        def loaded(rows):
+            if source is self.source and self.loading == (kind, anchor):
+                self.loading = None
+                self.apply_page(kind, anchor, limit, rows)
+
+        self.executor.submit(getattr(source, f"fetch_{kind}"), anchor, limit, on_success=loaded,
+                             on_error=self.query_failed, key=self.QUERY_KEY, name=f"page_{kind}")
+
+    def apply_page(self, kind, anchor, limit, rows):
+        """Merge a fetched page into the buffer and redraw"""
+        if kind == "at":
+            self.buffer = list(rows)
+            self.buffer_start = anchor
+            if len(rows) < limit:
+                # Rows were deleted since the count was taken
+                self.total = anchor + len(rows)
+        elif kind == "after" and self.buffer and self.source.key(self.buffer[-1]) == anchor:
+            self.buffer.extend(rows)
+            if len(rows) < limit:
+                self.total = self.buffer_start + len(self.buffer)
+        elif kind == "before" and self.buffer and self.source.key(self.buffer[0]) == anchor:
+            self.buffer[:0] = rows
+            self.buffer_start -= len(rows)
+            if len(rows) < limit and self.buffer_start > 0:
+                # Reached the first row earlier than expected, shift positions
+                shift = self.buffer_start
+                self.buffer_start = 0
+                self.offset -= shift
+                self.total -= shift
+        self.trim_buffer()
+        self.scroll_to(self.offset)
+        if self.on_page:
+            self.on_page(self.visible_rows())
+
+    def trim_buffer(self):
+        """Drop rows that are far outside the visible window"""
+        keep_start = max(self.offset - 2 * self.prefetch, self.buffer_start)
+        keep_end = self.offset + self.visible_count + 2 * self.prefetch
+        if keep_start > self.buffer_start:
+            del self.buffer[:keep_start - self.buffer_start]
+            self.buffer_start = keep_start
+        if self.buffer_start + len(self.buffer) > keep_end:
+            del self.buffer[max(keep_end - self.buffer_start, 0):]
+
+    def visible_rows(self):
+        """Rows of the buffer that fall inside the visible window"""
+        start = self.offset - self.buffer_start
+        if start < 0:
+            return []
+        return self.buffer[start:start + self.visible_count]
+
+    def apply_change(self, contact_id, old_row=None, new_row=None, select=False):
+        """Patch the list after a contact was added, changed or deleted
+
+        old_row and new_row are the list rows before and after the change,
+        None when the contact did not exist before or was deleted. A row that
+        is buffered is found by its id. Rows outside the buffer only shift the
+        positions and the total. Returns False if the list has to be reloaded
+        instead.
+        """
+        source = self.source
+        if source is None or self.loading == "reset":
+            return False
+        if self.loading is not None:
+            # A page in flight may predate the change, fetch it again
+            self.executor.cancel(self.QUERY_KEY)
+            self.loading = None
+        index = next((position for position, row in enumerate(self.buffer) if row[0] == contact_id), None)
+        if index is not None:
+            old_row = self.buffer[index]
+        if new_row is not None and source.ordered and not source.matches(new_row):
+            new_row = None
+        source_index = getattr(source, "positions", {}).get(contact_id)
+        if old_row is None and source_index is not None:
+            old_row = source.rows[source_index]
+        source.apply_change(contact_id, new_row)
+        if new_row is None:
+            self.selected_ids.discard(contact_id)
+
+        # Remove the old row
+        if index is not None:
+            del self.buffer[index]
+            self.total -= 1
+            if self.buffer_start + index < self.offset:
+                self.offset -= 1
+        elif not source.ordered:
+            # Ranked rows outside the buffer are replaced in place, or removed
+            if source_index is not None and new_row is None:
+                self.total -= 1
+                if source_index < self.buffer_start:
+                    self.buffer_start -= 1
+                    self.offset = max(self.offset - 1, 0)
+        elif old_row is not None and source.matches(old_row):
+            self.total -= 1
+            if self.buffer_start > 0 and self.buffer and source.sort_key(old_row) < source.sort_key(self.buffer[0]):
+                self.buffer_start -= 1
+                self.offset = max(self.offset - 1, 0)
+
+        # Insert the new row - ranked results keep it in its old place
+        position = None
+        if new_row is not None and source.ordered:
+            position = self.insert_row(new_row)
+        elif new_row is not None and index is not None:
+            self.buffer.insert(index, new_row)
+            self.total += 1
+            position = self.buffer_start + index
+            if position < self.offset:
+                self.offset += 1
+
+        if select and position is not None:
+            self.pending_index = position
+            if not self.offset <= position < self.offset + self.visible_count:
+                self.offset = max(position - self.visible_count // 2, 0)
+        self.scroll_to(self.offset)
+        return True
+
+    def insert_row(self, row):
+        """Insert a row at its sorted position, returning its absolute position if it is buffered"""
+        key = self.source.sort_key(row)
+        self.total += 1
+        if not self.buffer:
+            if self.total == 1:
+                self.buffer, self.buffer_start = [row], 0
+                return 0
+            return None
+        if self.buffer_start > 0 and key < self.source.sort_key(self.buffer[0]):
+            # Before the buffer, everything buffered moves down one place
+            self.buffer_start += 1
+            self.offset += 1
+            return None
+        if self.buffer_start + len(self.buffer) < self.total - 1 and key > self.source.sort_key(self.buffer[-1]):
+            # After the buffer, it is fetched when the user scrolls there
+            return None
+        index = insert_position(self.buffer, row, self.source.sort)
+        self.buffer.insert(index, row)
+        if self.buffer_start + index < self.offset:
+            self.offset += 1
+        return self.buffer_start + index
+
+    def neighbour_ids(self, index, radius):
+        """Ids of the buffered rows within radius of an absolute position"""
+        start = max(index - radius - self.buffer_start, 0)
+        end = max(index + radius + 1 - self.buffer_start, 0)
+        return [row[0] for row in self.buffer[start:end]]
+
+    def render(self):
+        """Update the Treeview items to show the visible window"""
+        started = time.perf_counter()
+        selection = self.tree.selection()
+
+        rows = self.visible_rows()
+        children = list(self.tree.get_children())
+        self.contact_ids.clear()
+        for position, row in enumerate(rows):
+            if position < len(children):
+                item_id = children[position]
+                self.tree.item(item_id, values=tuple(row[1:]))
+            else:
+                item_id = self.tree.insert("", tk.END, values=tuple(row[1:]))
+                children.append(item_id)
+            self.contact_ids[item_id] = row[0]
+        if len(children) > len(rows):
+            self.tree.delete(*children[len(rows):])
+            del children[len(rows):]
+
+        # Keep the selection on the same contacts, not on the same items
+        if self.pending_index is not None and 0 <= self.pending_index - self.offset < len(children):
+            self.selected_ids = {self.contact_ids[children[self.pending_index - self.offset]]}
+            self.pending_index = None
+        new_selection = [item for item in children if self.contact_ids[item] in self.selected_ids]
+
+        if tuple(new_selection) != tuple(selection):
+            if new_selection:
+                self.tree.selection_set(new_selection)
+            elif selection:
+                self.tree.selection_remove(*selection)
+        if new_selection:
+            self.tree.focus(new_selection[0])
+        if self.metrics:
+            self.metrics.observe("render_seconds", time.perf_counter() - started, "list")
+
+    def update_scrollbar(self):
+        """Size the scrollbar slider from the total row count"""
+        if self.total <= 0:
+            self.scrollbar.set(0.0, 1.0)
+        else:
+            first = self.offset / self.total
+            last = min((self.offset + self.visible_count) / self.total, 1.0)
+            self.scrollbar.set(first, last)
+
+    def on_click(self, event):
+        """A click without Shift or Control starts a new selection"""
+        item = self.tree.identify_row(event.y)
+        if item in self.contact_ids and not event.state & (SHIFT_MASK | CONTROL_MASK):
+            self.selected_ids = {self.contact_ids[item]}
+
+    def on_select(self, event=None):
+        """Take over the selection of the visible rows, the rows out of view stay selected"""
+        visible = set(self.contact_ids.values())
+        selected = {self.contact_ids[item] for item in self.tree.selection() if item in self.contact_ids}
+        self.selected_ids = (self.selected_ids - visible) | selected
+
+    def select_all(self):
+        """Select every row of the result, reading only the ids of the rows that are not in memory"""
+        source = self.source
+        if source is None or self.loading == "reset":
+            return "break"
+
+        def loaded(ids):
+            if source is self.source:
+                self.selected_ids = set(ids)
+                self.render()
+
+        self.executor.submit(source.all_ids, on_success=loaded, on_error=self.on_error, name="select_all")
+        return "break"
+
+    def selection(self):
+        """Ids of the selected contacts, in list order as far as their rows are in memory"""
+        ordered = [row[0] for row in self.buffer if row[0] in self.selected_ids]
+        return ordered + sorted(self.selected_ids.difference(ordered))
+
+    def selected_index(self):
+        """Absolute position of the selected row, or None"""
+        selection = self.tree.selection()
+        children = self.tree.get_children()
+        if not selection or selection[0] not in children:
+            return None
+        return self.offset + children.index(selection[0])
+
+    def move_selection(self, delta):
+        """Move the selection, scrolling the window when it leaves the screen"""
+        if self.total == 0:
+            return "break"
+        index = self.pending_index if self.pending_index is not None else self.selected_index()
+        index = self.offset if index is None else index + delta
+        index = min(max(index, 0), self.total - 1)
+        self.pending_index = index
+        if index < self.offset:
+            self.scroll_to(index)
+        elif index >= self.offset + self.visible_count:
+            self.scroll_to(index - self.visible_count + 1)
+        else:
+            self.render()
+        return "break"
+
+
+class ProgressDialog:
+    """Progress window for a long-running background job
+
+    The job runs on a query worker and only updates its report object. The
+    dialog reads the report with root.after, so no widget is touched from the
+    worker thread. describe(report) returns (fraction done, status text).
+    """
+
+    def __init__(self, root, title, report, describe, interval=200):
+        self.report = report
+        self.describe = describe
+        self.interval = interval
+
+        self.window = tk.Toplevel(root)
+        self.window.title(title)
+        self.window.resizable(False, False)
+        self.window.transient(root)
+        self.window.grab_set()
+        self.window.protocol("WM_DELETE_WINDOW", self.cancel)
+
+        frame = ttk.Frame(self.window, padding="20")
+        frame.pack(fill=tk.BOTH, expand=True)
+        self.label = ttk.Label(frame, text="Starting...", width=60)
+        self.label.pack(fill=tk.X, pady=(0, 10))
+        self.bar = ttk.Progressbar(frame, length=400, mode="determinate", maximum=100)
+        self.bar.pack(fill=tk.X, pady=(0, 10))
+        ttk.Button(frame, text="Cancel", command=self.cancel).pack(side=tk.RIGHT)
+
+        self.poll()
+
+    def poll(self):
+        """Refresh the progress bar from the report"""
+        if not self.window.winfo_exists():
+            return
+        fraction, text = self.describe(self.report)
+        self.bar["value"] = min(max(fraction, 0.0), 1.0) * 100
+        if not self.report.cancel_requested:
+            self.label.config(text=text)
+        self.window.after(self.interval, self.poll)
+
+    def cancel(self):
+        """Ask the job to stop after its current batch"""
+        self.report.cancel_requested = True
+        self.label.config(text="Cancelling...")
+
+    def close(self):
+        """Close the window once the job is done"""
+        if self.window.winfo_exists():
+            self.window.grab_release()
+            self.window.destroy()
+
+
+class PerformancePanel:
+    """Live view of the query, fetch and render timings and the cache statistics
+
+    Query time is spent on a worker with a database connection, fetch time
+    runs from submitting a query until its result reaches the UI, callback
+    and render time is spent on the UI thread. Refreshed every interval ms
+    while the window is open.
+    """
+
+    COLUMNS = ("Metric", "Operation", "Count", "Mean ms", "p50 ms", "p95 ms", "p99 ms", "Max ms")
+
+    def __init__(self, root, metrics, interval=1000):
+        self.metrics = metrics
+        self.interval = interval
+
+        self.window = tk.Toplevel(root)
+        self.window.title("Performance")
+        self.window.geometry("820x420")
+        self.window.transient(root)
+
+        frame = ttk.Frame(self.window, padding="10")
+        frame.pack(fill=tk.BOTH, expand=True)
+        self.tree = ttk.Treeview(frame, columns=self.COLUMNS, show="headings", height=14)
+        for column in self.COLUMNS:
+            self.tree.heading(column, text=column)
+            self.tree.column(column, width=150 if column in ("Metric", "Operation") else 70,
+                             anchor=tk.W if column in ("Metric", "Operation") else tk.E)
+        self.tree.pack(fill=tk.BOTH, expand=True)
+        self.caches_label = ttk.Label(frame, justify=tk.LEFT)
+        self.caches_label.pack(fill=tk.X, pady=(10, 0))
+
+        self.refresh()
+
+    def refresh(self):
+        """Show the current snapshot of the metrics"""
+        if not self.window.winfo_exists():
+            return
+        snapshot = self.metrics.snapshot()
+        self.tree.delete(*self.tree.get_children())
+        for (name, operation), summary in sorted(snapshot["histograms"].items()):
+            self.tree.insert("", tk.END, values=(name.replace("_seconds", ""), operation, summary["count"],
+                                                 summary["mean_ms"], summary["p50_ms"], summary["p95_ms"],
+                                                 summary["p99_ms"], summary["max_ms"]))
+
+        gauges = snapshot["gauges"]
+        lines = []
+        for name in ("search_cache", "contact_cache"):
+            stats = gauges.get(name)
+            if stats:
+                lines.append(f"{name.replace('_', ' ').capitalize()}: {stats['entries']} entries, "
+                             f"hit rate {stats['hit_rate']:.0%} ({stats['hits']} hits, {stats['misses']} misses)")
+        pool = gauges.get("pool")
+        if pool:
+            lines.append(f"Connection pool: {pool['in_use']} of {pool['max_size']} in use, "
+                         f"avg wait {pool['avg_wait_ms']} ms, utilisation {pool['utilisation']:.0%}, "
+                         f"{pool['timeouts']} timeouts")
+        self.caches_label.config(text="\n".join(lines))
+        self.window.after(self.interval, self.refresh)
+
+    def show(self):
+        """Bring an open panel to the front"""
+        self.window.deiconify()
+        self.window.lift()
+
+
+class DuplicatesDialog:
+    """Groups of probable duplicates, merged into the contact the user keeps
+
+    Finding the groups and merging run on query workers. The kept record
+    gets the empty fields of the others filled in, the others are deleted.
+    on_merged(record, old_records) is called with the kept record after a
+    group was merged.
+    """
+
+    COLUMNS = ("First Name", "Last Name", "Phone", "Email", "Company", "ID")
+
+    def __init__(self, root, executor, settings, on_merged, on_error):
+        self.executor = executor
+        self.on_merged = on_merged
+        self.on_error = on_error
+        self.groups = {}
+
+        self.window = tk.Toplevel(root)
+        self.window.title("Duplicate Contacts")
+        self.window.geometry("860x460")
+        self.window.transient(root)
+
+        frame = ttk.Frame(self.window, padding="10")
+        frame.pack(fill=tk.BOTH, expand=True)
+        self.status_label = ttk.Label(frame, text="Looking for duplicates...")
+        self.status_label.pack(fill=tk.X, pady=(0, 10))
+        self.tree = ttk.Treeview(frame, columns=self.COLUMNS, height=15)
+        self.tree.heading("#0", text="Group")
+        self.tree.column("#0", width=140)
+        for column in self.COLUMNS:
+            self.tree.heading(column, text=column)
+            self.tree.column(column, width=60 if column == "ID" else 130)
+        self.tree.pack(fill=tk.BOTH, expand=True)
+
+        button_frame = ttk.Frame(frame)
+        button_frame.pack(fill=tk.X, pady=(10, 0))
+        ttk.Button(button_frame, text="Close", command=self.window.destroy).pack(side=tk.RIGHT, padx=5)
+        ttk.Button(button_frame, text="Keep Selected", command=self.keep_selected).pack(side=tk.RIGHT, padx=5)
+
+        threshold = settings["dedupe_threshold"]
+        workers = settings["dedupe_workers"]
+        self.executor.submit(lambda repo: repo.find_duplicates(threshold, workers), on_success=self.show_groups,
+                             on_error=self.search_failed, name="find_duplicates")
+
+    def show_groups(self, groups):
+        """Fill the tree, one parent row per group"""
+        if not self.window.winfo_exists():
+            return
+        for number, group in enumerate(groups, 1):
+            parent = self.tree.insert("", tk.END, text=f"Group {number} - {group.score:.0%}", open=True)
+            self.groups[parent] = group
+            for record in group.records:
+                self.tree.insert(parent, tk.END, values=(record[1], record[2], record[3], record[4] or "",
+                                                         record[6] or "", record[0]))
+        self.status_label.config(text=f"{len(groups)} groups of probable duplicates - "
+                                      "select the contact to keep in a group" if groups else "No duplicates found")
+
+    def search_failed(self, e):
+        if self.window.winfo_exists():
+            self.status_label.config(text="Could not look for duplicates")
+        self.on_error("Error finding duplicates", e)
+
+    def keep_selected(self):
+        """Merge the group of the selected contact into it"""
+        selection = self.tree.selection()
+        parent = self.tree.parent(selection[0]) if selection else ""
+        if not parent:
+            messagebox.showwarning("Warning", "Please select the contact to keep", parent=self.window)
+            return
+
+        group = self.groups[parent]
+        keep_id = int(self.tree.set(selection[0], "ID"))
+        others = [contact_id for contact_id in group.ids if contact_id != keep_id]
+        contact = merged_contact(group.records, keep_id)
+        if not messagebox.askyesno("Merge Contacts",
+                                   f"Keep {contact['first_name']} {contact['last_name']} and merge "
+                                   f"{len(others)} other contacts into it? The others are deleted.",
+                                   parent=self.window):
+            return
+
+        def merge(repo):
+            if not repo.merge(keep_id, others, contact):
+                raise ValueError(f"Contact {keep_id} no longer exists")
+            return repo.get(keep_id)
+
+        def merged(record):
+            if self.window.winfo_exists() and self.tree.exists(parent):
+                self.tree.delete(parent)
+            self.groups.pop(parent, None)
+            self.on_merged(record, group.records)
+
+        self.executor.submit(merge, on_success=merged, on_error=lambda e: self.on_error("Error merging contacts", e),
+                             name="merge")
+
+    def show(self):
+        """Bring an open dialog to the front"""
+        self.window.deiconify()
+        self.window.lift()
+
+
+class PhoneBookApp:
+    # Treeview column -> sort field
+    SORT_FIELDS = {
+        "First Name": "first_name",
+        "Last Name": "last_name",
+        "Phone": "phone",
+        "Email": "email",
+        "Company": "company",
+    }
+
+    # Milliseconds between attempts to reach the database while offline
+    RECONNECT_INTERVAL_MS = 30000
+
+    def __init__(self, root):
+        self.root = root
+        self.root.title("Advanced Phonebook - Phone Database")
+        self.root.geometry("1200x700")
+        self.root.minsize(1000, 600)
+
+        # Default theme
+        self.current_theme = "dark"
+
+        # Contact shown in the details panel
+        self.displayed_contact_id = None
+
+        # Live search state
+        self.search_after_id = None
+        self.last_search = None
+
+        # Column the list is sorted by, "-" first for descending; None is the
+        # default name order (rank order for an "Any Field" search)
+        self.sort_order = None
+
+        # View > Performance window, while open
+        self.performance_panel = None
+
+        # File > Find Duplicates window, while open
+        self.duplicates_dialog = None
+
+        # "connecting", "online", or "offline" while the list comes from the snapshot
+        self.database_state = "connecting"
+        self.snapshot_synced_at = None
+
+        # Pending reconnect attempt while the database is unavailable
+        self.reconnect_after = None
+
+        # Change feed position of the list, bumped generation on every reload,
+        # and the rows of contacts changed since then as the list shows them
+        self.change_token = None
+        self.change_generation = 0
+        self.change_polling = False
+        self.known_rows = {}
+
+        # All contacts in memory for field searches once loaded, and the
+        # changes made while it loads
+        self.contact_store = None
+        self.store_pending = None
+
+        # Database connection
+        self.setup_database()
+
+        # UI setup
+        self.setup_ui()
+
+        # Show the local snapshot while the database connection is opened
+        if self.snapshot_executor:
+            self.snapshot_executor.submit(lambda repo: repo.state("synced_at"), name="snapshot_state",
+                                          on_success=self.snapshot_loaded,
+                                          on_error=lambda e: logging.warning(f"Snapshot unavailable: {e}"))
+
+        # Load contacts once the table has been verified
+        self.connect_database()
+
+        logging.info(f"Using {self.settings['backend']} storage backend")
+
+        logging.info("Phonebook application started")
+
+    def setup_database(self):
+        """Set up the storage backend - queries run on background workers
+
+        The pool connects in the background, so the workers exist even when
+        the database cannot be reached; connect_database retries until it can.
+        """
+        # Backend and connection settings from phonebook.json
+        self.settings = load_settings()
+
+        # Timings and cache statistics for View > Performance
+        try:
+            self.metrics = create_metrics(self.settings)
+        except Exception as e:
+            logging.error(f"Metrics export unavailable: {e}")
+            self.metrics = Metrics()
+
+        # Workers check repository connections out of a shared pool
+        self.pool = ConnectionPool(lambda: open_repository(self.settings),
+                                   min_size=self.settings["pool_min_size"],
+                                   max_size=self.settings["pool_max_size"],
+                                   timeout=self.settings["pool_timeout"],
+                                   ping_interval=self.settings["pool_ping_interval"],
+                                   max_backoff=self.settings["pool_max_backoff"])
+        self.executor = QueryExecutor(self.pool, workers=self.settings["query_workers"], metrics=self.metrics)
+        self.executor.start_polling(self.root)
+        self.pool.start()
+
+        # Local copy of the contacts for a fast start and for reading offline
+        self.snapshot_pool = None
+        self.snapshot_executor = None
+        if self.settings["snapshot_path"]:
+            self.snapshot_pool = ConnectionPool(lambda: open_snapshot(self.settings), min_size=1, max_size=1,
+                                                timeout=self.settings["pool_timeout"])
+            self.snapshot_pool.start()
+            self.snapshot_executor = QueryExecutor(self.snapshot_pool, workers=1, metrics=self.metrics)
+            self.snapshot_executor.start_polling(self.root)
+
+        # List and details reads, switched to the database once it answers
+        self.read_executor = self.snapshot_executor or self.executor
+
+        # Results of recent searches
+        self.search_cache = SearchCache(self.settings["search_cache_size"], self.settings["search_cache_rows"])
+
+        # Full records of recently listed contacts
+        self.contact_cache = ContactCache(self.settings["contact_cache_size"])
+
+        self.metrics.gauge("pool", self.pool.stats)
+        self.metrics.gauge("search_cache", self.search_cache.stats)
+        self.metrics.gauge("contact_cache", self.contact_cache.stats)
+
+        logging.info("Database query workers started")
+
+    @staticmethod
+    def create_table(repo):
+        """Create contacts table in database - runs on a query worker"""
+        repo.create_schema()
+
+    def connect_database(self):
+        """Verify the schema in the background, then read from the database"""
+        self.reconnect_after = None
+        self.executor.submit(self.create_table, on_success=lambda result: self.database_ready(),
+                             on_error=self.database_unavailable, name="create_schema")
+
+    def database_ready(self):
+        """Switch the list to the database and start keeping the snapshot in sync"""
+        was_online = self.database_state == "online"
+        self.database_state = "online"
+        self.read_executor = self.executor
+        if not was_online:
+            self.switch_reads()
+        self.refresh_snapshot()
+        if not self.change_polling:
+            self.poll_changes()
+
+    def database_unavailable(self, error):
+        """Keep showing the snapshot, or report the error once without one, and try again later"""
+        was_online = self.database_state == "online"
+        if not self.snapshot_executor:
+            if self.database_state != "offline":
+                self.show_error("Database connection error", error)
+            else:
+                logging.warning(f"Database still unavailable: {error}")
+            self.database_state = "offline"
+        else:
+            logging.warning(f"Database unavailable, showing the local snapshot: {error}")
+            self.database_state = "offline"
+            self.read_executor = self.snapshot_executor
+            if was_online:
+                self.switch_reads()
+            else:
+                self.show_count(self.contacts_view.total)
+        # Both the sync and the change poll can report the same outage
+        if self.reconnect_after is None:
+            self.reconnect_after = self.root.after(self.RECONNECT_INTERVAL_MS, self.connect_database)
+
+    def switch_reads(self):
+        """Reload the list and forget cached results after reads moved to another store"""
+        self.contacts_view.executor = self.read_executor
+        self.search_cache.clear()
+        self.contact_cache.clear()
+        self.load_store()
+        self.search_contacts()
+
+    def load_store(self):
+        """Load every contact into memory in the background, if there are at most local_store_max"""
+        self.contact_store = None
+        self.store_pending = None
+        limit = self.settings["local_store_max"]
+        if self.database_state != "online" or not limit:
+            return
+        pending = self.store_pending = {}
+
+        def load(repo):
+            total = repo.count()
+            return ContactStore.load(repo) if total <= limit else total
+
+        def loaded(store):
+            if pending is not self.store_pending:
+                return
+            self.store_pending = None
+            if not isinstance(store, ContactStore):
+                logging.info(f"Not loading {store} contacts into memory, local_store_max is {limit}")
+                return
+            store.apply(pending)
+            self.contact_store = store
+            logging.info(f"Loaded {len(store)} contacts into memory ({store.memory_size() / 1e6:.1f} MB)")
+
+        def failed(e):
+            if pending is self.store_pending:
+                self.store_pending = None
+            logging.warning(f"Loading contacts into memory failed: {e}")
+
+        self.executor.submit(load, on_success=loaded, on_error=failed, key="contact_store", name="load_store")
+
+    def store_rows(self, records):
+        """Keep the contacts in memory up to date with changes, {contact id: record or None}"""
+        rows = {contact_id: list_row(record) if record else None for contact_id, record in records.items()}
+        if self.store_pending is not None:
+            self.store_pending.update(rows)
+        if self.contact_store is not None:
+            self.contact_store.apply(rows)
+
+    def snapshot_loaded(self, synced_at):
+        """Show the snapshot until the database has answered"""
+        self.snapshot_synced_at = synced_at
+        if self.database_state != "online":
+            self.load_contacts()
+
+    def refresh_snapshot(self):
+        """Copy database changes into the snapshot in the background, again every snapshot_sync_interval"""
+        if not self.snapshot_executor or self.database_state != "online":
+            return
+
+        def sync(repo):
+            snapshot = open_snapshot(self.settings)
+            try:
+                sync_snapshot(repo, snapshot)
+                return snapshot.state("synced_at")
+            finally:
+                snapshot.close()
+
+        def synced(synced_at):
+            self.snapshot_synced_at = synced_at
+            self.root.after(self.settings["snapshot_sync_interval"] * 1000, self.refresh_snapshot)
+
+        def failed(e):
+            logging.warning(f"Snapshot sync failed: {e}")
+            if isinstance(e, PoolTimeout):
+                self.database_unavailable(e)
+            else:
+                self.root.after(self.settings["snapshot_sync_interval"] * 1000, self.refresh_snapshot)
+
+        self.executor.submit(sync, on_success=synced, on_error=failed, key="snapshot_sync", name="snapshot_sync")
+
+    def follow_changes(self):
+        """Take the change feed position of a list that is about to be reloaded"""
+        self.change_generation += 1
+        self.change_token = None
+        self.known_rows.clear()
+        if self.database_state != "online" or not self.settings["change_poll_interval"]:
+            return
+        generation = self.change_generation
+
+        def started(token):
+            if generation == self.change_generation:
+                self.change_token = token
+
+        self.executor.submit(lambda repo: repo.change_token(), on_success=started,
+                             on_error=lambda e: logging.warning(f"Reading the change token failed: {e}"),
+                             name="change_token")
+
+    def poll_changes(self):
+        """Apply the changes other clients made since the last poll, again every change_poll_interval"""
+        interval = self.settings["change_poll_interval"]
+        if self.database_state != "online" or not interval:
+            self.change_polling = False
+            return
+        self.change_polling = True
+        token, generation = self.change_token, self.change_generation
+
+        def next_poll():
+            self.root.after(int(interval * 1000), self.poll_changes)
+
+        if token is None:
+            next_poll()
+            return
+
+        def polled(result):
+            if generation == self.change_generation:
+                self.apply_changes(result)
+            next_poll()
+
+        def failed(e):
+            logging.warning(f"Polling for changes failed: {e}")
+            if isinstance(e, PoolTimeout):
+                self.change_polling = False
+                self.database_unavailable(e)
+            else:
+                next_poll()
+
+        self.executor.submit(lambda repo: repo.changes_since(token), on_success=polled, on_error=failed,
+                             name="poll_changes")
+
+    def apply_changes(self, result):
+        """Patch the list and the caches with changes from the feed"""
+        if result is None:
+            logging.info("Change feed position expired, reloading contacts")
+            self.load_store()
+            self.search_contacts()
+            return
+        self.change_token, changes = result
+
+        # The list may already show a contact differently than the log had
+        # it, e.g. after this client saved it
+        shown = dict(self.known_rows)
+        applied = []
+        for contact_id, old_row, record in changes:
+            old_row = shown.get(contact_id, old_row)
+            shown[contact_id] = list_row(record) if record else None
+            if old_row != shown[contact_id]:
+                applied.append((contact_id, old_row, record))
+        if not applied:
+            return
+
+        # Caches first, a reload of the list has to find every change
+        for contact_id, _, record in applied:
+            self.contact_cache.discard(contact_id)
+            if record:
+                self.contact_cache.put(record)
+        self.store_rows({contact_id: record for contact_id, _, record in applied})
+        self.search_cache.clear()
+        for contact_id, old_row, record in applied:
+            if not self.patch_rows(contact_id, old_row, record):
+                break
+        logging.info(f"Applied {len(applied)} contact changes from other clients")
+
+    def require_online(self):
+        """Warn that the snapshot is read-only, returns True if the database can be written"""
+        if self.database_state == "offline":
+            messagebox.showwarning("Offline", "The database cannot be reached - the contact list is a read-only "
+                                              "snapshot until it is back")
+            return False
+        return True
+
+    def show_error(self, message, error):
+        """Log an error and show it to the user"""
+        logging.error(f"{message}: {error}")
+        messagebox.showerror("Error", f"{message}: {error}")
+
+    def setup_ui(self):
+        """Create user interface"""
+        # Create menu bar
+        self.create_menu()
+
+        # Main frame
+        self.main_frame = ttk.Frame(self.root, padding="10")
+        self.main_frame.pack(fill=tk.BOTH, expand=True)
+
+        # Create toolbar
+        self.create_toolbar()
+
+        # Search panel
+        self.create_search_panel()
+
+        # Contacts display panel
+        self.create_contacts_panel()
+
+        # Details panel
+        self.create_details_panel()
+
+        # Apply theme
+        self.apply_theme()
+
+    def create_menu(self):
+        """Create application menu"""
+        menubar = tk.Menu(self.root)
+        self.root.config(menu=menubar)
+
+        # File menu
+        file_menu = tk.Menu(menubar, tearoff=0)
+        menubar.add_cascade(label="File", menu=file_menu)
+        file_menu.add_command(label="Import...", command=self.import_contacts)
+        file_menu.add_command(label="Export...", command=self.export_contacts)
+        file_menu.add_command(label="Export Selected...", command=lambda: self.export_contacts(selected=True))
+        file_menu.add_command(label="Find Duplicates...", command=self.find_duplicates)
+        file_menu.add_separator()
+        file_menu.add_command(label="Exit", command=self.root.quit)
+
+        # Edit menu - actions on every selected contact
+        edit_menu = tk.Menu(menubar, tearoff=0)
+        menubar.add_cascade(label="Edit", menu=edit_menu)
+        edit_menu.add_command(label="Select All", command=lambda: self.contacts_view.select_all())
+        edit_menu.add_command(label="Update Selected...", command=lambda: self.update_contacts())
+        edit_menu.add_command(label="Delete Selected", command=lambda: self.delete_contacts())
+
+        # View menu
+        view_menu = tk.Menu(menubar, tearoff=0)
+        menubar.add_cascade(label="View", menu=view_menu)
+        view_menu.add_command(label="Show All Contacts", command=self.load_contacts)
+        view_menu.add_command(label="Performance...", command=self.show_performance)
+        view_menu.add_separator()
+        view_menu.add_command(label="Dark Theme", command=lambda: self.change_theme("dark"))
+        view_menu.add_command(label="Light Theme", command=lambda: self.change_theme("light"))
+
+        # About menu
+        about_menu = tk.Menu(menubar, tearoff=0)
+        menubar.add_cascade(label="About", menu=about_menu)
+        about_menu.add_command(label="About", command=self.show_about)
+
+    def create_toolbar(self):
+        """Create toolbar"""
+        toolbar = ttk.Frame(self.main_frame)
+        toolbar.pack(fill=tk.X, pady=(0, 10))
+
+        # Toolbar buttons
+        ttk.Button(toolbar, text="Add New", command=self.add_contact).pack(side=tk.RIGHT, padx=5)
+        ttk.Button(toolbar, text="Edit", command=self.edit_contact).pack(side=tk.RIGHT, padx=5)
+        ttk.Button(toolbar, text="Delete", command=self.delete_contact).pack(side=tk.RIGHT, padx=5)
+        ttk.Button(toolbar, text="Show Details", command=self.show_details).pack(side=tk.RIGHT, padx=5)
+
+        # Contacts count label
+        self.contacts_count_label = ttk.Label(toolbar, text="Contacts: 0")
+        self.contacts_count_label.pack(side=tk.LEFT)
+
+    def create_search_panel(self):
+        """Create search panel"""
+        search_frame = ttk.LabelFrame(self.main_frame, text="Search", padding="10")
+        search_frame.pack(fill=tk.X, pady=(0, 10))
+
+        # Search fields
+        ttk.Label(search_frame, text="First Name:").grid(row=0, column=0, sticky=tk.W, padx=(0, 5))
+        self.search_first_name = ttk.Entry(search_frame, width=20)
+        self.search_first_name.grid(row=0, column=1, padx=(0, 10))
+
+        ttk.Label(search_frame, text="Last Name:").grid(row=0, column=2, sticky=tk.W, padx=(0, 5))
+        self.search_last_name = ttk.Entry(search_frame, width=20)
+        self.search_last_name.grid(row=0, column=3, padx=(0, 10))
+
+        ttk.Label(search_frame, text="Phone:").grid(row=0, column=4, sticky=tk.W, padx=(0, 5))
+        self.search_phone = ttk.Entry(search_frame, width=20)
+        self.search_phone.grid(row=0, column=5, padx=(0, 10))
+
+        # Ranked search over names, phone, email, company and notes
+        ttk.Label(search_frame, text="Any Field:").grid(row=1, column=0, sticky=tk.W, padx=(0, 5), pady=(5, 0))
+        self.search_text = ttk.Entry(search_frame, width=50)
+        self.search_text.grid(row=1, column=1, columnspan=3, sticky=tk.W, padx=(0, 10), pady=(5, 0))
+
+        # Match names by sound and spelling instead of by substring
+        self.fuzzy_search = tk.BooleanVar(value=False)
+        ttk.Checkbutton(search_frame, text="Sounds like", variable=self.fuzzy_search,
+                        command=self.search_contacts).grid(row=1, column=4, columnspan=2, sticky=tk.W, pady=(5, 0))
+
+        # Search buttons
+        ttk.Button(search_frame, text="Search", command=self.search_contacts).grid(row=0, column=6, padx=(10, 0))
+        ttk.Button(search_frame, text="Clear", command=self.clear_search).grid(row=0, column=7, padx=(5, 0))
+
+        # Search as you type
+        for entry in (self.search_first_name, self.search_last_name, self.search_phone, self.search_text):
+            entry.bind("<KeyRelease>", self.schedule_search)
+            entry.bind("<Return>", lambda event: self.search_contacts())
+
+    def create_contacts_panel(self):
+        """Create contacts display panel"""
+        contacts_frame = ttk.LabelFrame(self.main_frame, text="Contacts", padding="10")
+        contacts_frame.pack(fill=tk.BOTH, expand=True, pady=(0, 10))
+
+        # Treeview for contacts - FIXED: Remove ID column from display
+        columns = ("First Name", "Last Name", "Phone", "Email", "Company")
+        self.contacts_tree = ttk.Treeview(contacts_frame, columns=columns, show="headings", height=15)
+
+        # Configure columns - FIXED: No ID column in display
+        # Clicking a heading sorts by that column, clicking it again reverses the order
+        for column in columns:
+            self.contacts_tree.heading(column, text=column,
+                                       command=lambda field=self.SORT_FIELDS[column]: self.sort_contacts(field))
+
+        # Column widths
+        self.contacts_tree.column("First Name", width=120)
+        self.contacts_tree.column("Last Name", width=120)
+        self.contacts_tree.column("Phone", width=120)
+        self.contacts_tree.column("Email", width=150)
+        self.contacts_tree.column("Company", width=120)
+
+        # Scrollbar - driven by the virtual list, not by the Treeview itself
+        scrollbar = ttk.Scrollbar(contacts_frame, orient=tk.VERTICAL)
+
+        # Pack widgets
+        self.contacts_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+
+        # Selection event
+        self.contacts_tree.bind("<<TreeviewSelect>>", self.on_contact_select)
+
+        # Store contact IDs separately
+        self.contact_ids = {}
+
+        # Only the visible rows are kept in the Treeview
+        self.contacts_view = VirtualContactList(self.contacts_tree, scrollbar, self.contact_ids, self.read_executor,
+                                                on_error=lambda e: self.show_error("Error loading contacts", e),
+                                                on_page=lambda rows: self.prefetch_contacts([row[0] for row in rows]),
+                                                metrics=self.metrics)
+
+    def create_details_panel(self):
+        """Create contact details panel - IMPROVED"""
+        details_frame = ttk.LabelFrame(self.main_frame, text="Contact Details - Complete Information", padding="10")
+        details_frame.pack(fill=tk.BOTH, expand=False)
+
+        # Create a better details display
+        details_container = ttk.Frame(details_frame)
+        details_container.pack(fill=tk.BOTH, expand=True)
+
+        # Use Text widget with better formatting
+        self.details_text = scrolledtext.ScrolledText(
+            details_container,
+            height=10,
+            state=tk.DISABLED,
+            font=('Arial', 10),
+            wrap=tk.WORD
+        )
+        self.details_text.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+
+        # Long notes are shown in full only on request
+        self.notes_button = ttk.Button(details_frame, text="Show All Notes", command=self.expand_notes,
+                                       state=tk.DISABLED)
+        self.notes_button.pack(side=tk.RIGHT, padx=5)
+
+        # Add some initial help text
+        self.details_text.config(state=tk.NORMAL)
+        self.details_text.insert(1.0, "Select a contact from the list above to view complete details...")
+        self.details_text.config(state=tk.DISABLED)
+
+    def apply_theme(self):
+        """Apply theme to UI"""
+        if self.current_theme == "dark":
+            # Dark theme colors
+            bg_color = "#2e2e2e"
+            fg_color = "#ffffff"
+            entry_bg = "#404040"
+            entry_fg = "#ffffff"
+            tree_bg = "#404040"
+            tree_fg = "#ffffff"
+            tree_selected = "#0078d7"
+        else:
+            # Light theme colors
+            bg_color = "#f0f0f0"
+            fg_color = "#000000"
+            entry_bg = "#ffffff"
+            entry_fg = "#000000"
+            tree_bg = "#ffffff"
+            tree_fg = "#000000"
+            tree_selected = "#0078d7"
+
+        # Apply colors to widgets
+        self.root.configure(bg=bg_color)
+        self.main_frame.configure(style="TFrame")
+
+        # Create style for widgets
+        style = ttk.Style()
+        style.theme_use('clam')
+
+        # Configure style for dark/light theme
+        style.configure("TFrame", background=bg_color)
+        style.configure("TLabel", background=bg_color, foreground=fg_color)
+        style.configure("TButton", background=bg_color, foreground=fg_color)
+        style.configure("TEntry", fieldbackground=entry_bg, foreground=entry_fg)
+        style.configure("TScrollbar", background=bg_color, troughcolor=bg_color)
+        style.configure("TLabelframe", background=bg_color, foreground=fg_color)
+        style.configure("TLabelframe.Label", background=bg_color, foreground=fg_color)
+
+        # Configure Treeview
+        style.configure("Treeview",
+                        background=tree_bg,
+                        foreground=tree_fg,
+                        fieldbackground=tree_bg)
+        style.map("Treeview", background=[('selected', tree_selected)])
+
+        # Configure ScrolledText
+        self.details_text.configure(bg=tree_bg, fg=tree_fg, insertbackground=fg_color)
+
+    def change_theme(self, theme):
+        """Change application theme"""
+        self.current_theme = theme
+        self.apply_theme()
+        logging.info(f"Theme changed to {theme}")
+
+    def load_contacts(self):
+        """Load all contacts from database - paged, only visible rows are fetched"""
+        self.last_search = ()
+
+        def loaded(total):
+            # Update count label
+            self.show_count(total)
+
+            # Clear details
+            self.clear_details()
+
+            logging.info(f"Loaded {total} contacts")
+
+        self.follow_changes()
+        self.contacts_view.reset(ContactPageSource(sort=self.sort_order), on_loaded=loaded,
+                                 name="load_contacts" if self.read_executor is self.executor else "load_snapshot")
+
+    def show_count(self, total):
+        """Contacts count label, noting when the list is the local snapshot"""
+        text = f"Contacts: {total}"
+        if self.read_executor is not self.executor:
+            synced = f" of {self.snapshot_synced_at}" if self.snapshot_synced_at else ""
+            state = "offline, snapshot" if self.database_state == "offline" else "snapshot, connecting..."
+            text += f" ({state}{synced})"
+        self.contacts_count_label.config(text=text)
+
+    def clear_details(self):
+        """Show the details panel placeholder"""
+        self.displayed_contact_id = None
+        self.read_executor.cancel("notes")
+        self.notes_button.config(state=tk.DISABLED)
+        self.details_text.config(state=tk.NORMAL)
+        self.details_text.delete(1.0, tk.END)
+        self.details_text.insert(1.0, "Select a contact from the list above to view complete details...")
+        self.details_text.config(state=tk.DISABLED)
+
+    def patch_contacts(self, contact_id, old_record=None, new_record=None):
+        """Show a saved or deleted contact without reloading the list"""
+        self.store_rows({contact_id: new_record})
+        self.patch_rows(contact_id, list_row(old_record) if old_record else None, new_record, select=True)
+
+    def patch_rows(self, contact_id, old_row, new_record, select=False):
+        """Patch the list, count and details with a change, returns False if the list was reloaded instead"""
+        new_row = list_row(new_record) if new_record else None
+        self.known_rows[contact_id] = new_row
+        if not self.contacts_view.apply_change(contact_id, old_row, new_row, select=select and new_row is not None):
+            self.search_contacts()
+            return False
+
+        # Update count
+        self.show_count(self.contacts_view.total)
+
+        # Refresh the details panel if it shows this contact
+        if contact_id == self.displayed_contact_id:
+            if new_record:
+                self.show_contact_details(contact_id, new_record)
+            else:
+                self.clear_details()
+        return True
+
+    def sort_contacts(self, field):
+        """Sort the list by a column on the server, toggling the direction on repeated clicks"""
+        self.sort_order = f"-{field}" if self.sort_order == field else field
+
+        # Mark the sorted column
+        for column, column_field in self.SORT_FIELDS.items():
+            arrow = ""
+            if column_field == field:
+                arrow = " ▼" if self.sort_order.startswith("-") else " ▲"
+            self.contacts_tree.heading(column, text=column + arrow)
+
+        logging.info(f"Sorting contacts by {self.sort_order}")
+        self.search_contacts()
+
+    def get_search_criteria(self):
+        """Current contents of the search fields"""
+        return {
+            "first_name": self.search_first_name.get().strip(),
+            "last_name": self.search_last_name.get().strip(),
+            "phone": self.search_phone.get().strip(),
+            "text": self.search_text.get().strip(),
+        }
+
+    def schedule_search(self, event=None):
+        """Run a live search once typing pauses"""
+        if self.search_after_id:
+            self.root.after_cancel(self.search_after_id)
+        self.search_after_id = self.root.after(self.settings["search_debounce_ms"], self.live_search)
+
+    def live_search(self):
+        """Debounced search - skipped if the criteria did not change"""
+        self.search_after_id = None
+        if normalize_criteria(self.get_search_criteria()) != self.last_search:
+            self.search_contacts()
+
+    def search_contacts(self):
+        """Search contacts based on criteria - cached results are filtered in memory"""
+        try:
+            if self.search_after_id:
+                self.root.after_cancel(self.search_after_id)
+                self.search_after_id = None
+
+            # Get search criteria
+            criteria = self.get_search_criteria()
+            self.last_search = normalize_criteria(criteria)
+            if not self.last_search:
+                self.load_contacts()
+                return
+
+            # Answer from the cache when possible - fuzzy results are not
+            # cached, field searches use the contacts in memory once loaded
+            fuzzy = self.fuzzy_search.get() and any(criteria[field] for field in ("first_name", "last_name", "text"))
+            local = self.contact_store is not None and not fuzzy and not criteria["text"]
+            rows = None
+            if not fuzzy and not local:
+                rows = self.search_cache.get(criteria)
+                self.metrics.increment("search_cache_lookups_total", "hit" if rows is not None else "miss")
+            fields = {field: value for field, value in criteria.items() if field != "text"}
+            if rows is not None:
+                source = MemoryPageSource(sort_rows(rows, self.sort_order), criteria, self.sort_order)
+            elif fuzzy:
+                source = FuzzySearchSource(criteria["text"], fields, self.settings["text_search_limit"],
+                                           self.sort_order)
+            elif criteria["text"]:
+                source = TextSearchSource(criteria["text"], fields, self.settings["text_search_limit"],
+                                          self.sort_order)
+            elif local:
+                source = StorePageSource(self.contact_store, criteria, self.sort_order)
+            else:
+                source = SearchPageSource(criteria, self.settings["search_cache_rows"], self.sort_order)
+            generation = self.search_cache.generation
+
+            def loaded(total):
+                if isinstance(source, SearchPageSource) and source.rows is not None:
+                    self.search_cache.put(criteria, source.rows, generation)
+
+                # Update count
+                self.show_count(total)
+                logging.info(f"Search found {total} contacts{' (cached)' if rows is not None else ''}")
+
+            # Show results page by page - a newer search cancels this one
+            if rows is not None:
+                name = "cached_search"
+            elif fuzzy:
+                name = "fuzzy_search"
+            elif local:
+                name = "store_search"
+            else:
+                name = "text_search" if criteria["text"] else "search_contacts"
+            self.follow_changes()
+            self.contacts_view.reset(source, on_loaded=loaded, name=name)
+
+        except Exception as e:
+            logging.error(f"Search error: {e}")
+            messagebox.showerror("Error", f"Search error: {e}")
+
+    def clear_search(self):
+        """Clear search fields and show all contacts"""
+        self.search_first_name.delete(0, tk.END)
+        self.search_last_name.delete(0, tk.END)
+        self.search_phone.delete(0, tk.END)
+        self.search_text.delete(0, tk.END)
+        self.load_contacts()
+        logging.info("Search cleared")
+
+    def on_contact_select(self, event):
+        """Handle contact selection - FIXED"""
+        selection = self.contacts_tree.selection()
+        if selection:
+            item_id = selection[0]
+            contact_id = self.contact_ids.get(item_id)
+            if contact_id and contact_id != self.displayed_contact_id:
+                self.display_contact_details(contact_id)
+
+    def display_contact_details(self, contact_id):
+        """Display detailed contact information - from the cache or loaded in the background"""
+        self.displayed_contact_id = contact_id
+        index = self.contacts_view.selected_index()
+        if index is not None:
+            self.prefetch_contacts(self.contacts_view.neighbour_ids(index, self.settings["contact_prefetch"]))
+
+        contact = self.contact_cache.get(contact_id)
+        self.metrics.increment("contact_cache_lookups_total", "hit" if contact else "miss")
+        if contact:
+            self.read_executor.cancel("details")
+            self.show_contact_details(contact_id, contact)
+            return
+
+        generation = self.contact_cache.generation
+
+        def loaded(contact):
+            self.contact_cache.put(contact, generation)
+            self.show_contact_details(contact_id, contact)
+
+        self.read_executor.submit(lambda repo: repo.get_header(contact_id), key="details",
+                                  on_success=loaded, on_error=self.show_details_error)
+
+    def prefetch_contacts(self, contact_ids):
+        """Load the headers of listed contacts into the contact cache in the background"""
+        missing = self.contact_cache.missing(contact_ids)
+        if not missing:
+            return
+        generation = self.contact_cache.generation
+        self.read_executor.submit(lambda repo: list(repo.iter_headers(missing)), key="prefetch",
+                                  on_success=lambda records: self.contact_cache.put_many(records, generation),
+                                  on_error=lambda e: logging.warning(f"Contact prefetch failed: {e}"))
+
+    def show_contact_details(self, contact_id, contact):
+        """Render a fetched contact in the details panel"""
+        try:
+            if contact:
+                started = time.perf_counter()
+
+                # Format details better
+                details = f"""📋 CONTACT DETAILS
+─────────────────────────────
+👤 Name: {contact[1]} {contact[2]}
+📞 Phone: {contact[3]}
+📧 Email: {contact[4] if contact[4] else 'Not specified'}
+🏠 Address: {contact[5] if contact[5] else 'Not specified'}
+🏢 Company: {contact[6] if contact[6] else 'Not specified'}
+
+📝 Notes:
+"""
+                footer = f"""
+
+📅 Created: {contact[8]}
+🔄 Modified: {contact[9]}
+─────────────────────────────
+Contact ID: {contact[0]}"""
+
+                # Only a preview of long notes, between marks for expand_notes
+                notes = contact[7] or ""
+                length = contact[10] if len(contact) > 10 and contact[10] else len(notes)
+                preview = notes[:NOTES_PREVIEW_LENGTH] if notes else "No notes available"
+                if length > NOTES_PREVIEW_LENGTH:
+                    preview += f"... ({length:,} characters)"
+
+                self.read_executor.cancel("notes")
+                self.details_text.config(state=tk.NORMAL)
+                self.details_text.delete(1.0, tk.END)
+                self.details_text.insert(1.0, details)
+                self.details_text.mark_set("notes_start", "end-1c")
+                self.details_text.mark_gravity("notes_start", tk.LEFT)
+                self.details_text.insert(tk.END, preview)
+                self.details_text.mark_set("notes_end", "end-1c")
+                self.details_text.insert(tk.END, footer)
+                self.details_text.config(state=tk.DISABLED)
+                self.notes_button.config(state=tk.NORMAL if length > NOTES_PREVIEW_LENGTH else tk.DISABLED)
+                self.metrics.observe("render_seconds", time.perf_counter() - started, "details")
+
+                logging.info(f"Displayed details for contact ID: {contact_id}")
+        except Exception as e:
+            self.show_details_error(e)
+
+    def expand_notes(self):
+        """Replace the notes preview with all of the notes, read chunk by chunk in the background"""
+        contact_id = self.displayed_contact_id
+        if contact_id is None:
+            return
+        self.notes_button.config(state=tk.DISABLED)
+        chunk_size = self.settings["notes_chunk_size"]
+
+        def read(offset):
+            self.read_executor.submit(lambda repo: repo.read_notes(contact_id, offset, chunk_size), key="notes",
+                                      on_success=lambda chunk: loaded(offset, chunk),
+                                      on_error=self.show_details_error, name="notes")
+
+        def loaded(offset, chunk):
+            if contact_id != self.displayed_contact_id or chunk is None:
+                return
+            self.details_text.config(state=tk.NORMAL)
+            if offset == 0:
+                self.details_text.delete("notes_start", "notes_end")
+            self.details_text.insert("notes_end", chunk)
+            self.details_text.config(state=tk.DISABLED)
+            # Continue until a read comes back empty, lengths may be counted differently by the database
+            if chunk:
+                read(offset + chunk_size)
+
+        read(0)
+
+    def show_details_error(self, e):
+        """Show a details loading error in the details panel"""
+        logging.error(f"Error displaying contact details: {e}")
+        self.displayed_contact_id = None
+        self.notes_button.config(state=tk.DISABLED)
+        self.details_text.config(state=tk.NORMAL)
+        self.details_text.delete(1.0, tk.END)
+        self.details_text.insert(1.0, f"Error loading contact details: {e}")
+        self.details_text.config(state=tk.DISABLED)
+
+    def add_contact(self):
+        """Open add contact dialog"""
+        if self.require_online():
+            self.contact_dialog("Add New Contact")
+
+    def edit_contact(self):
+        """Open edit contact dialog - FIXED"""
+        if not self.require_online():
+            return
+        if len(self.contacts_view.selected_ids) > 1:
+            self.update_contacts()
+            return
+        selection = self.contacts_tree.selection()
+        if not selection:
+            messagebox.showwarning("Warning", "Please select a contact to edit")
+            return
+
+        item_id = selection[0]
+        contact_id = self.contact_ids.get(item_id)
+
+        if contact_id:
+            self.contact_dialog("Edit Contact", contact_id)
+        else:
+            messagebox.showerror("Error", "Could not find contact ID")
+
+    def contact_dialog(self, title, contact_id=None):
+        """Create contact add/edit dialog - IMPROVED"""
+        dialog = tk.Toplevel(self.root)
+        dialog.title(title)
+        dialog.geometry("500x500")
+        dialog.resizable(False, False)
+        dialog.transient(self.root)
+        dialog.grab_set()
+
+        # Form fields
+        fields_frame = ttk.Frame(dialog, padding="20")
+        fields_frame.pack(fill=tk.BOTH, expand=True)
+
+        ttk.Label(fields_frame, text="First Name:*").grid(row=0, column=0, sticky=tk.W, pady=5)
+        first_name_entry = ttk.Entry(fields_frame, width=30)
+        first_name_entry.grid(row=0, column=1, sticky=tk.W, pady=5, padx=(10, 0))
+
+        ttk.Label(fields_frame, text="Last Name:*").grid(row=1, column=0, sticky=tk.W, pady=5)
+        last_name_entry = ttk.Entry(fields_frame, width=30)
+        last_name_entry.grid(row=1, column=1, sticky=tk.W, pady=5, padx=(10, 0))
+
+        ttk.Label(fields_frame, text="Phone:*").grid(row=2, column=0, sticky=tk.W, pady=5)
+        phone_entry = ttk.Entry(fields_frame, width=30)
+        phone_entry.grid(row=2, column=1, sticky=tk.W, pady=5, padx=(10, 0))
+
+        ttk.Label(fields_frame, text="Email:").grid(row=3, column=0, sticky=tk.W, pady=5)
+        email_entry = ttk.Entry(fields_frame, width=30)
+        email_entry.grid(row=3, column=1, sticky=tk.W, pady=5, padx=(10, 0))
+
+        ttk.Label(fields_frame, text="Address:").grid(row=4, column=0, sticky=tk.W, pady=5)
+        address_entry = ttk.Entry(fields_frame, width=30)
+        address_entry.grid(row=4, column=1, sticky=tk.W, pady=5, padx=(10, 0))
+
+        ttk.Label(fields_frame, text="Company:").grid(row=5, column=0, sticky=tk.W, pady=5)
+        company_entry = ttk.Entry(fields_frame, width=30)
+        company_entry.grid(row=5, column=1, sticky=tk.W, pady=5, padx=(10, 0))
+
+        ttk.Label(fields_frame, text="Notes:").grid(row=6, column=0, sticky=tk.NW, pady=5)
+        notes_text = scrolledtext.ScrolledText(fields_frame, width=30, height=5)
+        notes_text.grid(row=6, column=1, sticky=tk.W, pady=5, padx=(10, 0))
+
+        # Record as loaded, to find the contact in the list after saving
+        original = {}
+
+        # Load data if editing
+        def fill_form(contact):
+            if contact and dialog.winfo_exists():
+                original["record"] = contact
+                first_name_entry.insert(0, contact[1])
+                last_name_entry.insert(0, contact[2])
+                phone_entry.insert(0, contact[3])
+                email_entry.insert(0, contact[4] if contact[4] else "")
+                address_entry.insert(0, contact[5] if contact[5] else "")
+                company_entry.insert(0, contact[6] if contact[6] else "")
+                notes_text.insert(1.0, contact[7] if contact[7] else "")
+
+        if contact_id:
+            # A header has only the start of long notes, the form needs all of them
+            cached = self.contact_cache.get(contact_id)
+            if cached and not notes_truncated(cached):
+                fill_form(cached)
+            else:
+                generation = self.contact_cache.generation
+
+                def loaded(contact):
+                    self.contact_cache.put(contact, generation)
+                    fill_form(contact)
+
+                self.executor.submit(lambda repo: repo.get(contact_id), on_success=loaded,
+                                     on_error=lambda e: self.show_error("Error loading contact", e), name="edit_load")
+
+        # Buttons
+        button_frame = ttk.Frame(dialog, padding="10")
+        button_frame.pack(fill=tk.X)
+
+        def write_contact(repo, contact):
+            if contact_id:
+                # None if another client deleted the contact meanwhile
+                if not repo.update(contact_id, contact):
+                    return None
+                return repo.get(contact_id)
+            return repo.get(repo.add(contact))
+
+        def saved(action, record):
+            dialog.destroy()
+            self.search_cache.clear()
+
+            if contact_id and not record:
+                self.contact_cache.discard(contact_id)
+                self.patch_contacts(contact_id, original.get("record"), None)
+                self.show_error("Error saving contact", "the contact no longer exists")
+                return
+
+            # Write through, the stored record has the new modified date
+            if record:
+                self.contact_cache.discard(record[0])
+                self.contact_cache.put(record)
+                self.patch_contacts(record[0], original.get("record"), record)
+                audit("update" if contact_id else "add", record[0], original.get("record"), record)
+            else:
+                self.search_contacts()
+
+            logging.info(f"Contact {action} successfully")
+            messagebox.showinfo("Success", f"Contact {action} successfully")
+
+        def save_failed(e):
+            if dialog.winfo_exists():
+                save_button.config(state=tk.NORMAL)
+            self.show_error("Error saving contact", e)
+
+        def write(contact, action):
+            self.executor.submit(write_contact, contact, on_success=lambda record: saved(action, record),
+                                 on_error=save_failed, name="save")
+
+        def checked(contact, matches):
+            if not dialog.winfo_exists():
+                return
+            if matches:
+                lines = "\n".join(f"{record[1]} {record[2]}, {record[3]} ({score:.0%} match)"
+                                  for record, score in matches[:3])
+                if not messagebox.askyesno("Possible Duplicate",
+                                           f"This contact looks like:\n\n{lines}\n\nSave it anyway?", parent=dialog):
+                    save_button.config(state=tk.NORMAL)
+                    return
+            write(contact, "added")
+
+        def save_contact():
+            try:
+                # Get form data
+                first_name = first_name_entry.get().strip()
+                last_name = last_name_entry.get().strip()
+                phone = phone_entry.get().strip()
+                email = email_entry.get().strip()
+                address = address_entry.get().strip()
+                company = company_entry.get().strip()
+                notes = notes_text.get(1.0, tk.END).strip()
+
+                # Validation
+                if not first_name or not last_name or not phone:
+                    messagebox.showerror("Error", "First Name, Last Name, and Phone are required")
+                    return
+
+                contact = {
+                    "first_name": first_name,
+                    "last_name": last_name,
+                    "phone": phone,
+                    "email": email,
+                    "address": address,
+                    "company": company,
+                    "notes": notes,
+                }
+                action = "updated" if contact_id else "added"
+
+                # Save in the background, the dialog stays open until it is done
+                save_button.config(state=tk.DISABLED)
+                if contact_id:
+                    write(contact, action)
+                    return
+
+                # New contacts are checked for near-matches first, through indexes
+                threshold = self.settings["dedupe_threshold"]
+                self.executor.submit(lambda repo: repo.find_similar(contact, threshold),
+                                     on_success=lambda matches: checked(contact, matches),
+                                     on_error=save_failed, name="duplicate_check")
+
+            except Exception as e:
+                logging.error(f"Error saving contact: {e}")
+                messagebox.showerror("Error", f"Error saving contact: {e}")
+
+        save_button = ttk.Button(button_frame, text="Save", command=save_contact)
+        save_button.pack(side=tk.RIGHT, padx=5)
+        ttk.Button(button_frame, text="Cancel", command=dialog.destroy).pack(side=tk.RIGHT, padx=5)
+
+    def delete_contact(self):
+        """Delete selected contact - FIXED"""
+        if not self.require_online():
+            return
+        if len(self.contacts_view.selected_ids) > 1:
+            self.delete_contacts()
+            return
+        selection = self.contacts_tree.selection()
+        if not selection:
+            messagebox.showwarning("Warning", "Please select a contact to delete")
+            return
+
+        item_id = selection[0]
+        contact_id = self.contact_ids.get(item_id)
+
+        if not contact_id:
+            messagebox.showerror("Error", "Could not find contact ID")
+            return
+
+        # Get contact name for confirmation
+        item_values = self.contacts_tree.item(item_id, 'values')
+        contact_name = f"{item_values[0]} {item_values[1]}"
+
+        # Confirmation
+        if messagebox.askyesno("Confirm Delete", f"Are you sure you want to delete {contact_name}?"):
+            def delete_contact(repo):
+                # The deleted record goes into the audit trail
+                record = repo.get(contact_id)
+                repo.delete(contact_id)
+                return record
+
+            def deleted(record):
+                self.search_cache.clear()
+                self.contact_cache.discard(contact_id)
+                self.patch_contacts(contact_id, record)
+                audit("delete", contact_id, record)
+
+                logging.info(f"Contact {contact_name} (ID: {contact_id}) deleted")
+                messagebox.showinfo("Success", "Contact deleted successfully")
+
+            self.executor.submit(delete_contact, on_success=deleted,
+                                 on_error=lambda e: self.show_error("Error deleting contact", e), name="delete")
+
+    def delete_contacts(self):
+        """Delete every selected contact in one transaction, then reload the list once"""
+        if not self.require_online():
+            return
+        ids = self.contacts_view.selection()
+        if not ids:
+            messagebox.showwarning("Warning", "Please select the contacts to delete")
+            return
+        if not messagebox.askyesno("Confirm Delete", f"Are you sure you want to delete {len(ids)} contacts?"):
+            return
+
+        def delete_contacts(repo):
+            # The deleted records go into the audit trail
+            records = list(repo.iter_contacts(ids=ids))
+            repo.delete_many(ids)
+            return records
+
+        def deleted(records):
+            self.contacts_changed("delete", records, [])
+            logging.info(f"{len(records)} contacts deleted")
+            messagebox.showinfo("Success", f"{len(records)} contacts deleted successfully")
+
+        self.executor.submit(delete_contacts, on_success=deleted,
+                             on_error=lambda e: self.show_error("Error deleting contacts", e), name="delete_many")
+
+    def update_contacts(self):
+        """Set one field to the same value on every selected contact"""
+        if not self.require_online():
+            return
+        ids = self.contacts_view.selection()
+        if not ids:
+            messagebox.showwarning("Warning", "Please select the contacts to update")
+            return
+
+        dialog = tk.Toplevel(self.root)
+        dialog.title(f"Update {len(ids)} Contacts")
+        dialog.resizable(False, False)
+        dialog.transient(self.root)
+        dialog.grab_set()
+
+        fields_frame = ttk.Frame(dialog, padding="20")
+        fields_frame.pack(fill=tk.BOTH, expand=True)
+
+        labels = {field.capitalize(): field for field in BULK_FIELDS}
+        ttk.Label(fields_frame, text="Field:").grid(row=0, column=0, sticky=tk.W, pady=5)
+        field_box = ttk.Combobox(fields_frame, values=list(labels), state="readonly", width=28)
+        field_box.current(list(labels.values()).index("company"))
+        field_box.grid(row=0, column=1, sticky=tk.W, pady=5, padx=(10, 0))
+
+        ttk.Label(fields_frame, text="New value:").grid(row=1, column=0, sticky=tk.W, pady=5)
+        value_entry = ttk.Entry(fields_frame, width=30)
+        value_entry.grid(row=1, column=1, sticky=tk.W, pady=5, padx=(10, 0))
+        value_entry.focus_set()
+
+        def update_contacts(repo, values):
+            # Records before and after, for the caches and the audit trail
+            old_records = list(repo.iter_contacts(ids=ids))
+            repo.update_many(ids, values)
+            return old_records, list(repo.iter_contacts(ids=ids))
+
+        def updated(result):
+            old_records, new_records = result
+            if dialog.winfo_exists():
+                dialog.destroy()
+            self.contacts_changed("update", old_records, new_records)
+            logging.info(f"{len(new_records)} contacts updated")
+            messagebox.showinfo("Success", f"{len(new_records)} contacts updated successfully")
+
+        def update_failed(e):
+            if dialog.winfo_exists():
+                update_button.config(state=tk.NORMAL)
+            self.show_error("Error updating contacts", e)
+
+        def update():
+            field = labels[field_box.get()]
+            value = value_entry.get().strip()
+            # Notes have no length limit
+            limit = FIELD_LENGTHS.get(field)
+            if limit and len(value) > limit:
+                messagebox.showerror("Error", f"{field_box.get()} is longer than {limit} characters", parent=dialog)
+                return
+            update_button.config(state=tk.DISABLED)
+            self.executor.submit(update_contacts, {field: value}, on_success=updated, on_error=update_failed,
+                                 name="update_many")
+
+        button_frame = ttk.Frame(dialog, padding=(20, 0, 20, 20))
+        button_frame.pack(fill=tk.X)
+        update_button = ttk.Button(button_frame, text="Update", command=update)
+        update_button.pack(side=tk.RIGHT, padx=5)
+        ttk.Button(button_frame, text="Cancel", command=dialog.destroy).pack(side=tk.RIGHT, padx=5)
+        value_entry.bind("<Return>", lambda event: update())
+
+    def contacts_changed(self, action, old_records, new_records):
+        """Apply a bulk change to the caches and the audit trail, then reload the list once"""
+        new_by_id = {record[0]: record for record in new_records}
+        self.search_cache.clear()
+        for old_record in old_records:
+            contact_id = old_record[0]
+            new_record = new_by_id.get(contact_id)
+            self.contact_cache.discard(contact_id)
+            if new_record:
+                self.contact_cache.put(new_record)
+            audit(action, contact_id, old_record, new_record)
+        self.store_rows({old_record[0]: new_by_id.get(old_record[0]) for old_record in old_records})
+
+        # Refresh the details panel if it shows one of them
+        if self.displayed_contact_id in new_by_id:
+            self.show_contact_details(self.displayed_contact_id, new_by_id[self.displayed_contact_id])
+        elif any(record[0] == self.displayed_contact_id for record in old_records):
+            self.clear_details()
+        self.search_contacts()
+
+    def import_contacts(self):
+        """Import contacts from a CSV or vCard file in the background"""
+        if not self.require_online():
+            return
+        path = filedialog.askopenfilename(
+            parent=self.root,
+            title="Import Contacts",
+            filetypes=[("Contact files", "*.csv *.vcf *.vcard"), ("CSV files", "*.csv"),
+                       ("vCard files", "*.vcf *.vcard"), ("All files", "*.*")]
+        )
+        if not path:
+            return
+
+        report = ImportReport()
+        dialog = ProgressDialog(
+            self.root, "Importing Contacts", report,
+            lambda r: (r.bytes_read / r.total_bytes if r.total_bytes else 0.0,
+                       f"{r.imported} imported, {len(r.rejected)} rejected - {r.rows_per_second:.0f} rows/s")
+        )
+
+        def finished(report):
+            dialog.close()
+            self.search_cache.clear()
+            self.contact_cache.clear()
+            self.load_store()
+            self.load_contacts()
+            audit("import", None, file=path, imported=report.imported, rejected=len(report.rejected))
+
+            message = report.summary()
+            if report.rejected:
+                lines = "\n".join(f"Line {line}: {reason}" for line, reason in report.rejected[:10])
+                more = f"\n... and {len(report.rejected) - 10} more" if len(report.rejected) > 10 else ""
+                message += f"\n\nRejected rows:\n{lines}{more}"
+            messagebox.showinfo("Import", message)
+
+        def failed(e):
+            dialog.close()
+            self.search_cache.clear()
+            self.contact_cache.clear()
+            self.load_store()
+            self.load_contacts()
+            self.show_error("Import error", e)
+
+        batch_size = self.settings["import_batch_size"]
+        self.executor.submit(lambda repo: import_contacts(repo, path, batch_size=batch_size, report=report),
+                             on_success=finished, on_error=failed, name="import")
+
+    def export_contacts(self, selected=False):
+        """Export the contacts currently listed, or only the selected ones, to a file in the background"""
+        if selected and not self.contacts_view.selected_ids:
+            messagebox.showwarning("Warning", "Please select the contacts to export")
+            return
+        path = filedialog.asksaveasfilename(
+            parent=self.root,
+            title="Export Contacts",
+            defaultextension=".csv",
+            filetypes=[("CSV files", "*.csv"), ("vCard files", "*.vcf"), ("JSON Lines files", "*.jsonl"),
+                       ("Compressed files", "*.gz"), ("All files", "*.*")]
+        )
+        if not path:
+            return
+
+        # Ranked and cached results are exported by id, everything else by its criteria
+        source = self.contacts_view.source
+        sort = source.sort if source else None
+        if selected:
+            criteria, ids = None, self.contacts_view.selection()
+        elif isinstance(source, MemoryPageSource):
+            criteria, ids = None, [row[0] for row in source.rows]
+        else:
+            criteria, ids = source.criteria if source else None, None
+
+        report = ExportReport()
+        dialog = ProgressDialog(
+            self.root, "Exporting Contacts", report,
+            lambda r: (r.exported / r.total if r.total else 0.0,
+                       f"{r.exported} of {r.total} exported - {r.rows_per_second:.0f} rows/s")
+        )
+
+        def finished(report):
+            dialog.close()
+            messagebox.showinfo("Export", report.summary())
+
+        def failed(e):
+            dialog.close()
+            self.show_error("Export error", e)
+
+        chunk_size = self.settings["export_chunk_size"]
+        self.executor.submit(lambda repo: export_contacts(repo, path, criteria=criteria, ids=ids,
+                                                          chunk_size=chunk_size, report=report, sort=sort),
+                             on_success=finished, on_error=failed, name="export")
+
+    def find_duplicates(self):
+        """Open the duplicate contacts window"""
+        if not self.require_online():
+            return
+        if self.duplicates_dialog and self.duplicates_dialog.window.winfo_exists():
+            self.duplicates_dialog.show()
+            return
+        self.duplicates_dialog = DuplicatesDialog(self.root, self.executor, self.settings,
+                                                  on_merged=self.contacts_merged, on_error=self.show_error)
+
+    def contacts_merged(self, record, old_records):
+        """Show a merged group as its kept contact"""
+        self.search_cache.clear()
+        for old_record in old_records:
+            self.contact_cache.discard(old_record[0])
+            if old_record[0] != record[0]:
+                self.patch_contacts(old_record[0], old_record)
+        self.contact_cache.put(record)
+        kept = next((old_record for old_record in old_records if old_record[0] == record[0]), None)
+        self.patch_contacts(record[0], kept, record)
+        audit("merge", record[0], kept, record, merged=[old_record[0] for old_record in old_records
+                                                        if old_record[0] != record[0]])
+        for old_record in old_records:
+            if old_record[0] != record[0]:
+                audit("delete", old_record[0], old_record, merged_into=record[0])
+        logging.info(f"Merged {len(old_records) - 1} duplicates into contact {record[0]}")
+
+    def show_details(self):
+        """Show details of selected contact - FIXED"""
+        selection = self.contacts_tree.selection()
+        if not selection:
+            messagebox.showwarning("Warning", "Please select a contact to view details")
+            return
+
+        item_id = selection[0]
+        contact_id = self.contact_ids.get(item_id)
+
+        if contact_id:
+            self.display_contact_details(contact_id)
+        else:
+            messagebox.showerror("Error", "Could not find contact details")
+
+    def show_performance(self):
+        """Open the live performance panel"""
+        if self.performance_panel and self.performance_panel.window.winfo_exists():
+            self.performance_panel.show()
+            return
+        self.performance_panel = PerformancePanel(self.root, self.metrics)
+
+    def show_about(self):
+        """Show about information"""
+        about_text = """Advanced Phonebook Application
+
+Version: 2.0 - Fixed Edition
+Database: phone
+Developed with Python and Tkinter
+
+Fixed Issues:
+- Delete contact error resolved
+- Edit contact loading fixed  
+- Show details working properly
+- Better contact details display
+- Improved error handling
+
+© 2024 Phonebook App"""
+
+        messagebox.showinfo("About", about_text)
+        logging.info("About dialog displayed")
+
+
+def main():
+    """Main function to start the application"""
+    # Configure logging - records are written by a background thread
+    log_writer = setup_logging(load_settings())
+
+    try:
+        root = tk.Tk()
+        app = PhoneBookApp(root)
+        root.mainloop()
+        app.executor.shutdown()
+        if app.snapshot_executor:
+            app.snapshot_executor.shutdown()
+        logging.info(f"Contact cache: {app.contact_cache.stats()}")
+        logging.info(f"Search cache: {app.search_cache.stats()}")
+        logging.info(f"Connection pool: {app.pool.stats()}")
+        app.metrics.close()
+    except Exception as e:
+        logging.error(f"Application error: {e}")
+        messagebox.showerror("Fatal Error", f"Application failed to start: {e}")
+    finally:
+        log_writer.stop()
+
+
+if __name__ == "__main__":
     main()
\ No newline at end of file
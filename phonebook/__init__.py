@@ -0,0 +1,77 @@
+"""Core (non-GUI) parts of the phonebook application
+
+The names below are imported from their modules on first use, so a script or
+a single command line lookup only loads the modules it needs.
+
+    from phonebook import load_settings, open_repository
+
+    repo = open_repository(load_settings())
+    print(repo.lookup_by_phone("+1 555 123 4567"))
+"""
+
+import importlib
+
+# Public name -> module it lives in
+_EXPORTS = {
+    "ApiError": "client",
+    "BULK_FIELDS": "storage",
+    "ConnectionPool": "pool",
+    "ContactCache": "cache",
+    "ContactPageSource": "paging",
+    "ContactRepository": "storage",
+    "ContactServer": "server",
+    "ContactStore": "columnar",
+    "DuplicateGroup": "dedupe",
+    "ExportReport": "exporter",
+    "FIELD_LENGTHS": "storage",
+    "FuzzySearchSource": "paging",
+    "HttpContactRepository": "client",
+    "ImportReport": "importer",
+    "LogWriter": "logs",
+    "MemoryPageSource": "paging",
+    "NOTES_PREVIEW_LENGTH": "storage",
+    "Metrics": "metrics",
+    "PoolTimeout": "pool",
+    "QueryExecutor": "executor",
+    "QueryHandle": "executor",
+    "SearchCache": "search",
+    "SearchPageSource": "paging",
+    "SnapshotRepository": "snapshot",
+    "SqlServerContactRepository": "storage",
+    "SqliteContactRepository": "storage",
+    "StorePageSource": "columnar",
+    "TextSearchSource": "paging",
+    "audit": "logs",
+    "create_metrics": "metrics",
+    "export_contacts": "exporter",
+    "import_contacts": "importer",
+    "insert_position": "paging",
+    "list_row": "paging",
+    "load_settings": "config",
+    "merged_contact": "dedupe",
+    "normalize_criteria": "search",
+    "notes_truncated": "storage",
+    "open_repository": "storage",
+    "open_snapshot": "snapshot",
+    "phonetic_key": "fuzzy",
+    "setup_logging": "logs",
+    "sort_columns": "storage",
+    "sort_key": "paging",
+    "sort_rows": "paging",
+    "sync_snapshot": "snapshot",
+}
+
+__all__ = sorted(_EXPORTS)
+
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,368 @@
+"""Command line interface: python -m phonebook <command>
+
+Works without a display and without tkinter. Modules are imported inside the
+commands, so a lookup only loads what it uses.
+"""
+
+import argparse
+import json
+import logging
+import sys
+
+# Columns printed for list and search results
+LIST_HEADERS = ("id", "first_name", "last_name", "phone", "email", "company")
+
+
+def open_repo(settings, write=False):
+    """Repository for a command
+
+    Write commands bring the schema up to date first. Read commands only
+    check that it is, so a lookup never writes to the database.
+    """
+    from .migrations import current_version
+    from .storage import open_repository
+
+    repo = open_repository(settings)
+    try:
+        if write:
+            repo.create_schema()
+        elif getattr(repo, "MIGRATIONS", None) is not None:
+            try:
+                version = current_version(repo)
+            except Exception:
+                # No schema_version table yet
+                version = 0
+            if version < repo.MIGRATIONS.latest:
+                raise ValueError("The database schema is not up to date, run: python -m phonebook migrate")
+    except BaseException:
+        repo.close()
+        raise
+    return repo
+
+
+def print_rows(rows, as_json):
+    """Print list rows as a tab separated table or a JSON array"""
+    if as_json:
+        print(json.dumps([dict(zip(LIST_HEADERS, row)) for row in rows], ensure_ascii=False, default=str))
+        return
+    print("\t".join(LIST_HEADERS))
+    for row in rows:
+        print("\t".join("" if value is None else str(value) for value in row))
+
+
+def print_record(record, as_json):
+    """Print a full contact record as field: value lines or a JSON object"""
+    from .storage import CONTACT_COLUMNS
+
+    contact = dict(zip(CONTACT_COLUMNS, record))
+    if as_json:
+        print(json.dumps(contact, ensure_ascii=False, default=str))
+        return
+    for column, value in contact.items():
+        print(f"{column}: {'' if value is None else value}")
+
+
+def contact_from_args(args, base=None):
+    """Contact dict from the field options, over the values of base"""
+    from .storage import CONTACT_FIELDS
+
+    contact = dict(base or {})
+    for field in CONTACT_FIELDS:
+        value = getattr(args, field, None)
+        if value is not None:
+            contact[field] = value.strip()
+    return contact
+
+
+def criteria_from_args(args):
+    """Search criteria from the search options"""
+    return {"first_name": args.first_name, "last_name": args.last_name, "phone": args.phone}
+
+
+def list_command(args, settings):
+    """Print contacts in list order"""
+    repo = open_repo(settings)
+    try:
+        print_rows(repo.fetch_at({}, args.offset, args.limit), args.json)
+    finally:
+        repo.close()
+    return 0
+
+
+def search_command(args, settings):
+    """Print contacts matching the search options"""
+    repo = open_repo(settings)
+    try:
+        criteria = criteria_from_args(args)
+        if args.fuzzy:
+            rows = repo.search_fuzzy(args.text, criteria, args.limit)
+        elif args.text:
+            rows = repo.search_text(args.text, criteria, args.limit)
+        else:
+            rows = repo.fetch_at(criteria, args.offset, args.limit)
+        print_rows(rows, args.json)
+    finally:
+        repo.close()
+    return 0
+
+
+def get_command(args, settings):
+    """Print one contact by id, or the contact a phone number belongs to"""
+    repo = open_repo(settings)
+    try:
+        record = repo.lookup_by_phone(args.id) if args.phone_number else repo.get(int(args.id))
+    finally:
+        repo.close()
+    if not record:
+        print(f"Contact {args.id} not found", file=sys.stderr)
+        return 1
+    print_record(record, args.json)
+    return 0
+
+
+def add_command(args, settings):
+    """Add a contact and print its id"""
+    from .importer import validate_contact
+
+    contact = contact_from_args(args)
+    reason = validate_contact(contact)
+    if reason:
+        print(reason, file=sys.stderr)
+        return 2
+    repo = open_repo(settings, write=True)
+    try:
+        print(repo.add(contact))
+    finally:
+        repo.close()
+    return 0
+
+
+def update_command(args, settings):
+    """Change the given fields of a contact"""
+    from .importer import validate_contact
+    from .storage import CONTACT_COLUMNS, CONTACT_FIELDS
+
+    repo = open_repo(settings, write=True)
+    try:
+        record = repo.get(args.id)
+        if not record:
+            print(f"Contact {args.id} not found", file=sys.stderr)
+            return 1
+        current = {field: value for field, value in zip(CONTACT_COLUMNS, record) if field in CONTACT_FIELDS}
+        contact = contact_from_args(args, current)
+        reason = validate_contact(contact)
+        if reason:
+            print(reason, file=sys.stderr)
+            return 2
+        repo.update(args.id, contact)
+    finally:
+        repo.close()
+    return 0
+
+
+def delete_command(args, settings):
+    """Delete contacts by id"""
+    repo = open_repo(settings, write=True)
+    status = 0
+    try:
+        for contact_id in args.ids:
+            if repo.get(contact_id) is None:
+                print(f"Contact {contact_id} not found", file=sys.stderr)
+                status = 1
+                continue
+            repo.delete(contact_id)
+    finally:
+        repo.close()
+    return status
+
+
+def progress_printer(done, total):
+    """Progress callback that rewrites one line on stderr"""
+    def progress(report):
+        end = "\n" if report.finished else ""
+        print(f"\r{done(report)}/{total(report)}", end=end, file=sys.stderr, flush=True)
+
+    return progress
+
+
+def import_command(args, settings):
+    """Import contacts from a CSV or vCard file"""
+    from .importer import import_contacts
+
+    repo = open_repo(settings, write=True)
+    try:
+        report = import_contacts(repo, args.path, args.format, args.batch_size or settings["import_batch_size"],
+                                 progress=None if args.quiet else progress_printer(lambda r: r.bytes_read,
+                                                                                   lambda r: r.total_bytes))
+    finally:
+        repo.close()
+    print(report.summary())
+    for line, reason in report.rejected:
+        print(f"Line {line}: {reason}", file=sys.stderr)
+    return 0
+
+
+def export_command(args, settings):
+    """Stream contacts to a CSV, vCard or JSON Lines file"""
+    from .exporter import export_contacts
+
+    repo = open_repo(settings)
+    try:
+        report = export_contacts(repo, args.path, args.format, criteria_from_args(args), compress=args.gzip,
+                                 chunk_size=args.chunk_size or settings["export_chunk_size"],
+                                 progress=None if args.quiet else progress_printer(lambda r: r.exported,
+                                                                                   lambda r: r.total))
+    finally:
+        repo.close()
+    print(report.summary())
+    return 0
+
+
+def duplicates_command(args, settings):
+    """Print groups of contacts that are probably the same person"""
+    from .storage import CONTACT_COLUMNS
+
+    threshold = settings["dedupe_threshold"] if args.threshold is None else args.threshold
+    workers = settings["dedupe_workers"] if args.workers is None else args.workers
+    repo = open_repo(settings)
+    try:
+        groups = repo.find_duplicates(threshold, workers)
+    finally:
+        repo.close()
+    if args.json:
+        print(json.dumps([{"score": round(group.score, 3),
+                           "contacts": [dict(zip(CONTACT_COLUMNS, record)) for record in group.records]}
+                          for group in groups], ensure_ascii=False, default=str))
+        return 0
+    for number, group in enumerate(groups, 1):
+        print(f"Group {number} (score {group.score:.2f})")
+        for record in group.records:
+            print("\t".join("" if value is None else str(value) for value in record[:len(LIST_HEADERS)]))
+    return 0
+
+
+def migrate_command(args, settings):
+    """Create the schema or apply the migrations it is missing"""
+    from .migrations import current_version
+
+    repo = open_repo(settings, write=True)
+    try:
+        version = current_version(repo) if getattr(repo, "MIGRATIONS", None) is not None else None
+    finally:
+        repo.close()
+    if version is not None:
+        print(f"Schema at version {version}")
+    return 0
+
+
+def serve_command(args, settings):
+    """Run the HTTP/JSON API server"""
+    from .server import serve
+
+    serve(settings, args.host, args.port)
+    return 0
+
+
+def add_search_options(parser):
+    parser.add_argument("--first-name", default="", help="first name contains this")
+    parser.add_argument("--last-name", default="", help="last name contains this")
+    parser.add_argument("--phone", default="", help="phone contains these digits")
+
+
+def add_contact_options(parser, required):
+    for field, required_field in (("first_name", True), ("last_name", True), ("phone", True), ("email", False),
+                                  ("address", False), ("company", False), ("notes", False)):
+        parser.add_argument(f"--{field.replace('_', '-')}", dest=field, required=required and required_field)
+
+
+def build_parser():
+    """Argument parser with one subcommand per command"""
+    parser = argparse.ArgumentParser(prog="python -m phonebook", description="Phone book without the GUI")
+    parser.add_argument("--config", help="settings file (default: phonebook.json)")
+    parser.add_argument("-v", "--verbose", action="store_true", help="log progress to stderr")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    command = commands.add_parser("list", help="list contacts in name order")
+    command.add_argument("--limit", type=int, default=100)
+    command.add_argument("--offset", type=int, default=0)
+    command.add_argument("--json", action="store_true", help="print JSON")
+    command.set_defaults(handler=list_command)
+
+    command = commands.add_parser("search", help="search contacts")
+    add_search_options(command)
+    command.add_argument("--text", default="", help="ranked search over all fields")
+    command.add_argument("--fuzzy", action="store_true", help="match names and text words by how they sound")
+    command.add_argument("--limit", type=int, default=100)
+    command.add_argument("--offset", type=int, default=0)
+    command.add_argument("--json", action="store_true", help="print JSON")
+    command.set_defaults(handler=search_command)
+
+    command = commands.add_parser("get", help="show one contact")
+    command.add_argument("id", help="contact id, or a phone number with --phone-number")
+    command.add_argument("--phone-number", action="store_true", help="look the contact up by phone number")
+    command.add_argument("--json", action="store_true", help="print JSON")
+    command.set_defaults(handler=get_command)
+
+    command = commands.add_parser("add", help="add a contact and print its id")
+    add_contact_options(command, required=True)
+    command.set_defaults(handler=add_command)
+
+    command = commands.add_parser("update", help="change fields of a contact")
+    command.add_argument("id", type=int)
+    add_contact_options(command, required=False)
+    command.set_defaults(handler=update_command)
+
+    command = commands.add_parser("delete", help="delete contacts")
+    command.add_argument("ids", type=int, nargs="+", metavar="id")
+    command.set_defaults(handler=delete_command)
+
+    command = commands.add_parser("import", help="import contacts from CSV or vCard")
+    command.add_argument("path")
+    command.add_argument("--format", choices=("csv", "vcf", "vcard"), help="file format (default: from the extension)")
+    command.add_argument("--batch-size", type=int, help="rows per insert batch (default: import_batch_size)")
+    command.add_argument("-q", "--quiet", action="store_true", help="no progress output")
+    command.set_defaults(handler=import_command)
+
+    command = commands.add_parser("export", help="export contacts to CSV, vCard or JSON Lines")
+    command.add_argument("path", help="output file, .csv/.vcf/.jsonl with optional .gz")
+    command.add_argument("--format", choices=("csv", "json", "jsonl", "ndjson", "vcard", "vcf"),
+                         help="file format (default: from the extension)")
+    command.add_argument("--gzip", action="store_true", default=None, help="compress the output")
+    add_search_options(command)
+    command.add_argument("--chunk-size", type=int, help="rows fetched per round trip (default: export_chunk_size)")
+    command.add_argument("-q", "--quiet", action="store_true", help="no progress output")
+    command.set_defaults(handler=export_command)
+
+    command = commands.add_parser("duplicates", help="find contacts that are probably the same person")
+    command.add_argument("--threshold", type=float, help="score from 0 to 1 (default: dedupe_threshold)")
+    command.add_argument("--workers", type=int,
+                         help="comparing processes, 0 for one per CPU up to 4 (default: dedupe_workers)")
+    command.add_argument("--json", action="store_true", help="print JSON")
+    command.set_defaults(handler=duplicates_command)
+
+    command = commands.add_parser("migrate", help="create or upgrade the database schema")
+    command.set_defaults(handler=migrate_command)
+
+    command = commands.add_parser("serve", help="share the database over an HTTP/JSON API")
+    command.add_argument("--host", help="address to listen on (default: api_host)")
+    command.add_argument("--port", type=int, help="port to listen on (default: api_port)")
+    command.set_defaults(handler=serve_command)
+    return parser
+
+
+def main(argv=None):
+    """Run a command line command"""
+    from .config import load_settings
+
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING,
+                        format="%(asctime)s - %(levelname)s - %(message)s")
+    try:
+        return args.handler(args, load_settings(args.config))
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
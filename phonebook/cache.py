@@ -0,0 +1,79 @@
+"""In-memory cache of contact records
+
+Selecting a row shows the record of the contact and editing it fills the
+form from the same record. Both read this cache first, so moving through
+the list only queries the database for contacts that were not prefetched.
+Records read for browsing are headers with only the start of long notes;
+the edit form reads the full record when the cached one is cut short.
+The cache is only used from the UI thread.
+"""
+
+from collections import OrderedDict
+
+
+class ContactCache:
+    """LRU cache of contact records (CONTACT_COLUMNS or HEADER_COLUMNS tuples) by id"""
+
+    def __init__(self, max_entries=2000):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, contact_id):
+        """Cached record, or None"""
+        record = self.entries.get(contact_id)
+        if record is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(contact_id)
+        self.hits += 1
+        return record
+
+    def missing(self, contact_ids):
+        """Ids that are not cached, without counting hits or misses"""
+        return [contact_id for contact_id in contact_ids if contact_id not in self.entries]
+
+    def put(self, record, generation=None):
+        """Cache a record - ignored if the cache was invalidated since generation"""
+        self.put_many([record], generation)
+
+    def put_many(self, records, generation=None):
+        """Cache several records - ignored if the cache was invalidated since generation"""
+        if generation is not None and generation != self.generation:
+            return
+        for record in records:
+            if record:
+                self.entries[record[0]] = tuple(record)
+                self.entries.move_to_end(record[0])
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def discard(self, contact_id):
+        """Forget one contact after it was changed or deleted
+
+        Records fetched before this are not stored afterwards, they may be
+        stale.
+        """
+        self.entries.pop(contact_id, None)
+        self.generation += 1
+
+    def clear(self):
+        """Forget every contact after a bulk change"""
+        self.entries.clear()
+        self.generation += 1
+
+    @property
+    def hit_rate(self):
+        """Fraction of lookups answered from the cache"""
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self):
+        """Counters for logs and diagnostics"""
+        return {"entries": len(self.entries), "hits": self.hits, "misses": self.misses,
+                "hit_rate": round(self.hit_rate, 3)}
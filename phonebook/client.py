@@ -0,0 +1,286 @@
+"""Repository backed by the phonebook API server instead of a database
+
+Select it with "backend": "http" and point "api_url" at a running server
+(python -m phonebook serve). It has the same methods as ContactRepository,
+so the desktop application, the importer, the exporter and the command line
+work unchanged. Each instance keeps one keep-alive connection, asks for gzip
+and revalidates the GET responses it has seen with If-None-Match, so an
+unchanged page costs an empty 304.
+"""
+
+import gzip
+import http.client
+import json
+from collections import OrderedDict
+from urllib.parse import urlencode, urlsplit
+
+from .dedupe import DuplicateGroup
+from .paging import ContactPageSource
+from .storage import CONTACT_FIELDS, NOTES_CHUNK_SIZE
+
+
+class ApiError(Exception):
+    """Error response from the API server"""
+
+    def __init__(self, status, message):
+        super().__init__(f"{message} (HTTP {status})")
+        self.status = status
+
+
+def _query(criteria, **params):
+    """Query string parameters for criteria plus extra parameters that are set"""
+    params = {name: value for name, value in params.items() if value is not None}
+    params.update((field, value) for field, value in (criteria or {}).items()
+                  if field != "text" and value)
+    return params
+
+
+class HttpContactRepository:
+    """Contacts stored behind the phonebook API server"""
+
+    ETAG_CACHE_SIZE = 64
+
+    # Most ids the server accepts or returns per request (its MAX_LIMIT)
+    MAX_IDS = 10000
+
+    def __init__(self, base_url, timeout=30.0):
+        url = urlsplit(base_url)
+        if url.scheme not in ("http", "https"):
+            raise ValueError(f"Unsupported API url: {base_url}")
+        self.scheme = url.scheme
+        self.netloc = url.netloc
+        self.prefix = url.path.rstrip("/")
+        self.timeout = timeout
+        self.conn = None
+        self.etags = OrderedDict()
+
+    @classmethod
+    def connect(cls, settings):
+        repo = cls(settings["api_url"], settings["api_timeout"])
+        repo.ping()
+        return repo
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+        self.etags.clear()
+
+    def ping(self):
+        """Raise if the server does not answer"""
+        self.request("GET", "/health")
+
+    def commit(self):
+        """Every request is committed by the server"""
+
+    def rollback(self):
+        """Every request is committed by the server"""
+
+    def create_schema(self):
+        """The server migrates its schema at startup"""
+        self.ping()
+
+    def request(self, method, path, params=None, body=None):
+        """Send a request and return the decoded JSON response"""
+        url = self.prefix + path + ("?" + urlencode(params) if params else "")
+        headers = {"Accept": "application/json", "Accept-Encoding": "gzip"}
+        cached = self.etags.get(url) if method == "GET" else None
+        if cached:
+            headers["If-None-Match"] = cached[0]
+        data = None
+        if body is not None:
+            data = json.dumps(body, default=str).encode()
+            headers["Content-Type"] = "application/json"
+
+        # A kept-alive connection may have been closed by the server in the
+        # meantime; POST is not repeated because it may have been applied
+        attempts = 1 if method == "POST" else 2
+        for attempt in range(attempts):
+            if self.conn is None:
+                connection = http.client.HTTPSConnection if self.scheme == "https" else http.client.HTTPConnection
+                self.conn = connection(self.netloc, timeout=self.timeout)
+            try:
+                self.conn.request(method, url, body=data, headers=headers)
+                response = self.conn.getresponse()
+                content = response.read()
+                break
+            except (http.client.HTTPException, OSError):
+                self.conn.close()
+                self.conn = None
+                if attempt == attempts - 1:
+                    raise
+
+        if response.status == 304 and cached:
+            self.etags.move_to_end(url)
+            return cached[1]
+        if response.getheader("Content-Encoding") == "gzip":
+            content = gzip.decompress(content)
+        payload = json.loads(content) if content else {}
+        if response.status >= 400:
+            raise ApiError(response.status, payload.get("error") or response.reason)
+
+        etag = response.getheader("ETag")
+        if method == "GET" and etag:
+            self.etags[url] = (etag, payload)
+            self.etags.move_to_end(url)
+            while len(self.etags) > self.ETAG_CACHE_SIZE:
+                self.etags.popitem(last=False)
+        return payload
+
+    def rows(self, path, params):
+        """List rows of a GET response as tuples"""
+        return [tuple(row) for row in self.request("GET", path, params)["rows"]]
+
+    def count(self, criteria=None):
+        return self.request("GET", "/contacts/count", _query(criteria))["count"]
+
+    def fetch_at(self, criteria, offset, limit, sort=None):
+        return self.rows("/contacts", _query(criteria, offset=offset, limit=limit, sort=sort))
+
+    def fetch_after(self, criteria, key, limit, sort=None):
+        return self.rows("/contacts", _query(criteria, after=json.dumps(list(key)), limit=limit, sort=sort))
+
+    def fetch_before(self, criteria, key, limit, sort=None):
+        return self.rows("/contacts", _query(criteria, before=json.dumps(list(key)), limit=limit, sort=sort))
+
+    def search_text(self, text, criteria=None, limit=200):
+        return self.rows("/contacts/search", _query(criteria, text=text, limit=limit))
+
+    def search_fuzzy(self, text, criteria=None, limit=200):
+        return self.rows("/contacts/fuzzy", _query(criteria, text=text, limit=limit))
+
+    def lookup_by_phone(self, number):
+        try:
+            return tuple(self.request("GET", "/contacts/lookup", {"phone": number})["contact"])
+        except ApiError as e:
+            if e.status == 404:
+                return None
+            raise
+
+    def iter_contacts(self, criteria=None, ids=None, chunk_size=1000, sort=None):
+        """Yield full records in the order of sort, or in the order of ids"""
+        if ids is None:
+            source = ContactPageSource(criteria, sort)
+            key = None
+            while True:
+                rows = (source.fetch_after(self, key, chunk_size) if key
+                        else source.fetch_at(self, 0, chunk_size))
+                if not rows:
+                    return
+                yield from self.iter_contacts(ids=[row[0] for row in rows], chunk_size=chunk_size)
+                key = source.key(rows[-1])
+
+        ids = list(ids)
+        for start in range(0, len(ids), chunk_size):
+            chunk = ids[start:start + chunk_size]
+            records = self.request("POST", "/contacts/batch", body={"ids": chunk})["contacts"]
+            yield from (tuple(record) for record in records)
+
+    def iter_headers(self, ids, chunk_size=1000):
+        """Yield contact headers in the order of ids"""
+        ids = list(ids)
+        for start in range(0, len(ids), chunk_size):
+            chunk = ids[start:start + chunk_size]
+            records = self.request("POST", "/contacts/headers", body={"ids": chunk})["contacts"]
+            yield from (tuple(record) for record in records)
+
+    def get_header(self, contact_id):
+        return next(self.iter_headers([contact_id]), None)
+
+    def read_notes(self, contact_id, offset=0, limit=NOTES_CHUNK_SIZE):
+        try:
+            return self.request("GET", f"/contacts/{contact_id}/notes", {"offset": offset, "limit": limit})["notes"]
+        except ApiError as e:
+            if e.status == 404:
+                return None
+            raise
+
+    def changed_since(self, since=None, after_id=0, limit=1000):
+        records = self.request("GET", "/contacts/changes", _query(None, since=since, after=after_id, limit=limit))
+        return [tuple(record) for record in records["contacts"]]
+
+    def contact_ids(self, after_id=0, limit=10000, criteria=None):
+        return self.request("GET", "/contacts/ids", _query(criteria, after=after_id, limit=limit))["ids"]
+
+    def change_token(self):
+        return self.request("GET", "/contacts/feed")["token"]
+
+    def changes_since(self, token, limit=1000):
+        try:
+            result = self.request("GET", "/contacts/feed", {"token": token, "limit": limit})
+        except ApiError as e:
+            if e.status == 410:
+                return None
+            raise
+        return result["token"], [(contact_id, tuple(old_row) if old_row else None, tuple(record) if record else None)
+                                 for contact_id, old_row, record in result["changes"]]
+
+    def find_duplicates(self, threshold=0.75, workers=1):
+        """Groups of probable duplicates, found by the server with its own workers"""
+        groups = self.request("GET", "/contacts/duplicates", {"threshold": threshold})["groups"]
+        return [DuplicateGroup([tuple(record) for record in group["contacts"]], group["score"]) for group in groups]
+
+    def find_similar(self, contact, threshold=0.75, exclude_id=None, limit=5):
+        body = {"contact": {field: contact.get(field) for field in CONTACT_FIELDS},
+                "threshold": threshold, "exclude": exclude_id, "limit": limit}
+        matches = self.request("POST", "/contacts/similar", body=body)["matches"]
+        return [(tuple(match["contact"]), match["score"]) for match in matches]
+
+    def get(self, contact_id):
+        try:
+            return tuple(self.request("GET", f"/contacts/{contact_id}")["contact"])
+        except ApiError as e:
+            if e.status == 404:
+                return None
+            raise
+
+    def add(self, contact):
+        return self.request("POST", "/contacts", body={field: contact.get(field) for field in CONTACT_FIELDS})["id"]
+
+    def add_many(self, contacts):
+        if not contacts:
+            return 0
+        body = {"contacts": [{field: contact.get(field) for field in CONTACT_FIELDS} for contact in contacts]}
+        return self.request("POST", "/contacts/bulk", body=body)["added"]
+
+    def update(self, contact_id, contact):
+        try:
+            self.request("PUT", f"/contacts/{contact_id}", body={field: contact.get(field) for field in CONTACT_FIELDS})
+        except ApiError as e:
+            if e.status == 404:
+                return False
+            raise
+        return True
+
+    def merge(self, keep_id, merged_ids, contact):
+        body = {"keep": keep_id, "merge": list(merged_ids),
+                "contact": {field: contact.get(field) for field in CONTACT_FIELDS}}
+        try:
+            self.request("POST", "/contacts/merge", body=body)
+        except ApiError as e:
+            if e.status == 404:
+                return False
+            raise
+        return True
+
+    def delete(self, contact_id):
+        try:
+            self.request("DELETE", f"/contacts/{contact_id}")
+        except ApiError as e:
+            if e.status == 404:
+                return False
+            raise
+        return True
+
+    def update_many(self, ids, values):
+        """One request, and so one transaction, per MAX_IDS ids"""
+        ids = list(ids)
+        return sum(self.request("POST", "/contacts/update", body={"ids": ids[start:start + self.MAX_IDS],
+                                                                  "values": values})["updated"]
+                   for start in range(0, len(ids), self.MAX_IDS))
+
+    def delete_many(self, ids):
+        """One request, and so one transaction, per MAX_IDS ids"""
+        ids = list(ids)
+        return sum(self.request("POST", "/contacts/delete", body={"ids": ids[start:start + self.MAX_IDS]})["deleted"]
+                   for start in range(0, len(ids), self.MAX_IDS))
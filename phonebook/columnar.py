@@ -0,0 +1,430 @@
+"""Compact in-memory copy of the contact list for filtering without the database
+
+ContactStore keeps the list columns of every contact column by column
+instead of as one tuple of strings per row: the ids in an array, and every
+text column as one string of its values separated by NUL characters, an
+array of where each value starts and an array with the code (value number)
+of every row. Rows that have the same first name, last name or company share
+one value. A million contacts take about 85 MB this way, against about
+275 MB as tuples even with the repeated names shared, and the size depends
+only on the number and length of the values.
+
+A search finds the values containing a term with str.find over the text of
+a column, once per distinct value rather than once per row, then selects the
+rows with those codes using map, int.from_bytes and compress, which loop in
+C. Rows are kept in id order; the ids of all rows in the current list order,
+and the codes of the searched columns in that order, are cached and patched
+by binary search when contacts change, so a search is a filter over them.
+"""
+
+import bisect
+import re
+import sys
+import threading
+from array import array
+from itertools import accumulate, compress
+
+from .paging import ContactPageSource, sort_key
+from .phones import digits_only
+from .search import normalize_criteria
+from .storage import LIST_COLUMNS, sort_columns
+
+# Values added to a column before they are moved into its text
+MAX_ADDED_VALUES = 10000
+
+# Most changes patched into the cached list order, it is sorted again after more
+MAX_PATCHED_ROWS = 100
+
+_NON_DIGITS = re.compile(r"[^\d\0]")
+
+
+def _starts(text):
+    """Where each value of a NUL-separated text starts, and where the next one would"""
+    if len(text) == 1:
+        return array("I", [1])
+    return array("I", accumulate((len(value) + 1 for value in text[1:-1].split("\0")), initial=1))
+
+
+class Column:
+    """Text column kept as one string of its values and a code per row
+
+    The values are stored in ``text`` separated by NUL characters, code n
+    being the n-th value; ``starts`` has the offset of each. Values added
+    after the last compaction wait in ``added`` as separate strings.
+    """
+
+    __slots__ = ("text", "starts", "added", "added_codes", "shared", "codes", "folded", "digits")
+
+    def __init__(self):
+        self.text = "\0"
+        self.starts = array("I", [1])
+        self.added = []
+        self.added_codes = {}
+        # Rows with the same value share its code, until the column turns
+        # out to be mostly distinct values (e-mail addresses, phone numbers)
+        self.shared = True
+        self.codes = array("I")
+        # (text, starts) of the case-folded values and of their digits, built on first use
+        self.folded = None
+        self.digits = None
+
+    def __len__(self):
+        return len(self.starts) - 1 + len(self.added)
+
+    def encode(self, value):
+        """Code of a value, adding it if it is new"""
+        value = (value or "").replace("\0", "")
+        code = self.added_codes.get(value)
+        if code is None and self.shared:
+            position = self.text.find(f"\0{value}\0")
+            if position >= 0:
+                code = bisect.bisect_left(self.starts, position + 1)
+        if code is None:
+            code = len(self)
+            self.added.append(value)
+            if self.shared:
+                self.added_codes[value] = code
+        return code
+
+    def value(self, code):
+        """Value of a code"""
+        stored = len(self.starts) - 1
+        if code >= stored:
+            return self.added[code - stored]
+        return self.text[self.starts[code]:self.starts[code + 1] - 1]
+
+    def check_shared(self):
+        """Stop sharing values once at least half of the rows have their own"""
+        if self.shared and len(self.codes) >= 1000 and len(self) > len(self.codes) // 2:
+            self.shared = False
+            self.added_codes.clear()
+
+    def compact(self):
+        """Move the added values into the text"""
+        if not self.added:
+            return
+        self.starts.pop()
+        self.starts.extend(accumulate((len(value) + 1 for value in self.added), initial=len(self.text)))
+        self.text += "\0".join(self.added) + "\0"
+        self.added = []
+        self.added_codes = {}
+        self.folded = self.digits = None
+
+    def derived(self, digits=False):
+        """(text, starts) of the case-folded values, or of their digits"""
+        if digits:
+            if self.digits is None:
+                text = _NON_DIGITS.sub("", self.text)
+                self.digits = (text, _starts(text))
+            return self.digits
+        if self.folded is None:
+            text = self.text.casefold()
+            if text == self.text:
+                self.folded = (self.text, self.starts)
+            else:
+                # Case folding never shortens a character, equal lengths mean equal offsets
+                self.folded = (text, self.starts if len(text) == len(self.text) else _starts(text))
+        return self.folded
+
+    def matching(self, term, digits=False):
+        """Mask, one byte per code, of the values containing a normalized search term"""
+        text, starts = self.derived(digits)
+        stored = len(starts) - 1
+        if stored and text.count(term) > stored // 8:
+            # Matches nearly everywhere, test every value
+            mask = bytearray(term in value for value in text[1:-1].split("\0"))
+        else:
+            mask = bytearray(stored)
+            position = text.find(term)
+            while position >= 0:
+                code = bisect.bisect_right(starts, position) - 1
+                mask[code] = 1
+                position = text.find(term, starts[code + 1])
+        mask.extend(term in (digits_only(value) if digits else value.casefold()) for value in self.added)
+        return mask
+
+    def row_ranks(self):
+        """Position of every row's value in the case-insensitive list order, equal values sharing one"""
+        text, starts = self.derived()
+        folded = text[1:-1].split("\0") if len(starts) > 1 else []
+        folded += [value.casefold() for value in self.added]
+        ranks = array("I", bytes(4 * len(folded)))
+        rank, previous = -1, None
+        for code in sorted(range(len(folded)), key=folded.__getitem__):
+            if folded[code] != previous:
+                rank, previous = rank + 1, folded[code]
+            ranks[code] = rank
+        return array("I", map(ranks.__getitem__, self.codes))
+
+
+class ContactStore:
+    """List rows of every contact, column by column"""
+
+    def __init__(self):
+        self.ids = array("q")
+        self.columns = {column: Column() for column in LIST_COLUMNS[1:]}
+        self.orders = {}
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def load(cls, repo, page_size=10000):
+        """Store of every contact of a repository, read in keyset pages"""
+        store = cls()
+        source = ContactPageSource()
+        rows = source.fetch_at(repo, 0, page_size)
+        while rows:
+            store.ids.extend(row[0] for row in rows)
+            for position, column in enumerate(store.columns.values(), 1):
+                column.codes.extend(column.encode(row[position]) for row in rows)
+                column.check_shared()
+                if not column.shared and len(column.added) >= MAX_ADDED_VALUES:
+                    column.compact()
+            rows = source.fetch_after(repo, source.key(rows[-1]), page_size)
+        for column in store.columns.values():
+            column.compact()
+        store.sort_by_id()
+        return store
+
+    def sort_by_id(self):
+        """Put the rows in id order after loading them in another"""
+        permutation = sorted(range(len(self.ids)), key=self.ids.__getitem__)
+        self.ids = array("q", map(self.ids.__getitem__, permutation))
+        for column in self.columns.values():
+            column.codes = array("I", map(column.codes.__getitem__, permutation))
+
+    def index(self, contact_id):
+        """Row index of a contact, or None"""
+        index = bisect.bisect_left(self.ids, contact_id)
+        return index if index < len(self.ids) and self.ids[index] == contact_id else None
+
+    def row_at(self, index):
+        """List row at a row index"""
+        return (self.ids[index],) + tuple(column.value(column.codes[index]) for column in self.columns.values())
+
+    def row(self, contact_id):
+        """List row of a contact, or None"""
+        with self.lock:
+            index = self.index(contact_id)
+            return None if index is None else self.row_at(index)
+
+    def rows(self, contact_ids):
+        """List rows of contacts, in the given order, skipping unknown ids"""
+        rows = (self.row(contact_id) for contact_id in contact_ids)
+        return [row for row in rows if row is not None]
+
+    def put(self, row):
+        """Add or replace the list row of a contact"""
+        self.apply({row[0]: row})
+
+    def remove(self, contact_id):
+        """Forget a deleted contact"""
+        self.apply({contact_id: None})
+
+    def apply(self, changes):
+        """Add, replace or remove contacts, {contact id: list row, or None if deleted}
+
+        The cached list order is patched row by row with binary searches when
+        there are at most MAX_PATCHED_ROWS changes, and dropped otherwise, so
+        a large batch costs one sort on the next search.
+        """
+        with self.lock:
+            patched = None
+            if self.orders and len(changes) <= MAX_PATCHED_ROWS:
+                # New arrays, searches may have returned the cached ones
+                (sort, (ids, indexes, codes)), = self.orders.items()
+                patched = [sort, array("q", ids), array("I", indexes),
+                           {column: array("I", values) for column, values in codes.items()}]
+            self.orders = {}
+            for contact_id, row in changes.items():
+                index = self.index(contact_id)
+                if index is not None and patched:
+                    self.unplace(patched, index)
+                if row is None:
+                    if index is not None:
+                        del self.ids[index]
+                        for column in self.columns.values():
+                            del column.codes[index]
+                        if patched:
+                            patched[2] = array("I", (i - (i > index) for i in patched[2]))
+                    continue
+                if index is None:
+                    index = bisect.bisect_left(self.ids, contact_id)
+                    self.ids.insert(index, contact_id)
+                    for column, value in zip(self.columns.values(), row[1:]):
+                        column.codes.insert(index, column.encode(value))
+                    if patched:
+                        patched[2] = array("I", (i + (i >= index) for i in patched[2]))
+                else:
+                    for column, value in zip(self.columns.values(), row[1:]):
+                        column.codes[index] = column.encode(value)
+                if patched:
+                    self.place(patched, index)
+            for column in self.columns.values():
+                if len(column.added) >= MAX_ADDED_VALUES:
+                    column.compact()
+            if patched:
+                self.orders = {patched[0]: tuple(patched[1:])}
+
+    def order_position(self, patched, row):
+        """Position of a list row in an order being patched - binary search"""
+        sort, _, indexes, _ = patched
+        key = sort_key(row, sort)
+        low, high = 0, len(indexes)
+        while low < high:
+            middle = (low + high) // 2
+            if sort_key(self.row_at(indexes[middle]), sort) < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def unplace(self, patched, index):
+        """Take the row at a row index out of an order being patched"""
+        _, ids, indexes, codes = patched
+        position = self.order_position(patched, self.row_at(index))
+        if position >= len(ids) or ids[position] != self.ids[index]:
+            position = ids.index(self.ids[index])
+        del ids[position]
+        del indexes[position]
+        for values in codes.values():
+            del values[position]
+
+    def place(self, patched, index):
+        """Put the row at a row index into an order being patched"""
+        _, ids, indexes, codes = patched
+        position = self.order_position(patched, self.row_at(index))
+        ids.insert(position, self.ids[index])
+        indexes.insert(position, index)
+        for column, values in codes.items():
+            values.insert(position, self.columns[column].codes[index])
+
+    def order(self, sort=None):
+        """(ids, row indexes, {column: codes}) of all rows in a list order, cached and patched by apply"""
+        order = self.orders.get(sort)
+        if order is not None:
+            return order
+        columns, descending = sort_columns(sort)
+        # Rows are in id order, the stable sorts below keep it among equal values
+        indexes = list(range(len(self.ids)))
+        if descending:
+            indexes.reverse()
+        for column in reversed(columns):
+            if column != "id":
+                indexes.sort(key=self.columns[column].row_ranks().__getitem__, reverse=descending)
+        order = (array("q", map(self.ids.__getitem__, indexes)), array("I", indexes), {})
+        self.orders = {sort: order}
+        return order
+
+    def ordered_codes(self, column, sort=None):
+        """Codes of a column in a list order"""
+        _, indexes, codes = self.order(sort)
+        if column not in codes:
+            codes[column] = array("I", map(self.columns[column].codes.__getitem__, indexes))
+        return codes[column]
+
+    def search(self, criteria=None, sort=None):
+        """Ids of the contacts matching field criteria, in the order of sort - do not modify
+
+        Terms match anywhere in the field, case-insensitively, and phone
+        numbers by their digits, like the database search.
+        """
+        with self.lock:
+            ids = self.order(sort)[0]
+            selected = None
+            for field, term in normalize_criteria(criteria or {}):
+                if field == "text":
+                    continue
+                mask = self.columns[field].matching(term, digits=field == "phone" and term.isdigit())
+                # A byte per row, read as one big integer so that terms are combined with a single "and"
+                rows = int.from_bytes(bytes(map(mask.__getitem__, self.ordered_codes(field, sort))), "little")
+                selected = rows if selected is None else selected & rows
+            if selected is None:
+                return ids
+            return array("q", compress(ids, selected.to_bytes(len(ids), "little")))
+
+    def memory_size(self):
+        """Approximate bytes used by the arrays and strings"""
+        objects = {id(self.ids): self.ids}
+        for column in self.columns.values():
+            for value in (column.text, column.starts, column.codes, column.added, column.added_codes,
+                          *column.added, *(column.folded or ()), *(column.digits or ())):
+                objects[id(value)] = value
+        return sum(map(sys.getsizeof, objects.values()))
+
+
+class StorePageSource(ContactPageSource):
+    """Field search answered from a ContactStore instead of the database
+
+    The result is kept as an array of ids in list order and the rows of a
+    page are read from the store. The repository passed in is not used.
+    """
+
+    # Most row positions remembered to continue from the last page served
+    MAX_SERVED = 5000
+
+    def __init__(self, store, criteria=None, sort=None):
+        super().__init__(criteria, sort)
+        self.store = store
+        self.ids = array("q")
+        self.served = {}
+
+    def page(self, start, end):
+        """Rows at positions [start, end), remembering where they are"""
+        start = max(start, 0)
+        ids = self.ids[start:end]
+        if len(self.served) > self.MAX_SERVED:
+            self.served.clear()
+        self.served.update((contact_id, start + index) for index, contact_id in enumerate(ids))
+        return self.store.rows(ids)
+
+    def position(self, contact_id):
+        """Position of a contact in the result, or None"""
+        index = self.served.get(contact_id)
+        if index is not None and index < len(self.ids) and self.ids[index] == contact_id:
+            return index
+        try:
+            return self.ids.index(contact_id)
+        except ValueError:
+            return None
+
+    def apply_change(self, contact_id, new_row):
+        """Move a changed contact - the store already has its new row, the ids are copied as the store may share them"""
+        ids = array("q", self.ids)
+        index = self.position(contact_id)
+        if index is not None:
+            del ids[index]
+        if new_row is not None:
+            key = self.sort_key(new_row)
+            low, high = 0, len(ids)
+            while low < high:
+                middle = (low + high) // 2
+                row = self.store.row(ids[middle])
+                if row is not None and self.sort_key(row) < key:
+                    low = middle + 1
+                else:
+                    high = middle
+            ids.insert(low, contact_id)
+        self.ids = ids
+        self.served = {}
+
+    def load(self, repo, limit):
+        self.ids = self.store.search(self.criteria, self.sort)
+        self.served = {}
+        return len(self.ids), self.page(0, limit)
+
+    def fetch_at(self, repo, offset, limit):
+        return self.page(offset, offset + limit)
+
+    def fetch_after(self, repo, key, limit):
+        index = self.position(key[-1])
+        return [] if index is None else self.page(index + 1, index + 1 + limit)
+
+    def fetch_before(self, repo, key, limit):
+        index = self.position(key[-1])
+        return [] if index is None else self.page(index - limit, index)
+
+    def all_ids(self, repo, page_size=10000):
+        return list(self.ids)
@@ -0,0 +1,133 @@
+"""Application settings
+
+Settings are read from a JSON file (``phonebook.json`` in the working
+directory, or the file named by the PHONEBOOK_CONFIG environment variable).
+Missing keys fall back to DEFAULTS, and PHONEBOOK_BACKEND overrides the
+storage backend without editing the file.
+"""
+
+import json
+import logging
+import os
+
+DEFAULTS = {
+    # "sqlserver", "sqlite", or "http" for a phonebook API server
+    "backend": "sqlserver",
+
+    # SQL Server connection
+    "driver": "SQL Server",
+    "server": "localhost",
+    "database": "phone",
+    "username": "",
+    "password": "",
+
+    # SQLite database file
+    "sqlite_path": "phonebook.db",
+
+    # Country calling code for numbers written without one, e.g. "1" or "98",
+    # used to store phone numbers in E.164 form
+    "default_country_code": "",
+
+    # Background query workers
+    "query_workers": 4,
+
+    # Live search: delay after the last keystroke, cached searches and
+    # the largest result that is loaded completely and cached
+    "search_debounce_ms": 300,
+    "search_cache_size": 32,
+    "search_cache_rows": 5000,
+
+    # Contact records kept in memory, and the rows around the selected one
+    # that are loaded ahead of time - with only the start of long notes
+    "contact_cache_size": 2000,
+    "contact_prefetch": 20,
+
+    # Characters of the notes read per request when they are shown in full
+    "notes_chunk_size": 65536,
+
+    # Connection pool shared by the query workers: connections kept open,
+    # the most open at once, seconds to wait for one, seconds a connection may
+    # sit idle before it is pinged, and the longest pause between reconnects
+    "pool_min_size": 1,
+    "pool_max_size": 4,
+    "pool_timeout": 10.0,
+    "pool_ping_interval": 30.0,
+    "pool_max_backoff": 8.0,
+
+    # Most results shown for a ranked "Any Field" search
+    "text_search_limit": 500,
+
+    # Databases with at most this many contacts are also loaded into memory
+    # and searched by field there (0 turns it off)
+    "local_store_max": 200000,
+
+    # Contacts inserted and committed together by the importer
+    "import_batch_size": 1000,
+
+    # Contacts fetched per round trip by the exporter
+    "export_chunk_size": 1000,
+
+    # Local copy of the contacts shown at startup and while the database is
+    # unreachable ("" turns it off), and the seconds between syncs
+    "snapshot_path": "phonebook-snapshot.db",
+    "snapshot_sync_interval": 300,
+
+    # Seconds between polls for changes made by other clients (0 turns it
+    # off), and days the database keeps them for clients that were away
+    "change_poll_interval": 5.0,
+    "change_log_days": 30,
+
+    # Duplicate detection: the score (0 to 1) from which two contacts are
+    # taken for the same person, and the processes comparing them, 0 for one
+    # per CPU up to 4
+    "dedupe_threshold": 0.75,
+    "dedupe_workers": 0,
+
+    # Application log ("" for the console only), rotated when it reaches
+    # log_max_bytes, or by time with log_rotate_when ("midnight", "h", ...),
+    # keeping log_backup_count old files; records are written in the
+    # background and flushed at most log_flush_interval seconds late
+    "log_path": "phonebook.log",
+    "log_max_bytes": 5000000,
+    "log_backup_count": 5,
+    "log_rotate_when": "",
+    "log_flush_interval": 1.0,
+
+    # JSON Lines audit trail of added, changed, merged and deleted contacts,
+    # off when empty, rotated like the log
+    "audit_log_path": "",
+
+    # Metrics export: a Prometheus text file rewritten every interval seconds
+    # and a StatsD server for UDP packets, both off when empty
+    "metrics_prometheus_path": "",
+    "metrics_prometheus_interval": 15.0,
+    "metrics_statsd_host": "",
+    "metrics_statsd_port": 8125,
+    "metrics_statsd_prefix": "phonebook",
+
+    # API server used by the "http" backend, and seconds to wait for it
+    "api_url": "http://127.0.0.1:8765",
+    "api_timeout": 30.0,
+
+    # Address the API server listens on (python -m phonebook serve), cached
+    # GET responses and the seconds they are served without a database query
+    "api_host": "127.0.0.1",
+    "api_port": 8765,
+    "api_cache_size": 256,
+    "api_cache_ttl": 5.0,
+}
+
+
+def load_settings(path=None):
+    """Load settings from a JSON file merged over DEFAULTS"""
+    settings = dict(DEFAULTS)
+    path = path or os.environ.get("PHONEBOOK_CONFIG", "phonebook.json")
+    if os.path.exists(path):
+        try:
+            with open(path, encoding="utf-8") as f:
+                settings.update(json.load(f))
+        except (OSError, ValueError) as e:
+            logging.error(f"Could not read settings from {path}: {e}")
+    if os.environ.get("PHONEBOOK_BACKEND"):
+        settings["backend"] = os.environ["PHONEBOOK_BACKEND"]
+    return settings
@@ -0,0 +1,249 @@
+"""Duplicate contact detection
+
+Comparing every contact with every other one is quadratic, so contacts are
+first put into blocks that share a blocking key - the same phone digits,
+the same email address, or the same phonetic key of their first and last
+name - and only contacts within a block are compared. Blocks larger than
+MAX_BLOCK, such as a very common name, are sorted and every contact is
+compared with its WINDOW neighbours instead (sorted neighbourhood).
+
+The comparisons run in a pool of spawned processes when workers > 1 -
+forking would copy the threads of the GUI and the server. Pairs scoring at
+least the threshold are joined into groups of contacts that are probably
+the same person.
+"""
+
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from .fuzzy import distance, name_words, phonetic_key
+from .phones import MIN_SUFFIX_DIGITS, digits_only
+from .storage import CONTACT_COLUMNS, CONTACT_FIELDS
+
+# Share of the score from the names, the rest from phone and email
+NAME_WEIGHT = 0.6
+
+# Blocks compared pair by pair up to this size, by sorted neighbourhood above it
+MAX_BLOCK = 200
+WINDOW = 20
+
+# Comparisons sent to a worker process at once
+TASK_COMPARISONS = 50000
+
+# Most processes started when the number of workers is left to the CPU count
+MAX_DEFAULT_WORKERS = 4
+
+
+class DuplicateGroup:
+    """Contacts that are probably the same person"""
+
+    def __init__(self, records, score):
+        self.records = records
+        self.score = score
+
+    @property
+    def ids(self):
+        return [record[0] for record in self.records]
+
+
+def profile(contact_id, contact):
+    """(id, name words, phone digits, email) compared by similarity
+
+    The name is the folded words of first and last name in sorted order,
+    so "Smith John" compares equal to "John Smith".
+    """
+    words = name_words(contact.get("first_name")) + name_words(contact.get("last_name"))
+    return (contact_id, tuple(sorted(words)), digits_only(contact.get("phone")),
+            (contact.get("email") or "").strip().casefold())
+
+
+def record_profile(record):
+    """profile of a full contact record"""
+    return profile(record[0], dict(zip(CONTACT_COLUMNS, record)))
+
+
+def name_key(first_name, last_name, keys=None):
+    """Blocking key of a name: the phonetic keys of its first words, in sorted order
+
+    keys maps known words to their phonetic key, usually the name_words table.
+    """
+    parts = []
+    for name in (first_name, last_name):
+        words = name_words(name)
+        if words:
+            parts.append((keys or {}).get(words[0]) or phonetic_key(words[0]))
+    return " ".join(sorted(parts))
+
+
+def name_similarity(a, b):
+    """Similarity of two names as word tuples, that of the worst matching word of the shorter one
+
+    Every word must be close to some word of the other name, so "Jane Smith"
+    is not taken for "Jon Smith" because their last names agree.
+    """
+    if not a or not b:
+        return 0.0
+    if a == b:
+        return 1.0
+    if len(a) > len(b):
+        a, b = b, a
+    return min(max(1 - distance(x, y) / max(len(x), len(y)) for y in b) for x in a)
+
+
+def similarity(a, b, threshold=0.0):
+    """Score from 0 to 1 of two profiles being the same person
+
+    The names are only compared when the score could still reach threshold,
+    0.0 is returned otherwise.
+    """
+    contact = 0.0
+    if a[2] and a[2] == b[2]:
+        contact = 1.0
+    elif len(a[2]) >= MIN_SUFFIX_DIGITS and a[2][-MIN_SUFFIX_DIGITS:] == b[2][-MIN_SUFFIX_DIGITS:]:
+        # The same number with and without a country or area code
+        contact = 0.9
+    if a[3] and a[3] == b[3]:
+        contact = 1.0
+    if NAME_WEIGHT + (1 - NAME_WEIGHT) * contact < threshold:
+        return 0.0
+    return NAME_WEIGHT * name_similarity(a[1], b[1]) + (1 - NAME_WEIGHT) * contact
+
+
+def compare_block(profiles, threshold):
+    """(score, id, id) of the pairs in a block scoring at least threshold"""
+    pairs = []
+    if len(profiles) <= MAX_BLOCK:
+        for i, a in enumerate(profiles):
+            for b in profiles[i + 1:]:
+                score = similarity(a, b, threshold)
+                if score >= threshold:
+                    pairs.append((score, a[0], b[0]))
+        return pairs
+
+    ordered = sorted(profiles, key=lambda p: (p[1], p[2], p[0]))
+    for i, a in enumerate(ordered):
+        for b in ordered[i + 1:i + 1 + WINDOW]:
+            score = similarity(a, b, threshold)
+            if score >= threshold:
+                pairs.append((score, min(a[0], b[0]), max(a[0], b[0])))
+    return pairs
+
+
+def compare_blocks(blocks, threshold):
+    """compare_block over a list of blocks - the unit of work of a worker process"""
+    pairs = []
+    for profiles in blocks:
+        pairs += compare_block(profiles, threshold)
+    return pairs
+
+
+def comparisons(size):
+    """Number of comparisons compare_block makes for a block of size profiles"""
+    return size * (size - 1) // 2 if size <= MAX_BLOCK else size * WINDOW
+
+
+def tasks(blocks):
+    """Blocks split into lists of about TASK_COMPARISONS comparisons"""
+    task, work = [], 0
+    for block in blocks:
+        task.append(block)
+        work += comparisons(len(block))
+        if work >= TASK_COMPARISONS:
+            yield task
+            task, work = [], 0
+    if task:
+        yield task
+
+
+def group_pairs(pairs):
+    """Connected groups of the pair ids, each with the best score of its pairs"""
+    parent = {}
+
+    def root(node):
+        while parent.setdefault(node, node) != node:
+            parent[node] = parent[parent[node]]
+            node = parent[node]
+        return node
+
+    for _, a, b in pairs:
+        parent[root(a)] = root(b)
+    members = {}
+    best = {}
+    for score, a, b in pairs:
+        group = root(a)
+        members.setdefault(group, set()).update((a, b))
+        best[group] = max(best.get(group, 0.0), score)
+    return [(sorted(ids), best[group]) for group, ids in members.items()]
+
+
+def find_duplicates(repo, threshold=0.75, workers=1):
+    """Groups of probable duplicates in the whole table, most certain first
+
+    workers is the number of processes comparing blocks, 0 for one per CPU
+    up to MAX_DEFAULT_WORKERS.
+    """
+    started = time.perf_counter()
+    blocks = [block for block in repo.duplicate_blocks() if len(block) > 1]
+    ids = sorted({contact_id for block in blocks for contact_id in block})
+    records = {record[0]: record for record in repo.iter_contacts(ids=ids)}
+    profiles = {contact_id: record_profile(record) for contact_id, record in records.items()}
+    blocks = [[profiles[contact_id] for contact_id in block if contact_id in profiles] for block in blocks]
+
+    workers = workers or min(os.cpu_count() or 1, MAX_DEFAULT_WORKERS)
+    work = list(tasks(blocks))
+    pairs = {}
+    if workers > 1 and len(work) > 1:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+            results = list(executor.map(compare_blocks, work, [threshold] * len(work)))
+    else:
+        results = [compare_blocks(task, threshold) for task in work]
+    for result in results:
+        for score, a, b in result:
+            key = (min(a, b), max(a, b))
+            pairs[key] = max(pairs.get(key, 0.0), score)
+
+    groups = [DuplicateGroup([records[contact_id] for contact_id in members], score)
+              for members, score in group_pairs([(score, a, b) for (a, b), score in pairs.items()])]
+    groups.sort(key=lambda group: (-group.score, group.ids))
+    logging.info(f"Found {len(groups)} duplicate groups in {len(blocks)} blocks of {len(ids)} contacts "
+                 f"in {time.perf_counter() - started:.2f} s")
+    return groups
+
+
+def find_similar(repo, contact, threshold=0.75, exclude_id=None, limit=5):
+    """(record, score) of existing contacts a contact dict probably duplicates, best first
+
+    Candidates come from index lookups on the phone digits, the email address
+    and the phonetic name index, so no table scan is needed.
+    """
+    candidate_ids = set(repo.blocking_candidates(contact))
+    candidate_ids.discard(exclude_id)
+    new = profile(None, contact)
+    scored = []
+    for record in repo.iter_contacts(ids=sorted(candidate_ids)):
+        score = similarity(new, record_profile(record), threshold)
+        if score >= threshold:
+            scored.append((-score, record[0], record))
+    scored.sort()
+    return [(record, -score) for score, _, record in scored[:limit]]
+
+
+def merged_contact(records, keep_id):
+    """Contact dict of the kept record, with its empty fields filled from the others
+
+    Notes that differ are all kept, one after another.
+    """
+    ordered = sorted(records, key=lambda record: record[0] != keep_id)
+    values = [dict(zip(CONTACT_COLUMNS, record)) for record in ordered]
+    contact = {field: values[0].get(field) or "" for field in CONTACT_FIELDS}
+    for other in values[1:]:
+        for field in CONTACT_FIELDS:
+            if field != "notes" and not contact[field] and other.get(field):
+                contact[field] = other[field]
+        notes = (other.get("notes") or "").strip()
+        if notes and notes not in contact["notes"]:
+            contact["notes"] = f"{contact['notes']}\n\n{notes}".strip()
+    return contact
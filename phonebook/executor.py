@@ -0,0 +1,167 @@
+"""Background query executor
+
+Database calls are run on a small pool of worker threads so a slow server
+round-trip never blocks the Tk event loop. Every task checks a repository
+(and with it a connection) out of a ConnectionPool and returns it when done.
+Finished results are put on a queue which the UI thread drains with
+``poll()`` (usually scheduled with ``root.after``), so callbacks always run
+on the thread that owns the widgets.
+
+With a Metrics registry every task records how long it waited in the queue
+and for a connection, how long the query ran, the time from submit until
+its result was delivered, and how long the UI callback took - per
+operation name, so a slow database can be told apart from a slow UI.
+"""
+
+import logging
+import queue
+import threading
+import time
+
+
+class QueryHandle:
+    """Handle of a submitted query, used to cancel it"""
+
+    def __init__(self, key=None, name=None):
+        self.key = key
+        self.name = name or key or "query"
+        self.submitted = time.perf_counter()
+        self.cancelled = False
+
+    def cancel(self):
+        """Cancel the query - it is skipped if not started yet and its result is dropped otherwise"""
+        self.cancelled = True
+
+
+class QueryExecutor:
+    """Run database work on worker threads with repositories from a pool"""
+
+    def __init__(self, pool, workers=4, metrics=None):
+        self.pool = pool
+        self.metrics = metrics
+        self.tasks = queue.Queue()
+        self.results = queue.Queue()
+        self.latest = {}
+        self.lock = threading.Lock()
+        self.threads = []
+        for number in range(workers):
+            thread = threading.Thread(target=self._worker, name=f"query-worker-{number}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def submit(self, func, *args, on_success=None, on_error=None, key=None, name=None):
+        """Queue func(repository, *args) for a worker thread
+
+        Callbacks are called with the result or the exception from poll().
+        Submitting a query with the same key as an unfinished one cancels the
+        older query, e.g. a newer search makes a running search obsolete.
+        Timings are recorded under name, which defaults to the key.
+        """
+        handle = QueryHandle(key, name)
+        if key is not None:
+            with self.lock:
+                previous = self.latest.get(key)
+                if previous is not None:
+                    previous.cancel()
+                self.latest[key] = handle
+        self.tasks.put((handle, func, args, on_success, on_error))
+        return handle
+
+    def cancel(self, key):
+        """Cancel the latest unfinished query submitted with key"""
+        with self.lock:
+            handle = self.latest.pop(key, None)
+        if handle is not None:
+            handle.cancel()
+
+    def _worker(self):
+        """Worker thread loop"""
+        while True:
+            task = self.tasks.get()
+            if task is None:
+                break
+            handle, func, args, on_success, on_error = task
+            if handle.cancelled:
+                self._count("queries_cancelled_total", handle)
+                continue
+            started = time.perf_counter()
+            try:
+                repo = self.pool.acquire()
+            except Exception as e:
+                logging.error(f"Database connection error: {e}")
+                self._count("query_errors_total", handle)
+                self.results.put((handle, (on_error, e)))
+                continue
+            acquired = time.perf_counter()
+            broken = False
+            try:
+                result = func(repo, *args)
+                outcome = (on_success, result)
+            except Exception as e:
+                logging.error(f"Query error: {e}")
+                self._count("query_errors_total", handle)
+                broken = not self._recover(repo)
+                outcome = (on_error, e)
+            finally:
+                self.pool.release(repo, broken)
+            if self.metrics:
+                self.metrics.observe("queue_wait_seconds", started - handle.submitted, handle.name)
+                self.metrics.observe("pool_wait_seconds", acquired - started, handle.name)
+                self.metrics.observe("query_seconds", time.perf_counter() - acquired, handle.name)
+            self.results.put((handle, outcome))
+
+    def _count(self, name, handle):
+        if self.metrics:
+            self.metrics.increment(name, handle.name)
+
+    @staticmethod
+    def _recover(repo):
+        """Roll back after a failed query - False if the connection is broken"""
+        try:
+            repo.rollback()
+            return True
+        except Exception:
+            return False
+
+    def poll(self):
+        """Deliver finished results - must be called from the UI thread"""
+        while True:
+            try:
+                handle, (callback, value) = self.results.get_nowait()
+            except queue.Empty:
+                break
+            if handle.key is not None:
+                with self.lock:
+                    if self.latest.get(handle.key) is handle:
+                        del self.latest[handle.key]
+            if handle.cancelled:
+                self._count("queries_cancelled_total", handle)
+                continue
+            started = time.perf_counter()
+            if self.metrics:
+                self.metrics.observe("fetch_seconds", started - handle.submitted, handle.name)
+            if callback is None:
+                continue
+            try:
+                callback(value)
+            except Exception as e:
+                logging.error(f"Query callback error: {e}")
+            if self.metrics:
+                self.metrics.observe("callback_seconds", time.perf_counter() - started, handle.name)
+
+    def start_polling(self, root, interval=30):
+        """Poll for results every interval milliseconds on the Tk event loop"""
+        def tick():
+            self.poll()
+            root.after(interval, tick)
+
+        root.after(interval, tick)
+
+    def shutdown(self, timeout=5.0):
+        """Stop the worker threads after the queued tasks are done and close the pool"""
+        for _ in self.threads:
+            self.tasks.put(None)
+        deadline = time.monotonic() + timeout
+        for thread in self.threads:
+            thread.join(max(deadline - time.monotonic(), 0))
+        self.pool.close()
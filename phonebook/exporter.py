@@ -0,0 +1,193 @@
+"""Streaming export of contacts to CSV, vCard and JSON Lines
+
+Contacts are read from the repository in fetchmany chunks and written out
+one record at a time, so memory use stays flat however many contacts are
+exported. A path ending in .gz is written gzip-compressed.
+"""
+
+import csv
+import gzip
+import json
+import logging
+import os
+import time
+
+from .storage import CONTACT_COLUMNS
+
+# vCard lines longer than this many octets are folded
+VCARD_LINE_LENGTH = 75
+
+
+class ExportReport:
+    """Progress and outcome of an export"""
+
+    def __init__(self, total=0):
+        self.total = total
+        self.exported = 0
+        self.started = time.perf_counter()
+        self.finished = None
+        self.cancel_requested = False
+
+    @property
+    def elapsed(self):
+        """Seconds since the export started"""
+        return (self.finished or time.perf_counter()) - self.started
+
+    @property
+    def rows_per_second(self):
+        """Export throughput"""
+        return self.exported / self.elapsed if self.elapsed else 0.0
+
+    def summary(self):
+        """One-line description for logs and dialogs"""
+        return (f"Exported {self.exported} contacts in {self.elapsed:.1f}s "
+                f"({self.rows_per_second:.0f} rows/s)")
+
+
+def _text(value):
+    """Column value as text"""
+    return "" if value is None else str(value)
+
+
+class CsvWriter:
+    """Contacts as CSV with a header row, readable by the importer"""
+
+    def __init__(self, f):
+        self.writer = csv.writer(f)
+        self.writer.writerow(CONTACT_COLUMNS)
+
+    def write(self, row):
+        self.writer.writerow([_text(value) for value in row])
+
+    def close(self):
+        pass
+
+
+def _escape(value):
+    """vCard text escaping"""
+    return (_text(value).replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,")
+            .replace("\r\n", "\\n").replace("\n", "\\n"))
+
+
+def _fold(line):
+    """Fold a vCard line into pieces of at most VCARD_LINE_LENGTH octets"""
+    if len(line) * 4 <= VCARD_LINE_LENGTH or len(line.encode("utf-8")) <= VCARD_LINE_LENGTH:
+        return line + "\r\n"
+    pieces = []
+    current = ""
+    size = 0
+    for char in line:
+        length = len(char.encode("utf-8"))
+        if size + length > VCARD_LINE_LENGTH:
+            pieces.append(current)
+            current, size = " ", 1
+        current += char
+        size += length
+    pieces.append(current)
+    return "\r\n".join(pieces) + "\r\n"
+
+
+class VcardWriter:
+    """Contacts as vCard 3.0 cards, readable by the importer"""
+
+    def __init__(self, f):
+        self.f = f
+
+    def write(self, row):
+        contact = dict(zip(CONTACT_COLUMNS, row))
+        first, last = _escape(contact["first_name"]), _escape(contact["last_name"])
+        lines = ["BEGIN:VCARD", "VERSION:3.0", f"N:{last};{first};;;", f"FN:{first} {last}".strip()]
+        if contact["phone"]:
+            lines.append(f"TEL;TYPE=VOICE:{_escape(contact['phone'])}")
+        if contact["email"]:
+            lines.append(f"EMAIL;TYPE=INTERNET:{_escape(contact['email'])}")
+        if contact["address"]:
+            lines.append(f"ADR:;;{_escape(contact['address'])};;;;")
+        if contact["company"]:
+            lines.append(f"ORG:{_escape(contact['company'])}")
+        if contact["notes"]:
+            lines.append(f"NOTE:{_escape(contact['notes'])}")
+        lines.append("END:VCARD")
+        self.f.write("".join(_fold(line) for line in lines))
+
+    def close(self):
+        pass
+
+
+class JsonLinesWriter:
+    """Contacts as one JSON object per line"""
+
+    def __init__(self, f):
+        self.f = f
+
+    def write(self, row):
+        record = {column: (value if value is None or isinstance(value, (int, str)) else str(value))
+                  for column, value in zip(CONTACT_COLUMNS, row)}
+        self.f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def close(self):
+        pass
+
+
+WRITERS = {
+    "csv": CsvWriter,
+    "vcf": VcardWriter,
+    "vcard": VcardWriter,
+    "jsonl": JsonLinesWriter,
+    "ndjson": JsonLinesWriter,
+    "json": JsonLinesWriter,
+}
+
+
+def detect_format(path):
+    """File format from the file extension, ignoring a trailing .gz"""
+    name = path[:-3] if path.lower().endswith(".gz") else path
+    extension = os.path.splitext(name)[1].lower().lstrip(".")
+    if extension not in WRITERS:
+        raise ValueError(f"Unsupported export format: {extension or path}")
+    return extension
+
+
+def open_output(path, compress=None):
+    """Text file for writing, gzip-compressed for .gz paths or when compress is set"""
+    if compress is None:
+        compress = path.lower().endswith(".gz")
+    if compress:
+        return gzip.open(path, "wt", encoding="utf-8", newline="")
+    return open(path, "w", encoding="utf-8", newline="")
+
+
+def export_contacts(repo, path, file_format=None, criteria=None, ids=None, compress=None,
+                    chunk_size=1000, report=None, progress=None, sort=None):
+    """Export contacts matching criteria in the order of sort, or the contacts in ids, to a file
+
+    progress is called with the report after every chunk. Setting
+    report.cancel_requested stops the export after the current chunk and
+    leaves the partial file in place.
+    """
+    writer_class = WRITERS[file_format or detect_format(path)]
+    report = report or ExportReport()
+    if ids is not None:
+        ids = list(ids)
+        report.total = len(ids)
+    else:
+        report.total = repo.count(criteria)
+
+    with open_output(path, compress) as f:
+        writer = writer_class(f)
+        for row in repo.iter_contacts(criteria, ids, chunk_size, sort):
+            writer.write(row)
+            report.exported += 1
+            if report.exported % chunk_size == 0:
+                if progress:
+                    progress(report)
+                if report.cancel_requested:
+                    break
+        writer.close()
+
+    report.finished = time.perf_counter()
+    if progress:
+        progress(report)
+    logging.info(f"{report.summary()} to {path}")
+    return report
+
@@ -0,0 +1,159 @@
+"""Fuzzy name matching with precomputed phonetic keys
+
+Every word of a contact's first and last name is stored accent-folded
+("José" -> "jose") in the ``contact_names`` side table, and every distinct
+spelling once in ``name_words`` together with its phonetic key, a
+Metaphone-style code in which spellings that sound alike collide ("Jon",
+"John" and "Jhon" are all "jn"; "Mohamad", "Mohammed" and "Muhammad" are
+all "mhmt"). A fuzzy search looks up the spellings that share the key of
+each query word, keeps those within a few edits of it, finds the contacts
+through the index on the spelling and ranks them by edit distance.
+"""
+
+import re
+import unicodedata
+
+from .textindex import FIELD_CODES
+
+# Name fields that are indexed, stored with their trigram index field codes
+NAME_FIELDS = ("first_name", "last_name")
+
+# Letters NFKD does not decompose into a base letter and accents
+_FOLDED_LETTERS = str.maketrans({
+    "ø": "o", "đ": "d", "ł": "l", "ħ": "h", "ı": "i", "þ": "th", "æ": "ae", "œ": "oe",
+})
+
+_WORD = re.compile(r"[^\W\d_]+")
+
+_VOWELS = "aeiouy"
+
+# Applied in order to a folded word, after its first letters are simplified
+_RULES = [(re.compile(pattern), replacement) for pattern, replacement in (
+    ("x", "ks"),
+    ("sch", "sk"),
+    ("[cs]h", "x"),
+    ("ph", "f"),
+    ("th", "t"),
+    ("(?<!^)gh", ""),
+    ("ck", "k"),
+    ("c(?=[eiy])", "s"),
+    ("c", "k"),
+    ("dg(?=[eiy])", "j"),
+    ("g(?=[eiy])", "j"),
+    ("q", "k"),
+    ("z", "s"),
+    ("v", "f"),
+    ("d", "t"),
+    ("w(?![aeiou])", ""),
+    # H is only sounded at the start or between vowels
+    ("(?<=.)h(?![aeiouy])|(?<![aeiouy])(?<=.)h", ""),
+)]
+
+# Silent or simplified first letters
+_PREFIXES = (("kn", "n"), ("gn", "n"), ("pn", "n"), ("wr", "r"), ("ps", "s"), ("wh", "w"), ("x", "s"))
+
+
+def fold(text):
+    """Case-folded text without accents"""
+    if (text or "").isascii():
+        return (text or "").lower()
+    text = unicodedata.normalize("NFKD", (text or "").casefold().translate(_FOLDED_LETTERS))
+    return "".join(char for char in text if not unicodedata.combining(char))
+
+
+def name_words(text):
+    """Folded words of a name, "Mary-Ann" -> ["mary", "ann"]"""
+    return _WORD.findall(fold(text))
+
+
+def phonetic_key(word):
+    """Code shared by spellings that sound alike
+
+    A simplified Metaphone for Latin letters: consonant groups are reduced to
+    the sound they make, vowels after the first letter are dropped and
+    repeated sounds collapse. Words in other scripts are their own key.
+    """
+    word = fold(word)
+    if not word.isascii():
+        return word
+    for prefix, replacement in _PREFIXES:
+        if word.startswith(prefix):
+            word = replacement + word[len(prefix):]
+            break
+    for pattern, replacement in _RULES:
+        word = pattern.sub(replacement, word)
+    if not word:
+        return ""
+    key = "a" if word[0] in _VOWELS else word[0]
+    for char in word[1:]:
+        if char not in _VOWELS and char != key[-1]:
+            key += char
+    return key
+
+
+def distance(a, b, limit=None):
+    """Edit distance, counting a swap of two neighbouring letters as one edit
+
+    With a limit, any distance above it is returned as limit + 1, which stops
+    the comparison of very different words early.
+    """
+    if a == b:
+        return 0
+    if limit is not None and abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i] + [0] * len(b)
+        for j, char_b in enumerate(b, 1):
+            cost = char_a != char_b
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if (previous2 is not None and i > 1 and j > 1
+                    and char_a == b[j - 2] and a[i - 2] == char_b):
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if limit is not None and min(current) > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+def max_distance(word):
+    """Most edits a spelling with the same key may be away from a query word"""
+    return max(2, len(word) // 2)
+
+
+def index_rows(contact_id, contact):
+    """(word, field code, contact id) rows to store for a contact dict"""
+    return sorted({(word, FIELD_CODES[field], contact_id)
+                   for field in NAME_FIELDS
+                   for word in name_words(contact.get(field))})
+
+
+def vocabulary(rows):
+    """(word, phonetic key) of the distinct words of index rows"""
+    return [(word, phonetic_key(word)) for word in sorted({row[0] for row in rows})]
+
+
+def query_terms(criteria):
+    """(field, word) pairs of the name criteria; words of the text criterion match either name"""
+    terms = []
+    for field in NAME_FIELDS + ("text",):
+        terms += [(field if field != "text" else None, word)
+                  for word in name_words((criteria or {}).get(field))]
+    return terms
+
+
+def rank(first_name, last_name, terms, spellings):
+    """Total edit distance of a contact to the query terms, None if a term does not match
+
+    spellings holds the accepted spellings of each term, mapped to their distance.
+    """
+    words = {"first_name": name_words(first_name), "last_name": name_words(last_name)}
+    total = 0
+    for (field, _), accepted in zip(terms, spellings):
+        candidates = words[field] if field else words["first_name"] + words["last_name"]
+        best = min((accepted[word] for word in candidates if word in accepted), default=None)
+        if best is None:
+            return None
+        total += best
+    return total
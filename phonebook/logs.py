@@ -0,0 +1,233 @@
+"""Logging that does not block the UI thread, and the audit trail
+
+``setup_logging`` replaces the synchronous file and console handlers with a
+QueueHandler: a log call only puts the record on a queue, and a LogWriter
+thread writes it to the rotating log file and the console. The writer
+flushes once per batch of records rather than after each one, at the latest
+log_flush_interval seconds after a record arrived.
+
+The optional audit trail (the "audit_log_path" setting) is a JSON Lines file
+with one line per contact that was added, changed, merged or deleted: when,
+by which user on which host, and the fields before and after. ``audit``
+queues the records like any log call, the line is put together on the
+writer thread.
+"""
+
+import getpass
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import socket
+import threading
+import time
+from datetime import datetime
+
+from .storage import CONTACT_COLUMNS
+
+# Logger of the audit trail, kept out of the application log
+AUDIT_LOGGER = "phonebook.audit"
+
+LOG_FORMAT = "%(asctime)s - %(levelname)s - %(message)s"
+
+# Most records written between two flushes
+FLUSH_BATCH_SIZE = 500
+
+# Columns that are not compared in the audit trail, the dates change on every write
+_UNAUDITED = {"id", "created_date", "modified_date"}
+
+_STOP = object()
+
+
+class _BatchFlush:
+    """Handler mixin leaving the flushing of the stream to the LogWriter"""
+
+    def flush(self):
+        """Flushed by flush_batch instead of after every record"""
+
+    def flush_batch(self):
+        super().flush()
+
+
+class RotatingFileHandler(_BatchFlush, logging.handlers.RotatingFileHandler):
+    """Log file rotated by size, flushed per batch
+
+    The standard handler seeks to the end of the stream before every record
+    to learn the file size, which flushes the stream each time. The size is
+    read once here and then counted as records are written.
+    """
+
+    size = None
+    record_size = 0
+
+    def shouldRollover(self, record):
+        if self.maxBytes <= 0:
+            return False
+        if self.size is None:
+            # Never rotate anything other than regular files, e.g. /dev/null
+            if os.path.exists(self.baseFilename) and not os.path.isfile(self.baseFilename):
+                return False
+            if self.stream is None:
+                self.stream = self._open()
+            self.stream.seek(0, 2)
+            self.size = self.stream.tell()
+        self.record_size = len(f"{self.format(record)}{self.terminator}".encode(self.encoding or "utf-8"))
+        return self.size + self.record_size >= self.maxBytes
+
+    def doRollover(self):
+        super().doRollover()
+        self.size = 0
+
+    def emit(self, record):
+        super().emit(record)
+        if self.size is not None:
+            self.size += self.record_size
+
+
+class TimedRotatingFileHandler(_BatchFlush, logging.handlers.TimedRotatingFileHandler):
+    """Log file rotated by time, flushed per batch"""
+
+
+class StreamHandler(_BatchFlush, logging.StreamHandler):
+    """Console output, flushed per batch"""
+
+
+class AuditFormatter(logging.Formatter):
+    """JSON line of an audit record"""
+
+    def __init__(self):
+        super().__init__()
+        self.user = getpass.getuser()
+        self.host = socket.gethostname()
+
+    def format(self, record):
+        old, new = (dict(zip(CONTACT_COLUMNS, contact)) if contact else {}
+                    for contact in (record.old_record, record.new_record))
+        changes = {column: [old.get(column), new.get(column)] for column in CONTACT_COLUMNS
+                   if column not in _UNAUDITED and old.get(column) != new.get(column)}
+        return json.dumps({
+            "time": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "user": self.user,
+            "host": self.host,
+            "action": record.action,
+            "contact_id": record.contact_id,
+            "changes": changes,
+            **record.details,
+        }, ensure_ascii=False, default=str)
+
+
+class LogWriter:
+    """Background thread writing queued log records to handlers
+
+    Records are handled as they arrive; the handlers are flushed when
+    FLUSH_BATCH_SIZE records were written or flush_interval seconds after
+    the first unflushed one, whichever comes first.
+    """
+
+    def __init__(self, records, handlers, flush_interval=1.0):
+        self.records = records
+        self.handlers = handlers
+        self.flush_interval = flush_interval
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Write and flush the records queued so far, then close the handlers"""
+        if self.thread is not None:
+            self.records.put(_STOP)
+            self.thread.join()
+            self.thread = None
+        for handler in self.handlers:
+            handler.close()
+
+    def flush(self):
+        for handler in self.handlers:
+            if isinstance(handler, _BatchFlush):
+                handler.flush_batch()
+
+    def _run(self):
+        unflushed = 0
+        deadline = None
+        while True:
+            try:
+                record = self.records.get(timeout=max(deadline - time.monotonic(), 0) if unflushed else None)
+            except queue.Empty:
+                record = None
+            if record is not None and record is not _STOP:
+                for handler in self.handlers:
+                    if record.levelno >= handler.level:
+                        handler.handle(record)
+                if not unflushed:
+                    deadline = time.monotonic() + self.flush_interval
+                unflushed += 1
+            if unflushed and (record is None or record is _STOP or unflushed >= FLUSH_BATCH_SIZE
+                              or time.monotonic() >= deadline):
+                self.flush()
+                unflushed = 0
+            if record is _STOP:
+                return
+
+
+def _file_handler(path, settings):
+    """Log file handler rotated by time if log_rotate_when is set, by size otherwise"""
+    if settings["log_rotate_when"]:
+        return TimedRotatingFileHandler(path, when=settings["log_rotate_when"],
+                                        backupCount=settings["log_backup_count"], encoding="utf-8")
+    return RotatingFileHandler(path, maxBytes=settings["log_max_bytes"], backupCount=settings["log_backup_count"],
+                               encoding="utf-8")
+
+
+def setup_logging(settings, level=logging.INFO):
+    """Send the log, and the audit trail if configured, through a background writer - returns the started LogWriter"""
+    records = queue.SimpleQueue()
+    formatter = logging.Formatter(LOG_FORMAT)
+    handlers = []
+    if settings["log_path"]:
+        handlers.append(_file_handler(settings["log_path"], settings))
+    handlers.append(StreamHandler())
+    for handler in handlers:
+        handler.setFormatter(formatter)
+        handler.addFilter(lambda record: record.name != AUDIT_LOGGER)
+
+    audit_logger = logging.getLogger(AUDIT_LOGGER)
+    audit_logger.propagate = False
+    audit_logger.handlers.clear()
+    if settings["audit_log_path"]:
+        audit_handler = _file_handler(settings["audit_log_path"], settings)
+        audit_handler.setFormatter(AuditFormatter())
+        audit_handler.addFilter(logging.Filter(AUDIT_LOGGER))
+        handlers.append(audit_handler)
+        audit_logger.addHandler(logging.handlers.QueueHandler(records))
+        audit_logger.setLevel(logging.INFO)
+    else:
+        audit_logger.setLevel(logging.CRITICAL + 1)
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+        handler.close()
+    root.addHandler(logging.handlers.QueueHandler(records))
+    root.setLevel(level)
+
+    writer = LogWriter(records, handlers, settings["log_flush_interval"])
+    writer.start()
+    return writer
+
+
+def audit(action, contact_id, old_record=None, new_record=None, **details):
+    """Add a change of a contact to the audit trail, if there is one
+
+    action is "add", "update", "merge" or "delete"; old_record and
+    new_record are the full records before and after, None if the contact
+    did not exist. details are added to the JSON line as they are.
+    """
+    logger = logging.getLogger(AUDIT_LOGGER)
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(f"Contact {contact_id}: {action}", extra={
+            "action": action, "contact_id": contact_id, "old_record": old_record, "new_record": new_record,
+            "details": details,
+        })
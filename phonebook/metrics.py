@@ -0,0 +1,242 @@
+"""In-process metrics for the hot paths
+
+Timings go into histograms with fixed buckets, one per metric name and
+operation (for example query_seconds for "search"), and events into
+counters. Gauges are functions evaluated when the metrics are read, so
+cache and pool statistics are always current without being pushed.
+
+Metrics can be exported two ways, both optional:
+
+- a Prometheus text file rewritten every few seconds, for the node
+  exporter's textfile collector
+- StatsD over UDP, one timing or counter packet per observation
+"""
+
+import logging
+import math
+import os
+import socket
+import threading
+import time
+from collections import deque
+
+# Histogram bucket upper bounds in seconds
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Recent samples kept per histogram for exact percentiles in the UI
+RECENT_SAMPLES = 512
+
+
+class Histogram:
+    """Bucketed distribution of timings, plus the most recent samples"""
+
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.recent = deque(maxlen=RECENT_SAMPLES)
+
+    def observe(self, seconds):
+        index = 0
+        while index < len(BUCKETS) and seconds > BUCKETS[index]:
+            index += 1
+        self.buckets[index] += 1
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+        self.recent.append(seconds)
+
+    def percentile(self, fraction):
+        """Nearest-rank percentile of the recent samples, 0.0 without samples"""
+        if not self.recent:
+            return 0.0
+        ordered = sorted(self.recent)
+        rank = math.ceil(round(fraction * len(ordered), 9))
+        return ordered[min(max(rank - 1, 0), len(ordered) - 1)]
+
+    def summary(self):
+        """Count and latencies in milliseconds"""
+        return {
+            "count": self.count,
+            "mean_ms": round(1000 * self.sum / self.count, 3) if self.count else 0.0,
+            "p50_ms": round(1000 * self.percentile(0.50), 3),
+            "p95_ms": round(1000 * self.percentile(0.95), 3),
+            "p99_ms": round(1000 * self.percentile(0.99), 3),
+            "max_ms": round(1000 * self.max, 3),
+        }
+
+
+class StatsdClient:
+    """Fire-and-forget StatsD sender"""
+
+    def __init__(self, host, port=8125, prefix="phonebook"):
+        self.address = (host, port)
+        self.prefix = prefix
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.setblocking(False)
+
+    def send(self, line):
+        try:
+            self.socket.sendto(f"{self.prefix}.{line}".encode(), self.address)
+        except OSError:
+            pass
+
+    def timing(self, name, seconds):
+        self.send(f"{name}:{seconds * 1000:.3f}|ms")
+
+    def increment(self, name, value=1):
+        self.send(f"{name}:{value}|c")
+
+    def close(self):
+        self.socket.close()
+
+
+class Metrics:
+    """Thread-safe registry of histograms, counters and gauges"""
+
+    def __init__(self, statsd=None):
+        self.histograms = {}
+        self.counters = {}
+        self.gauges = {}
+        self.statsd = statsd
+        self.lock = threading.Lock()
+        self.exporter = None
+
+    def observe(self, name, seconds, operation=""):
+        """Record a duration in seconds"""
+        with self.lock:
+            histogram = self.histograms.get((name, operation))
+            if histogram is None:
+                histogram = self.histograms[(name, operation)] = Histogram()
+            histogram.observe(seconds)
+        if self.statsd:
+            self.statsd.timing(f"{name}.{operation}" if operation else name, seconds)
+
+    def timer(self, name, operation=""):
+        """Context manager that observes the time spent in its block"""
+        return _Timer(self, name, operation)
+
+    def increment(self, name, operation="", value=1):
+        """Add to a counter"""
+        with self.lock:
+            self.counters[(name, operation)] = self.counters.get((name, operation), 0) + value
+        if self.statsd:
+            self.statsd.increment(f"{name}.{operation}" if operation else name, value)
+
+    def gauge(self, name, func):
+        """Register func() as the current value of name, a number or a dict of numbers"""
+        self.gauges[name] = func
+
+    def read_gauges(self):
+        """Current gauge values, skipping gauges that fail"""
+        values = {}
+        for name, func in list(self.gauges.items()):
+            try:
+                values[name] = func()
+            except Exception as e:
+                logging.debug(f"Gauge {name} failed: {e}")
+        return values
+
+    def snapshot(self):
+        """Everything as plain data, for the performance panel and logs"""
+        with self.lock:
+            histograms = {key: histogram.summary() for key, histogram in self.histograms.items()}
+            counters = dict(self.counters)
+        return {"histograms": histograms, "counters": counters, "gauges": self.read_gauges()}
+
+    def prometheus_text(self, namespace="phonebook"):
+        """Metrics in the Prometheus text exposition format"""
+        lines = []
+        with self.lock:
+            histograms = sorted(self.histograms.items())
+            counters = sorted(self.counters.items())
+            for name in sorted({name for (name, _), _ in histograms}):
+                lines.append(f"# TYPE {namespace}_{name} histogram")
+                for (metric, operation), histogram in histograms:
+                    if metric != name:
+                        continue
+                    label = f'operation="{operation}",' if operation else ""
+                    cumulative = 0
+                    for bound, count in zip(BUCKETS + ("+Inf",), histogram.buckets):
+                        cumulative += count
+                        lines.append(f'{namespace}_{name}_bucket{{{label}le="{bound}"}} {cumulative}')
+                    labels = f"{{{label.rstrip(',')}}}" if label else ""
+                    lines.append(f"{namespace}_{name}_sum{labels} {histogram.sum:.6f}")
+                    lines.append(f"{namespace}_{name}_count{labels} {histogram.count}")
+            for name in sorted({name for (name, _), _ in counters}):
+                lines.append(f"# TYPE {namespace}_{name} counter")
+                for (metric, operation), value in counters:
+                    if metric == name:
+                        labels = f'{{operation="{operation}"}}' if operation else ""
+                        lines.append(f"{namespace}_{name}{labels} {value}")
+        for name, value in sorted(self.read_gauges().items()):
+            values = value if isinstance(value, dict) else {"": value}
+            for field, number in sorted(values.items()):
+                if isinstance(number, (int, float)) and not isinstance(number, bool):
+                    metric = f"{namespace}_{name}_{field}" if field else f"{namespace}_{name}"
+                    lines.append(f"# TYPE {metric} gauge")
+                    lines.append(f"{metric} {number}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path):
+        """Replace the text file atomically, so the collector never reads half of it"""
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.write(self.prometheus_text())
+        os.replace(temp_path, path)
+
+    def start_export(self, path, interval=15.0):
+        """Rewrite the Prometheus text file every interval seconds in the background"""
+        stop = threading.Event()
+
+        def export():
+            while not stop.wait(interval):
+                self._export(path)
+
+        self.exporter = (stop, path)
+        threading.Thread(target=export, name="metrics-export", daemon=True).start()
+
+    def _export(self, path):
+        try:
+            self.write_prometheus(path)
+        except OSError as e:
+            logging.warning(f"Could not write metrics to {path}: {e}")
+
+    def close(self):
+        """Stop exporting after a final write"""
+        if self.exporter:
+            stop, path = self.exporter
+            stop.set()
+            self._export(path)
+            self.exporter = None
+        if self.statsd:
+            self.statsd.close()
+
+
+class _Timer:
+    __slots__ = ("metrics", "name", "operation", "started")
+
+    def __init__(self, metrics, name, operation):
+        self.metrics = metrics
+        self.name = name
+        self.operation = operation
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.observe(self.name, time.perf_counter() - self.started, self.operation)
+
+
+def create_metrics(settings):
+    """Metrics with the exporters enabled in the settings"""
+    statsd = None
+    if settings["metrics_statsd_host"]:
+        statsd = StatsdClient(settings["metrics_statsd_host"], settings["metrics_statsd_port"],
+                              settings["metrics_statsd_prefix"])
+    metrics = Metrics(statsd)
+    if settings["metrics_prometheus_path"]:
+        metrics.start_export(settings["metrics_prometheus_path"], settings["metrics_prometheus_interval"])
+    return metrics
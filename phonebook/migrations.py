@@ -0,0 +1,376 @@
+"""Versioned schema migrations
+
+Every backend has an ordered list of migrations. The versions applied to a
+database are recorded in its ``schema_version`` table, and at startup
+``migrate`` applies the ones that are missing, in order, timing and logging
+each of them.
+
+A migration is a list of steps: SQL statements, or functions that are
+called with the repository for work SQL cannot express on its own, such as
+backfilling data. Every step checks the state it changes before changing it,
+so databases created before migrations existed (with no schema_version table)
+are brought up to date by running all of them.
+"""
+
+import logging
+import time
+
+
+class Migration:
+    """One schema change"""
+
+    def __init__(self, version, description, steps):
+        self.version = version
+        self.description = description
+        self.steps = steps
+
+
+class MigrationSet:
+    """Migrations of one backend, and the DDL of its schema_version table"""
+
+    def __init__(self, version_table, migrations):
+        self.version_table = version_table
+        self.migrations = migrations
+
+    @property
+    def latest(self):
+        """Version of the newest migration"""
+        return max(migration.version for migration in self.migrations)
+
+
+def current_version(repo):
+    """Newest migration applied to the database, 0 for none"""
+    cursor = repo.conn.cursor()
+    cursor.execute("SELECT MAX(version) FROM schema_version")
+    return cursor.fetchone()[0] or 0
+
+
+def migrate(repo, migration_set):
+    """Apply the migrations the database is missing and return how many were applied"""
+    started = time.perf_counter()
+    cursor = repo.conn.cursor()
+    cursor.execute(migration_set.version_table)
+    repo.commit()
+
+    current = current_version(repo)
+    pending = [migration for migration in migration_set.migrations if migration.version > current]
+    for migration in sorted(pending, key=lambda migration: migration.version):
+        step_started = time.perf_counter()
+        try:
+            for step in migration.steps:
+                if callable(step):
+                    repo.commit()
+                    step(repo)
+                else:
+                    cursor.execute(step)
+            duration_ms = int((time.perf_counter() - step_started) * 1000)
+            cursor.execute("INSERT INTO schema_version (version, description, duration_ms) VALUES (?, ?, ?)",
+                           (migration.version, migration.description, duration_ms))
+            repo.commit()
+        except Exception as e:
+            repo.rollback()
+            logging.error(f"Migration {migration.version} ({migration.description}) failed: {e}")
+            raise
+        logging.info(f"Applied migration {migration.version} ({migration.description}) in {duration_ms} ms")
+
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    logging.info(f"Schema at version {max(current, migration_set.latest)}, "
+                 f"{len(pending)} migrations applied in {elapsed_ms:.0f} ms")
+    return len(pending)
+
+
+def _backfill_phone_columns(repo):
+    repo.backfill_phone_columns()
+
+
+def _rebuild_search_index(repo):
+    repo.rebuild_search_index()
+
+
+def _rebuild_name_index(repo):
+    repo.rebuild_name_index()
+
+
+def _add_sqlite_phone_columns(repo):
+    """SQLite has no ADD COLUMN IF NOT EXISTS"""
+    columns = {row[1] for row in repo.conn.execute("PRAGMA table_info(contacts)")}
+    if "phone_digits" not in columns:
+        repo.conn.execute("ALTER TABLE contacts ADD COLUMN phone_digits TEXT COLLATE NOCASE")
+        repo.conn.execute("ALTER TABLE contacts ADD COLUMN phone_e164 TEXT")
+        repo.conn.execute("ALTER TABLE contacts ADD COLUMN phone_reversed TEXT COLLATE NOCASE")
+        repo.commit()
+
+
+SQLSERVER = MigrationSet(
+    """
+    IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='schema_version' AND xtype='U')
+    CREATE TABLE schema_version (
+        version INT PRIMARY KEY,
+        description NVARCHAR(200) NOT NULL,
+        applied_date DATETIME DEFAULT GETDATE(),
+        duration_ms INT
+    )
+    """,
+    [
+        Migration(1, "Create contacts table", [
+            """
+            IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='contacts' AND xtype='U')
+            CREATE TABLE contacts (
+                id INT IDENTITY(1,1) PRIMARY KEY,
+                first_name NVARCHAR(50) NOT NULL,
+                last_name NVARCHAR(50) NOT NULL,
+                phone NVARCHAR(20) NOT NULL,
+                email NVARCHAR(100),
+                address NVARCHAR(255),
+                company NVARCHAR(100),
+                notes NTEXT,
+                created_date DATETIME DEFAULT GETDATE(),
+                modified_date DATETIME DEFAULT GETDATE()
+            )
+            """,
+        ]),
+        Migration(2, "Normalized phone number columns", [
+            """
+            IF COL_LENGTH('contacts', 'phone_digits') IS NULL
+                ALTER TABLE contacts ADD phone_digits NVARCHAR(20), phone_e164 NVARCHAR(16), phone_reversed NVARCHAR(20)
+            """,
+            """
+            IF NOT EXISTS (SELECT * FROM sys.indexes WHERE name='ix_contacts_phone_digits')
+                CREATE INDEX ix_contacts_phone_digits ON contacts (phone_digits);
+            IF NOT EXISTS (SELECT * FROM sys.indexes WHERE name='ix_contacts_phone_reversed')
+                CREATE INDEX ix_contacts_phone_reversed ON contacts (phone_reversed);
+            """,
+            _backfill_phone_columns,
+        ]),
+        Migration(3, "Trigram search index", [
+            """
+            IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='contact_trigrams' AND xtype='U')
+            BEGIN
+                CREATE TABLE contact_trigrams (
+                    trigram NVARCHAR(6) NOT NULL,
+                    field TINYINT NOT NULL,
+                    contact_id INT NOT NULL,
+                    PRIMARY KEY (trigram, field, contact_id)
+                );
+                CREATE INDEX ix_contact_trigrams_contact ON contact_trigrams (contact_id);
+            END
+            """,
+            _rebuild_search_index,
+        ]),
+        Migration(4, "Notes as NVARCHAR(MAX) instead of deprecated NTEXT", [
+            # Rewriting the values moves short notes into the row, as they would be for a new NVARCHAR(MAX)
+            """
+            IF EXISTS (SELECT * FROM INFORMATION_SCHEMA.COLUMNS
+                       WHERE TABLE_NAME='contacts' AND COLUMN_NAME='notes' AND DATA_TYPE='ntext')
+            BEGIN
+                ALTER TABLE contacts ALTER COLUMN notes NVARCHAR(MAX);
+                EXEC('UPDATE contacts SET notes = notes WHERE notes IS NOT NULL');
+            END
+            """,
+        ]),
+        Migration(5, "Covering indexes for the contact list, phone and email", [
+            # Keyset pages seek on (last_name, first_name, id) and read the list columns from the index
+            """
+            IF NOT EXISTS (SELECT * FROM sys.indexes WHERE name='ix_contacts_name')
+                CREATE INDEX ix_contacts_name ON contacts (last_name, first_name, id)
+                INCLUDE (phone, email, company);
+            IF NOT EXISTS (SELECT * FROM sys.indexes WHERE name='ix_contacts_phone')
+                CREATE INDEX ix_contacts_phone ON contacts (phone);
+            IF NOT EXISTS (SELECT * FROM sys.indexes WHERE name='ix_contacts_email')
+                CREATE INDEX ix_contacts_email ON contacts (email);
+            """,
+        ]),
+        # Keyset comparisons need values, NULL compares as unknown; the id
+        # of the clustered primary key ends every nonclustered index key
+        Migration(6, "Sortable list columns", [
+            "UPDATE contacts SET email = '' WHERE email IS NULL",
+            "UPDATE contacts SET company = '' WHERE company IS NULL",
+            """
+            IF NOT EXISTS (SELECT * FROM sys.indexes WHERE name='ix_contacts_first_name')
+                CREATE INDEX ix_contacts_first_name ON contacts (first_name, last_name, id)
+                INCLUDE (phone, email, company);
+            IF EXISTS (SELECT * FROM sys.indexes WHERE name='ix_contacts_phone')
+                DROP INDEX ix_contacts_phone ON contacts;
+            CREATE INDEX ix_contacts_phone ON contacts (phone, id) INCLUDE (first_name, last_name, email, company);
+            IF EXISTS (SELECT * FROM sys.indexes WHERE name='ix_contacts_email')
+                DROP INDEX ix_contacts_email ON contacts;
+            CREATE INDEX ix_contacts_email ON contacts (email, id) INCLUDE (first_name, last_name, phone, company);
+            IF NOT EXISTS (SELECT * FROM sys.indexes WHERE name='ix_contacts_company')
+                CREATE INDEX ix_contacts_company ON contacts (company, id)
+                INCLUDE (first_name, last_name, phone, email);
+            """,
+        ]),
+        Migration(7, "Phonetic name index for fuzzy search", [
+            """
+            IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='name_words' AND xtype='U')
+            BEGIN
+                CREATE TABLE name_words (
+                    word NVARCHAR(100) NOT NULL PRIMARY KEY,
+                    phonetic_key NVARCHAR(100) NOT NULL
+                );
+                CREATE INDEX ix_name_words_key ON name_words (phonetic_key, word);
+            END
+            IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='contact_names' AND xtype='U')
+            BEGIN
+                CREATE TABLE contact_names (
+                    word NVARCHAR(100) NOT NULL,
+                    field TINYINT NOT NULL,
+                    contact_id INT NOT NULL,
+                    PRIMARY KEY (word, field, contact_id)
+                );
+                CREATE INDEX ix_contact_names_contact ON contact_names (contact_id);
+            END
+            """,
+            _rebuild_name_index,
+        ]),
+        Migration(8, "Index on the modification date for syncing copies", [
+            """
+            IF NOT EXISTS (SELECT * FROM sys.indexes WHERE name='ix_contacts_modified')
+                CREATE INDEX ix_contacts_modified ON contacts (modified_date, id);
+            """,
+        ]),
+        # Entries keep the list columns of the contact before the change, so
+        # clients can move a row out of a view they no longer hold
+        Migration(9, "Change log for following other clients' changes", [
+            """
+            IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='contact_changes' AND xtype='U')
+            BEGIN
+                CREATE TABLE contact_changes (
+                    seq BIGINT IDENTITY(1,1) PRIMARY KEY,
+                    version ROWVERSION NOT NULL,
+                    contact_id INT NOT NULL,
+                    operation CHAR(1) NOT NULL,
+                    first_name NVARCHAR(50),
+                    last_name NVARCHAR(50),
+                    phone NVARCHAR(20),
+                    email NVARCHAR(100),
+                    company NVARCHAR(100),
+                    changed_date DATETIME NOT NULL DEFAULT GETDATE()
+                );
+                CREATE UNIQUE INDEX ix_contact_changes_version ON contact_changes (version);
+                CREATE INDEX ix_contact_changes_date ON contact_changes (changed_date);
+            END
+            IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='change_log' AND xtype='U')
+            BEGIN
+                CREATE TABLE change_log (pruned_through BIGINT NOT NULL);
+                INSERT INTO change_log (pruned_through) VALUES (0);
+            END
+            """,
+        ]),
+    ],
+)
+
+
+SQLITE = MigrationSet(
+    """
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        description TEXT NOT NULL,
+        applied_date TEXT DEFAULT CURRENT_TIMESTAMP,
+        duration_ms INTEGER
+    )
+    """,
+    [
+        # Names use NOCASE collation so sorting and keyset comparisons behave
+        # like the case-insensitive default collation of SQL Server
+        Migration(1, "Create contacts table", [
+            """
+            CREATE TABLE IF NOT EXISTS contacts (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                first_name TEXT NOT NULL COLLATE NOCASE,
+                last_name TEXT NOT NULL COLLATE NOCASE,
+                phone TEXT NOT NULL,
+                email TEXT COLLATE NOCASE,
+                address TEXT,
+                company TEXT COLLATE NOCASE,
+                notes TEXT,
+                created_date TEXT DEFAULT CURRENT_TIMESTAMP,
+                modified_date TEXT DEFAULT CURRENT_TIMESTAMP
+            )
+            """,
+        ]),
+        # The phone columns use NOCASE too, because SQLite only turns
+        # LIKE 'prefix%' into an index seek on NOCASE columns
+        Migration(2, "Normalized phone number columns", [
+            _add_sqlite_phone_columns,
+            "CREATE INDEX IF NOT EXISTS ix_contacts_phone_digits ON contacts (phone_digits)",
+            "CREATE INDEX IF NOT EXISTS ix_contacts_phone_reversed ON contacts (phone_reversed)",
+            _backfill_phone_columns,
+        ]),
+        Migration(3, "Trigram search index", [
+            """
+            CREATE TABLE IF NOT EXISTS contact_trigrams (
+                trigram TEXT NOT NULL,
+                field INTEGER NOT NULL,
+                contact_id INTEGER NOT NULL,
+                PRIMARY KEY (trigram, field, contact_id)
+            ) WITHOUT ROWID
+            """,
+            "CREATE INDEX IF NOT EXISTS ix_contact_trigrams_contact ON contact_trigrams (contact_id)",
+            _rebuild_search_index,
+        ]),
+        # Notes are already TEXT, the version is kept in step with SQL Server
+        Migration(4, "Notes as NVARCHAR(MAX) instead of deprecated NTEXT", []),
+        Migration(5, "Covering indexes for the contact list, phone and email", [
+            "CREATE INDEX IF NOT EXISTS ix_contacts_name ON contacts (last_name, first_name, id, phone, email, company)",
+            "CREATE INDEX IF NOT EXISTS ix_contacts_phone ON contacts (phone)",
+            "CREATE INDEX IF NOT EXISTS ix_contacts_email ON contacts (email)",
+            "ANALYZE",
+        ]),
+        # Keyset comparisons need values, NULL compares as unknown. The phone
+        # and email indexes are rebuilt to cover the list columns
+        Migration(6, "Sortable list columns", [
+            "UPDATE contacts SET email = '' WHERE email IS NULL",
+            "UPDATE contacts SET company = '' WHERE company IS NULL",
+            "CREATE INDEX IF NOT EXISTS ix_contacts_first_name ON contacts "
+            "(first_name, last_name, id, phone, email, company)",
+            "DROP INDEX IF EXISTS ix_contacts_phone",
+            "CREATE INDEX ix_contacts_phone ON contacts (phone, id, first_name, last_name, email, company)",
+            "DROP INDEX IF EXISTS ix_contacts_email",
+            "CREATE INDEX ix_contacts_email ON contacts (email, id, first_name, last_name, phone, company)",
+            "CREATE INDEX IF NOT EXISTS ix_contacts_company ON contacts "
+            "(company, id, first_name, last_name, phone, email)",
+            "ANALYZE",
+        ]),
+        Migration(7, "Phonetic name index for fuzzy search", [
+            """
+            CREATE TABLE IF NOT EXISTS name_words (
+                word TEXT NOT NULL PRIMARY KEY,
+                phonetic_key TEXT NOT NULL
+            ) WITHOUT ROWID
+            """,
+            "CREATE INDEX IF NOT EXISTS ix_name_words_key ON name_words (phonetic_key, word)",
+            """
+            CREATE TABLE IF NOT EXISTS contact_names (
+                word TEXT NOT NULL,
+                field INTEGER NOT NULL,
+                contact_id INTEGER NOT NULL,
+                PRIMARY KEY (word, field, contact_id)
+            ) WITHOUT ROWID
+            """,
+            "CREATE INDEX IF NOT EXISTS ix_contact_names_contact ON contact_names (contact_id)",
+            _rebuild_name_index,
+        ]),
+        Migration(8, "Index on the modification date for syncing copies", [
+            "CREATE INDEX IF NOT EXISTS ix_contacts_modified ON contacts (modified_date, id)",
+        ]),
+        Migration(9, "Change log for following other clients' changes", [
+            """
+            CREATE TABLE IF NOT EXISTS contact_changes (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                contact_id INTEGER NOT NULL,
+                operation TEXT NOT NULL,
+                first_name TEXT,
+                last_name TEXT,
+                phone TEXT,
+                email TEXT,
+                company TEXT,
+                changed_date TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+            )
+            """,
+            "CREATE INDEX IF NOT EXISTS ix_contact_changes_date ON contact_changes (changed_date)",
+            "CREATE TABLE IF NOT EXISTS change_log (pruned_through INTEGER NOT NULL)",
+            "INSERT INTO change_log (pruned_through) SELECT 0 WHERE NOT EXISTS (SELECT 1 FROM change_log)",
+        ]),
+    ],
+)
@@ -0,0 +1,262 @@
+"""Page sources for the virtual contact list
+
+A page source describes one result set (all contacts or a search) and
+fetches pages of it from a repository. Rows are ordered by one of the
+SORT_COLUMNS orders, (last_name, first_name, id) by default, which all end
+with id, so every row has a unique key and the next/previous page can be
+found with an index seek instead of OFFSET.
+OFFSET is only used to locate a starting point when the user jumps far
+away with the scrollbar. Methods run on a query worker and receive its
+repository.
+
+After a contact is saved or deleted the list is patched in place instead of
+being reloaded. Sources that keep rows in memory patch those rows with
+apply_change; the position of a row is found by binary search on
+sort_key, the case-insensitive form of the list order.
+"""
+
+from .search import normalize_criteria, row_matches
+from .storage import CONTACT_COLUMNS, LIST_COLUMNS, sort_columns
+
+# Positions of the list columns in a full contact record
+_LIST_POSITIONS = [CONTACT_COLUMNS.index(column) for column in LIST_COLUMNS]
+
+# Position of each column in a list row
+_ROW_POSITIONS = {column: position for position, column in enumerate(LIST_COLUMNS)}
+
+
+class _Descending:
+    """Wraps a value so that it sorts in reverse"""
+
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+    def __gt__(self, other):
+        return other.value > self.value
+
+    def __le__(self, other):
+        return other.value <= self.value
+
+    def __ge__(self, other):
+        return other.value >= self.value
+
+
+def list_row(record):
+    """List row (id, first_name, last_name, phone, email, company) of a full contact record"""
+    return tuple(record[position] for position in _LIST_POSITIONS)
+
+
+def sort_key(row, sort=None):
+    """Case-insensitive position of a row in a list order, matching the database collation"""
+    columns, descending = sort_columns(sort)
+    key = tuple(row[0] if column == "id" else (row[_ROW_POSITIONS[column]] or "").casefold() for column in columns)
+    return tuple(_Descending(value) for value in key) if descending else key
+
+
+def sort_rows(rows, sort=None):
+    """Rows in a list order"""
+    return sorted(rows, key=lambda row: sort_key(row, sort))
+
+
+def insert_position(rows, row, sort=None):
+    """Index at which row belongs in rows sorted by sort_key - binary search"""
+    key = sort_key(row, sort)
+    low, high = 0, len(rows)
+    while low < high:
+        middle = (low + high) // 2
+        if sort_key(rows[middle], sort) < key:
+            low = middle + 1
+        else:
+            high = middle
+    return low
+
+
+class ContactPageSource:
+    """Contacts matching search criteria, fetched with keyset pagination"""
+
+    # Rows are in list order, so changed rows can be placed by their key
+    ordered = True
+
+    def __init__(self, criteria=None, sort=None):
+        self.criteria = dict(criteria or {})
+        self.sort = sort
+
+    def matches(self, row):
+        """True if a list row belongs to this result"""
+        return row_matches(row, normalize_criteria(self.criteria))
+
+    def apply_change(self, contact_id, new_row):
+        """Patch rows held in memory after a contact changed - nothing to do when paging"""
+
+    def key(self, row):
+        """Keyset key of a list row (id, first_name, last_name, ...) - the sort columns, ending with id"""
+        return tuple(row[_ROW_POSITIONS[column]] for column in sort_columns(self.sort)[0])
+
+    def sort_key(self, row):
+        """Case-insensitive position of a row in this source's order"""
+        return sort_key(row, self.sort)
+
+    def load(self, repo, limit):
+        """Row count and first page"""
+        return repo.count(self.criteria), repo.fetch_at(self.criteria, 0, limit, self.sort)
+
+    def fetch_at(self, repo, offset, limit):
+        """Fetch rows starting at an absolute position"""
+        return repo.fetch_at(self.criteria, offset, limit, self.sort)
+
+    def fetch_after(self, repo, key, limit):
+        """Fetch the rows that follow key"""
+        return repo.fetch_after(self.criteria, key, limit, self.sort)
+
+    def fetch_before(self, repo, key, limit):
+        """Fetch the rows that precede key, in list order"""
+        return repo.fetch_before(self.criteria, key, limit, self.sort)
+
+    def all_ids(self, repo, page_size=10000):
+        """Ids of every row of the result, read in id order without the other columns"""
+        ids, after_id = [], 0
+        while True:
+            page = repo.contact_ids(after_id, page_size, self.criteria)
+            ids += page
+            if len(page) < page_size:
+                return ids
+            after_id = page[-1]
+
+
+class SearchPageSource(ContactPageSource):
+    """Search results that are loaded completely when they are small
+
+    If the result has at most max_rows rows it is fetched in one go, kept in
+    ``rows`` for the search cache and served from memory afterwards. Larger
+    results are paged from the database like ContactPageSource.
+    """
+
+    def __init__(self, criteria=None, max_rows=5000, sort=None):
+        super().__init__(criteria, sort)
+        self.max_rows = max_rows
+        self.rows = None
+        self.memory = None
+
+    def load(self, repo, limit):
+        """Row count and first page, loading everything if the result is small"""
+        total = repo.count(self.criteria)
+        if total > self.max_rows:
+            return total, repo.fetch_at(self.criteria, 0, limit, self.sort)
+        self.rows = repo.fetch_at(self.criteria, 0, total, self.sort)
+        self.memory = MemoryPageSource(self.rows, self.criteria, self.sort)
+        return self.memory.load(repo, limit)
+
+    def apply_change(self, contact_id, new_row):
+        if self.memory is not None:
+            self.memory.apply_change(contact_id, new_row)
+            self.rows = self.memory.rows
+
+    def fetch_at(self, repo, offset, limit):
+        if self.memory is not None:
+            return self.memory.fetch_at(repo, offset, limit)
+        return super().fetch_at(repo, offset, limit)
+
+    def fetch_after(self, repo, key, limit):
+        if self.memory is not None:
+            return self.memory.fetch_after(repo, key, limit)
+        return super().fetch_after(repo, key, limit)
+
+    def fetch_before(self, repo, key, limit):
+        if self.memory is not None:
+            return self.memory.fetch_before(repo, key, limit)
+        return super().fetch_before(repo, key, limit)
+
+    def all_ids(self, repo, page_size=10000):
+        if self.memory is not None:
+            return self.memory.all_ids(repo)
+        return super().all_ids(repo, page_size)
+
+
+class MemoryPageSource(ContactPageSource):
+    """Rows already in memory, in the order of sort - used for cached search results"""
+
+    def __init__(self, rows, criteria=None, sort=None):
+        super().__init__(criteria, sort)
+        self.rows = rows
+        self.positions = {row[0]: index for index, row in enumerate(rows)}
+
+    def apply_change(self, contact_id, new_row):
+        """Remove, replace or insert a row - the list is copied, it may be shared with the search cache"""
+        rows = list(self.rows)
+        index = self.positions.get(contact_id)
+        if index is not None:
+            del rows[index]
+        if new_row is not None:
+            if self.ordered:
+                rows.insert(insert_position(rows, new_row, self.sort), new_row)
+            elif index is not None:
+                rows.insert(index, new_row)
+        self.rows = rows
+        self.positions = {row[0]: position for position, row in enumerate(rows)}
+
+    def load(self, repo, limit):
+        return len(self.rows), self.rows[:limit]
+
+    def fetch_at(self, repo, offset, limit):
+        return self.rows[offset:offset + limit]
+
+    def fetch_after(self, repo, key, limit):
+        start = self.positions[key[-1]] + 1
+        return self.rows[start:start + limit]
+
+    def fetch_before(self, repo, key, limit):
+        end = self.positions[key[-1]]
+        return self.rows[max(end - limit, 0):end]
+
+    def all_ids(self, repo, page_size=10000):
+        return [row[0] for row in self.rows]
+
+
+class TextSearchSource(MemoryPageSource):
+    """Ranked results of a text search over all indexed fields
+
+    Best match first, or the best limit matches in the order of sort when
+    one is given.
+    """
+
+    # Rank order - changed rows keep their place and new contacts are not added
+    ordered = False
+
+    def __init__(self, text, criteria=None, limit=500, sort=None):
+        super().__init__([], criteria, sort)
+        self.text = text
+        self.limit = limit
+
+    def matches(self, row):
+        return False
+
+    def search(self, repo):
+        """Ranked list rows of the search"""
+        return repo.search_text(self.text, self.criteria, self.limit)
+
+    def load(self, repo, limit):
+        """Run the search and return the first page"""
+        self.rows = self.search(repo)
+        if self.sort:
+            self.rows = sort_rows(self.rows, self.sort)
+        self.positions = {row[0]: index for index, row in enumerate(self.rows)}
+        return super().load(repo, limit)
+
+
+class FuzzySearchSource(TextSearchSource):
+    """Contacts whose names sound like the search, closest spellings first
+
+    The name criteria and the words of text are matched by sound (see
+    ContactRepository.search_fuzzy), the phone criterion as usual.
+    """
+
+    def search(self, repo):
+        return repo.search_fuzzy(self.text, self.criteria, self.limit)
@@ -0,0 +1,66 @@
+"""Phone number normalization
+
+The phone column is free-form text, so every write also stores:
+
+- phone_digits: only the digits, used to match numbers however they are
+  formatted ("+1 (555) 123" and "1555123")
+- phone_e164: +<country code><number> when it can be worked out
+- phone_reversed: the digits reversed, so "ends with these digits" becomes a
+  prefix search that an index can seek (caller-ID lookups)
+"""
+
+import re
+
+_NON_DIGITS = re.compile(r"\D")
+_PHONE_LIKE = re.compile(r"^[\d\s()+./-]*\d[\d\s()+./-]*$")
+
+# Fewest trailing digits that identify a number in a caller-ID lookup
+MIN_SUFFIX_DIGITS = 7
+
+
+def digits_only(phone):
+    """Digits of a phone number"""
+    return _NON_DIGITS.sub("", phone or "")
+
+
+def looks_like_phone(text):
+    """True for text made of digits and phone punctuation only"""
+    return bool(_PHONE_LIKE.match(text or ""))
+
+
+def to_e164(phone, country_code=""):
+    """E.164 form of a phone number, or None if it cannot be determined
+
+    Numbers written with + or the 00 international prefix carry their country
+    code. Other numbers get country_code with the trunk prefix 0 removed, if
+    a default country code is configured.
+    """
+    text = (phone or "").strip()
+    digits = digits_only(text)
+    if text.startswith("+"):
+        number = digits
+    elif digits.startswith("00"):
+        number = digits[2:]
+    elif country_code:
+        number = digits_only(country_code) + digits.lstrip("0")
+    else:
+        return None
+    if not 7 <= len(number) <= 15:
+        return None
+    return "+" + number
+
+
+def normalize(phone, country_code=""):
+    """(phone_digits, phone_e164, phone_reversed) for a phone number"""
+    digits = digits_only(phone)
+    return digits, to_e164(phone, country_code), digits[::-1]
+
+
+def common_suffix_length(a, b):
+    """Number of trailing characters two strings share"""
+    length = 0
+    for x, y in zip(reversed(a), reversed(b)):
+        if x != y:
+            break
+        length += 1
+    return length
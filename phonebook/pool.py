@@ -0,0 +1,198 @@
+"""Pool of repository connections shared by the query workers
+
+Connections are checked out for one task and returned afterwards, so any
+worker can use any connection and a slow query only holds one of them. The
+pool keeps at least min_size connections open and never more than max_size.
+A connection that sat idle for longer than ping_interval is pinged before it
+is handed out; a dead one is replaced. Opening a connection is retried with
+exponential backoff until the checkout times out, so a restarted database
+server is picked up again without restarting the application.
+"""
+
+import logging
+import threading
+import time
+
+
+class PoolTimeout(Exception):
+    """No connection became available in time"""
+
+
+class ConnectionPool:
+    """Bounded pool of repositories with health checks and reconnect"""
+
+    def __init__(self, connect, min_size=1, max_size=4, timeout=10.0, ping_interval=30.0, max_backoff=8.0):
+        self.connect = connect
+        self.min_size = min(min_size, max_size)
+        self.max_size = max_size
+        self.timeout = timeout
+        self.ping_interval = ping_interval
+        self.max_backoff = max_backoff
+
+        self.idle = []
+        self.size = 0
+        self.in_use = 0
+        self.closed = False
+        self.condition = threading.Condition()
+
+        # Statistics
+        self.checkouts = 0
+        self.timeouts = 0
+        self.reconnects = 0
+        self.failed_pings = 0
+        self.wait_time = 0.0
+        self.max_wait = 0.0
+        self.busy_time = 0.0
+        self.started = time.perf_counter()
+        self.checked_out = {}
+
+    def start(self):
+        """Open min_size connections in the background"""
+        threading.Thread(target=self.fill, name="pool-fill", daemon=True).start()
+
+    def fill(self):
+        """Open connections until min_size are available"""
+        while True:
+            with self.condition:
+                if self.closed or self.size >= self.min_size:
+                    return
+                self.size += 1
+            try:
+                repo = self.open(time.monotonic() + self.timeout)
+            except Exception as e:
+                with self.condition:
+                    self.size -= 1
+                logging.warning(f"Could not open pooled connection: {e}")
+                return
+            with self.condition:
+                self.idle.append((repo, time.monotonic()))
+                self.condition.notify()
+
+    def open(self, deadline):
+        """Open a connection, retrying with exponential backoff until deadline"""
+        delay = 0.25
+        while True:
+            try:
+                return self.connect()
+            except Exception as e:
+                if self.closed or time.monotonic() + delay > deadline:
+                    raise
+                logging.warning(f"Connection failed, retrying in {delay:.2f}s: {e}")
+                with self.condition:
+                    self.reconnects += 1
+                time.sleep(delay)
+                delay = min(delay * 2, self.max_backoff)
+
+    def acquire(self, timeout=None):
+        """Check out a live connection, waiting at most timeout seconds"""
+        started = time.monotonic()
+        timeout = self.timeout if timeout is None else timeout
+        deadline = started + timeout
+        while True:
+            with self.condition:
+                while not self.idle and self.size >= self.max_size and not self.closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.timeouts += 1
+                        raise PoolTimeout(f"No database connection available after {timeout:.1f}s "
+                                          f"({self.in_use} of {self.max_size} in use)")
+                    self.condition.wait(remaining)
+                if self.closed:
+                    raise PoolTimeout("Connection pool is closed")
+                if self.idle:
+                    repo, idle_since = self.idle.pop()
+                else:
+                    repo, idle_since = None, None
+                    self.size += 1
+                self.in_use += 1
+
+            if repo is None:
+                try:
+                    repo = self.open(deadline)
+                except Exception:
+                    self._discard(None)
+                    raise
+            elif time.monotonic() - idle_since > self.ping_interval and not self.ping(repo):
+                self._discard(repo)
+                continue
+
+            waited = time.monotonic() - started
+            with self.condition:
+                self.checkouts += 1
+                self.wait_time += waited
+                self.max_wait = max(self.max_wait, waited)
+                self.checked_out[id(repo)] = time.monotonic()
+            return repo
+
+    def ping(self, repo):
+        """True if the connection still answers"""
+        try:
+            repo.ping()
+            return True
+        except Exception as e:
+            with self.condition:
+                self.failed_pings += 1
+            logging.warning(f"Dropping dead pooled connection: {e}")
+            return False
+
+    def release(self, repo, broken=False):
+        """Return a checked out connection - broken ones are closed and replaced on demand"""
+        with self.condition:
+            checked_out = self.checked_out.pop(id(repo), None)
+            if checked_out is not None:
+                self.busy_time += time.monotonic() - checked_out
+        if broken or self.closed:
+            self._discard(repo)
+            return
+        with self.condition:
+            self.in_use -= 1
+            self.idle.append((repo, time.monotonic()))
+            self.condition.notify()
+
+    def _discard(self, repo):
+        """Close a connection and free its slot"""
+        if repo is not None:
+            try:
+                repo.close()
+            except Exception:
+                pass
+        with self.condition:
+            self.size -= 1
+            self.in_use -= 1
+            self.condition.notify()
+
+    def close(self):
+        """Close the idle connections, checked out ones are closed when released"""
+        with self.condition:
+            self.closed = True
+            idle, self.idle = self.idle, []
+            self.size -= len(idle)
+            self.condition.notify_all()
+        for repo, _ in idle:
+            try:
+                repo.close()
+            except Exception:
+                pass
+
+    @property
+    def utilisation(self):
+        """Share of the pool's capacity that was in use since it started"""
+        elapsed = time.perf_counter() - self.started
+        return self.busy_time / (elapsed * self.max_size) if elapsed else 0.0
+
+    def stats(self):
+        """Counters for logs and diagnostics"""
+        with self.condition:
+            return {
+                "size": self.size,
+                "idle": len(self.idle),
+                "in_use": self.in_use,
+                "max_size": self.max_size,
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "reconnects": self.reconnects,
+                "failed_pings": self.failed_pings,
+                "avg_wait_ms": round(1000 * self.wait_time / self.checkouts, 3) if self.checkouts else 0.0,
+                "max_wait_ms": round(1000 * self.max_wait, 3),
+                "utilisation": round(self.utilisation, 3),
+            }
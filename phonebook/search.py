@@ -0,0 +1,122 @@
+"""Search result cache for live search
+
+Results of small searches are kept in an LRU cache keyed by the normalized
+criteria. When the user keeps typing, every term of the new search usually
+contains the corresponding term of an earlier one ("jo" -> "joh"), so the new
+result is a subset of the cached rows and can be found by filtering them in
+memory instead of querying the database again.
+"""
+
+from collections import OrderedDict
+
+from .phones import digits_only
+from .storage import SEARCH_FIELDS
+
+# Position of each search field in a list row (id, first_name, last_name, phone, ...)
+ROW_INDEX = {"first_name": 1, "last_name": 2, "phone": 3}
+
+# Criteria fields, "text" is the ranked search over all indexed fields
+CRITERIA_FIELDS = SEARCH_FIELDS + ("text",)
+
+
+def normalize_term(field, value):
+    """Case-folded search term - phone numbers are searched by their digits"""
+    value = value.strip().casefold()
+    if field == "phone" and digits_only(value):
+        return digits_only(value)
+    return value
+
+
+def normalize_criteria(criteria):
+    """Hashable, case-insensitive form of search criteria - empty terms are dropped"""
+    return tuple((field, normalize_term(field, criteria[field]))
+                 for field in CRITERIA_FIELDS if (criteria.get(field) or "").strip())
+
+
+def row_matches(row, key):
+    """True if a list row matches normalized criteria, like the SQL search filter"""
+    for field, term in key:
+        value = row[ROW_INDEX[field]] or ""
+        if field == "phone" and term.isdigit():
+            value = digits_only(value)
+        if term not in value.casefold():
+            return False
+    return True
+
+
+def refines(key, cached_key):
+    """True if every result of key is also a result of cached_key"""
+    cached = dict(cached_key)
+    terms = dict(key)
+    return all(term in terms.get(field, "") for field, term in cached.items())
+
+
+class SearchCache:
+    """LRU cache of complete search results"""
+
+    def __init__(self, max_entries=32, max_rows=5000):
+        self.max_entries = max_entries
+        self.max_rows = max_rows
+        self.entries = OrderedDict()
+        self.generation = 0
+        self.hits = 0
+        self.refinements = 0
+        self.misses = 0
+
+    def get(self, criteria):
+        """Cached rows for the criteria, or None
+
+        Falls back to filtering the smallest cached result that the criteria
+        refine. The filtered result is cached as well. Ranked text searches
+        are never cached.
+        """
+        key = normalize_criteria(criteria)
+        if "text" in dict(key):
+            return None
+        rows = self.entries.get(key)
+        if rows is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return rows
+
+        candidates = [cached_key for cached_key in self.entries if refines(key, cached_key)]
+        if not candidates:
+            self.misses += 1
+            return None
+        base_key = min(candidates, key=lambda cached_key: len(self.entries[cached_key]))
+        self.entries.move_to_end(base_key)
+        rows = [row for row in self.entries[base_key] if row_matches(row, key)]
+        self.refinements += 1
+        self._store(key, rows)
+        return rows
+
+    def put(self, criteria, rows, generation=None):
+        """Cache a complete result - ignored if the cache was cleared since generation"""
+        if generation is not None and generation != self.generation:
+            return
+        if (criteria.get("text") or "").strip():
+            return
+        if len(rows) <= self.max_rows:
+            self._store(normalize_criteria(criteria), list(rows))
+
+    def _store(self, key, rows):
+        self.entries[key] = rows
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        """Drop all results after the data changed"""
+        self.entries.clear()
+        self.generation += 1
+
+    @property
+    def hit_rate(self):
+        """Fraction of lookups answered from the cache, refined results included"""
+        lookups = self.hits + self.refinements + self.misses
+        return (self.hits + self.refinements) / lookups if lookups else 0.0
+
+    def stats(self):
+        """Counters for logs and diagnostics"""
+        return {"entries": len(self.entries), "hits": self.hits, "refinements": self.refinements,
+                "misses": self.misses, "hit_rate": round(self.hit_rate, 3)}
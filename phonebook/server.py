@@ -0,0 +1,600 @@
+"""HTTP/JSON API server for sharing one database between many clients
+
+Desktop clients configured with the "http" backend send their queries here
+instead of opening their own database connections. The server keeps one
+ConnectionPool for everybody and caches GET responses: every response
+carries an ETag, a client that sends it back in If-None-Match gets an empty
+304, and repeated requests for the same page are answered from memory until
+a write goes through the server or the entry is older than api_cache_ttl
+seconds. The change feed and the other sync endpoints are never cached,
+since writes made directly in the database do not clear the cache. Large
+responses are gzip-compressed for clients that accept it.
+
+It only uses the standard library: asyncio for the connections and a thread
+pool for the blocking database calls. Start it with
+
+    python -m phonebook serve --port 8765
+
+Endpoints (criteria are the first_name, last_name and phone parameters):
+
+    GET    /health                  pool and cache statistics
+    GET    /contacts                list rows; offset, or after/before (a JSON key), limit and sort
+    GET    /contacts/count          number of matching contacts
+    GET    /contacts/search         ranked text search; text and limit
+    GET    /contacts/fuzzy          names that sound like the criteria and text; limit
+    GET    /contacts/lookup         contact a phone number belongs to; phone
+    GET    /contacts/duplicates     groups of probable duplicates; threshold
+    POST   /contacts/similar        probable duplicates of {"contact": {...}, "exclude": id, "limit": n}
+    POST   /contacts/merge          keep {"keep": id, "merge": [ids], "contact": {...}}, delete the rest
+    GET    /contacts/changes        full records modified after since and after (an id); limit
+    GET    /contacts/ids            ids of the matching contacts greater than after, in order; limit
+    GET    /contacts/feed           contacts changed after token (410 once it has expired); limit.
+                                    Without token, the token of the newest change
+    GET    /contacts/<id>           full record
+    GET    /contacts/<id>/notes     part of the notes of a contact; offset and limit (characters)
+    POST   /contacts                add a contact, returns its id
+    POST   /contacts/bulk           add {"contacts": [...]} in one transaction
+    POST   /contacts/batch          full records of {"ids": [...]}, in that order
+    POST   /contacts/headers        records of {"ids": [...]} with the start of the notes and their length
+    POST   /contacts/update         set {"values": {...}} (address, company, notes) on {"ids": [...]}
+    POST   /contacts/delete         delete {"ids": [...]} in one transaction
+    PUT    /contacts/<id>           replace a contact
+    DELETE /contacts/<id>           delete a contact
+"""
+
+import asyncio
+import gzip
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+from .importer import validate_contact
+from .pool import ConnectionPool
+from .search import CRITERIA_FIELDS
+from .storage import BULK_FIELDS, CONTACT_FIELDS, FIELD_LENGTHS, NOTES_CHUNK_SIZE, open_repository, sort_columns
+
+# Largest request body accepted
+MAX_BODY = 16 * 1024 * 1024
+
+# Most rows returned by one list request
+MAX_LIMIT = 10000
+
+# GET resources answered from the database every time: live statistics, and
+# the sync endpoints, which must see changes made by other servers or
+# directly in the database
+LIVE_PATHS = {"/health", "/contacts/changes", "/contacts/ids", "/contacts/feed"}
+
+# Most characters of notes returned by one request
+MAX_NOTES_LIMIT = 1024 * 1024
+
+# Smaller responses are not worth compressing
+GZIP_MIN_SIZE = 1024
+
+REASONS = {
+    200: "OK",
+    201: "Created",
+    304: "Not Modified",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    410: "Gone",
+    413: "Payload Too Large",
+    422: "Unprocessable Entity",
+    500: "Internal Server Error",
+}
+
+
+class HttpError(Exception):
+    """Error answered with an HTTP status"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class CachedResponse:
+    """Body of a GET response with its ETag"""
+
+    __slots__ = ("body", "etag", "created", "compressed")
+
+    def __init__(self, body):
+        self.body = body
+        self.etag = '"' + hashlib.sha1(body).hexdigest()[:20] + '"'
+        self.created = time.monotonic()
+        self.compressed = None
+
+    def gzipped(self):
+        """Compressed body, compressed once"""
+        if self.compressed is None:
+            self.compressed = gzip.compress(self.body, 5)
+        return self.compressed
+
+
+class ResponseCache:
+    """LRU cache of GET responses by URL, cleared by every write"""
+
+    def __init__(self, max_entries=256, ttl=5.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, url):
+        """Fresh cached response, or None"""
+        response = self.entries.get(url)
+        if response is None or time.monotonic() - response.created > self.ttl:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(url)
+        self.hits += 1
+        return response
+
+    def put(self, url, body):
+        """Cache a response body and return it"""
+        response = CachedResponse(body)
+        self.entries[url] = response
+        self.entries.move_to_end(url)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return response
+
+    def clear(self):
+        """Drop everything after the data changed"""
+        self.entries.clear()
+
+    def stats(self):
+        """Counters for the health endpoint"""
+        return {"entries": len(self.entries), "hits": self.hits, "misses": self.misses}
+
+
+def _param(query, name, default=""):
+    """Single query string parameter"""
+    values = query.get(name)
+    return values[0] if values else default
+
+
+def _int_param(query, name, default, maximum=None):
+    """Integer query string parameter"""
+    try:
+        value = int(_param(query, name, default))
+    except ValueError:
+        raise HttpError(400, f"{name} must be an integer") from None
+    if value < 0:
+        raise HttpError(400, f"{name} must not be negative")
+    return min(value, maximum) if maximum is not None else value
+
+
+def _threshold(value):
+    """Duplicate score threshold from a request"""
+    try:
+        threshold = float(value)
+    except (TypeError, ValueError):
+        raise HttpError(400, "threshold must be a number") from None
+    if not 0 <= threshold <= 1:
+        raise HttpError(400, "threshold must be between 0 and 1")
+    return threshold
+
+
+def _sort_param(query):
+    """Sort column, "-" first for descending"""
+    sort = _param(query, "sort") or None
+    try:
+        sort_columns(sort)
+    except ValueError as e:
+        raise HttpError(400, str(e)) from None
+    return sort
+
+
+def _key_param(query, name, sort):
+    """Key of a keyset page: the values of the sort columns, ending with the id"""
+    columns = sort_columns(sort)[0]
+    try:
+        key = json.loads(_param(query, name))
+        if not isinstance(key, list) or len(key) != len(columns):
+            raise ValueError
+        return tuple(key[:-1]) + (int(key[-1]),)
+    except (TypeError, ValueError):
+        raise HttpError(400, f"{name} must be a JSON [{', '.join(columns)}] list") from None
+
+
+def _criteria(query):
+    """Search criteria from the query string"""
+    return {field: _param(query, field) for field in CRITERIA_FIELDS if field != "text"}
+
+
+def _ids(data):
+    """Validated "ids" list of a request body"""
+    ids = data.get("ids") if isinstance(data, dict) else None
+    if not isinstance(ids, list) or not all(isinstance(contact_id, int) for contact_id in ids):
+        raise HttpError(400, "Expected {\"ids\": [integer, ...]}")
+    if len(ids) > MAX_LIMIT:
+        raise HttpError(413, f"At most {MAX_LIMIT} ids per request")
+    return ids
+
+
+def _contact(data):
+    """Validated contact dict from a request body"""
+    if not isinstance(data, dict):
+        raise HttpError(400, "Expected a JSON object")
+    contact = {field: str(data.get(field) or "").strip() for field in CONTACT_FIELDS}
+    reason = validate_contact(contact)
+    if reason:
+        raise HttpError(422, reason)
+    return contact
+
+
+class ContactServer:
+    """Serve the contact repository over HTTP"""
+
+    def __init__(self, settings):
+        if settings["backend"] == "http":
+            raise ValueError("The API server needs a database backend, not http")
+        self.settings = settings
+        self.pool = ConnectionPool(lambda: open_repository(settings),
+                                   min_size=settings["pool_min_size"],
+                                   max_size=settings["pool_max_size"],
+                                   timeout=settings["pool_timeout"],
+                                   ping_interval=settings["pool_ping_interval"],
+                                   max_backoff=settings["pool_max_backoff"])
+        self.threads = ThreadPoolExecutor(max_workers=settings["pool_max_size"], thread_name_prefix="api-worker")
+        self.cache = ResponseCache(settings["api_cache_size"], settings["api_cache_ttl"])
+
+    async def serve(self, host, port):
+        """Migrate the schema and serve until cancelled"""
+        await self.call(lambda repo: repo.create_schema())
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        logging.info(f"Phonebook API listening on http://{host}:{port}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.threads.shutdown(wait=True)
+            self.pool.close()
+
+    async def call(self, func, *args):
+        """Run func(repository, *args) on a worker thread with a pooled connection"""
+        return await asyncio.get_running_loop().run_in_executor(self.threads, self.run_query, func, args)
+
+    def run_query(self, func, args):
+        """Worker side of call - rolls back on errors and drops broken connections"""
+        repo = self.pool.acquire()
+        broken = False
+        try:
+            return func(repo, *args)
+        except Exception:
+            try:
+                repo.rollback()
+            except Exception:
+                broken = True
+            raise
+        finally:
+            self.pool.release(repo, broken)
+
+    async def handle_connection(self, reader, writer):
+        """Answer requests on one keep-alive connection"""
+        try:
+            while True:
+                try:
+                    request = await self.read_request(reader)
+                except HttpError as e:
+                    writer.write(self.format_response(e.status, {}, json.dumps({"error": str(e)}).encode(), False))
+                    await writer.drain()
+                    break
+                if request is None:
+                    break
+                method, target, headers, body = request
+                status, response_headers, payload = await self.respond(method, target, headers, body)
+                keep_alive = headers.get("connection", "").lower() != "close"
+                writer.write(self.format_response(status, response_headers, payload, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def read_line(reader):
+        """Next line of the request head, 400 if it is longer than the stream limit"""
+        try:
+            return await reader.readline()
+        except (ValueError, asyncio.LimitOverrunError):
+            raise HttpError(400, "Request line or header too long") from None
+
+    async def read_request(self, reader):
+        """(method, target, headers, body) of the next request, or None at end of stream"""
+        line = await self.read_line(reader)
+        if not line.strip():
+            return None
+        try:
+            method, target, _ = line.decode("latin-1").split()
+        except ValueError:
+            raise HttpError(400, "Malformed request line") from None
+        headers = {}
+        while True:
+            line = await self.read_line(reader)
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        try:
+            length = int(headers.get("content-length") or 0)
+        except ValueError:
+            raise HttpError(400, "Malformed Content-Length") from None
+        if length > MAX_BODY:
+            raise HttpError(413, f"Request body is larger than {MAX_BODY} bytes")
+        body = await reader.readexactly(length) if length else b""
+        return method.upper(), target, headers, body
+
+    async def respond(self, method, target, headers, body):
+        """(status, headers, body bytes) for a request"""
+        started = time.perf_counter()
+        url = urlsplit(target)
+        response_headers = {}
+        try:
+            if method == "GET":
+                live = url.path.rstrip("/") in LIVE_PATHS
+                cached = None if live else self.cache.get(target)
+                if cached is None:
+                    payload = await self.dispatch(method, url.path, parse_qs(url.query), None)
+                    body = json.dumps(payload, default=str).encode()
+                    cached = CachedResponse(body) if live else self.cache.put(target, body)
+                response_headers["ETag"] = cached.etag
+                response_headers["Cache-Control"] = "no-cache"
+                if cached.etag in headers.get("if-none-match", ""):
+                    status, content = 304, b""
+                elif "gzip" in headers.get("accept-encoding", "") and len(cached.body) >= GZIP_MIN_SIZE:
+                    status, content = 200, cached.gzipped()
+                    response_headers["Content-Encoding"] = "gzip"
+                else:
+                    status, content = 200, cached.body
+            else:
+                try:
+                    data = json.loads(body) if body else None
+                except ValueError:
+                    raise HttpError(400, "Request body is not valid JSON") from None
+                payload = await self.dispatch(method, url.path, parse_qs(url.query), data)
+                status = 201 if method == "POST" and "id" in payload else 200
+                content = json.dumps(payload, default=str).encode()
+        except HttpError as e:
+            status, content = e.status, json.dumps({"error": str(e)}).encode()
+        except Exception as e:
+            logging.error(f"API error for {method} {target}: {e}")
+            status, content = 500, json.dumps({"error": str(e)}).encode()
+
+        if (status != 304 and "Content-Encoding" not in response_headers and len(content) >= GZIP_MIN_SIZE
+                and "gzip" in headers.get("accept-encoding", "")):
+            content = gzip.compress(content, 5)
+            response_headers["Content-Encoding"] = "gzip"
+        logging.info(f"{method} {target} {status} {(time.perf_counter() - started) * 1000:.1f} ms")
+        return status, response_headers, content
+
+    @staticmethod
+    def format_response(status, headers, content, keep_alive):
+        """Raw HTTP/1.1 response"""
+        lines = [f"HTTP/1.1 {status} {REASONS.get(status, '')}"]
+        if status != 304:
+            lines.append("Content-Type: application/json; charset=utf-8")
+        lines.append(f"Content-Length: {len(content)}")
+        lines.append("Connection: " + ("keep-alive" if keep_alive else "close"))
+        lines.extend(f"{name}: {value}" for name, value in headers.items())
+        return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + content
+
+    async def dispatch(self, method, path, query, data):
+        """Run the handler of a route and return its JSON payload"""
+        parts = [part for part in path.split("/") if part]
+        if parts == ["health"] and method == "GET":
+            return {"status": "ok", "pool": self.pool.stats(), "cache": self.cache.stats()}
+        if not parts or parts[0] != "contacts" or len(parts) > 3 or len(parts) == 3 and not parts[1].isdigit():
+            raise HttpError(404, f"No such resource: {path}")
+
+        resource = parts[1] if len(parts) >= 2 else ""
+        if len(parts) == 3:
+            if parts[2] != "notes":
+                raise HttpError(404, f"No such resource: {path}")
+            if method != "GET":
+                raise HttpError(405, f"{method} is not supported on {path}")
+            return await self.contact_notes(int(resource), query)
+        if resource.isdigit():
+            return await self.contact(method, int(resource), data)
+        handler = {
+            ("GET", ""): self.list_contacts,
+            ("POST", ""): self.add_contact,
+            ("GET", "count"): self.count_contacts,
+            ("GET", "search"): self.search_contacts,
+            ("GET", "fuzzy"): self.fuzzy_search,
+            ("GET", "lookup"): self.lookup_contact,
+            ("POST", "bulk"): self.add_contacts,
+            ("POST", "batch"): self.batch_contacts,
+            ("POST", "headers"): self.contact_headers,
+            ("POST", "update"): self.update_contacts,
+            ("POST", "delete"): self.delete_contacts,
+            ("GET", "duplicates"): self.duplicates,
+            ("POST", "similar"): self.similar_contacts,
+            ("POST", "merge"): self.merge_contacts,
+            ("GET", "changes"): self.changed_contacts,
+            ("GET", "ids"): self.contact_ids,
+            ("GET", "feed"): self.change_feed,
+        }.get((method, resource))
+        if handler is None:
+            raise HttpError(405 if resource in ("", "count", "search", "fuzzy", "lookup", "bulk", "batch", "headers",
+                                                "update", "delete", "duplicates", "similar", "merge", "changes",
+                                                "ids", "feed") else 404,
+                            f"{method} is not supported on {path}")
+        return await handler(query, data)
+
+    async def list_contacts(self, query, data):
+        criteria = _criteria(query)
+        limit = _int_param(query, "limit", 100, MAX_LIMIT)
+        sort = _sort_param(query)
+        if "after" in query:
+            key = _key_param(query, "after", sort)
+            rows = await self.call(lambda repo: repo.fetch_after(criteria, key, limit, sort))
+        elif "before" in query:
+            key = _key_param(query, "before", sort)
+            rows = await self.call(lambda repo: repo.fetch_before(criteria, key, limit, sort))
+        else:
+            offset = _int_param(query, "offset", 0)
+            rows = await self.call(lambda repo: repo.fetch_at(criteria, offset, limit, sort))
+        return {"rows": rows}
+
+    async def count_contacts(self, query, data):
+        criteria = _criteria(query)
+        return {"count": await self.call(lambda repo: repo.count(criteria))}
+
+    async def search_contacts(self, query, data):
+        text = _param(query, "text")
+        criteria = _criteria(query)
+        limit = _int_param(query, "limit", 200, MAX_LIMIT)
+        return {"rows": await self.call(lambda repo: repo.search_text(text, criteria, limit))}
+
+    async def fuzzy_search(self, query, data):
+        text = _param(query, "text")
+        criteria = _criteria(query)
+        limit = _int_param(query, "limit", 200, MAX_LIMIT)
+        return {"rows": await self.call(lambda repo: repo.search_fuzzy(text, criteria, limit))}
+
+    async def lookup_contact(self, query, data):
+        phone = _param(query, "phone")
+        record = await self.call(lambda repo: repo.lookup_by_phone(phone))
+        if record is None:
+            raise HttpError(404, f"No contact with phone number {phone}")
+        return {"contact": record}
+
+    async def contact(self, method, contact_id, data):
+        """GET, PUT or DELETE one contact"""
+        if method == "GET":
+            record = await self.call(lambda repo: repo.get(contact_id))
+            if record is None:
+                raise HttpError(404, f"Contact {contact_id} not found")
+            return {"contact": record}
+
+        if method == "PUT":
+            contact = _contact(data)
+            found = await self.call(lambda repo: repo.update(contact_id, contact))
+        elif method == "DELETE":
+            found = await self.call(lambda repo: repo.delete(contact_id))
+        else:
+            raise HttpError(405, f"{method} is not supported on a contact")
+
+        self.cache.clear()
+        if not found:
+            raise HttpError(404, f"Contact {contact_id} not found")
+        return {"updated" if method == "PUT" else "deleted": contact_id}
+
+    async def contact_notes(self, contact_id, query):
+        offset = _int_param(query, "offset", 0)
+        limit = _int_param(query, "limit", NOTES_CHUNK_SIZE, MAX_NOTES_LIMIT)
+        notes = await self.call(lambda repo: repo.read_notes(contact_id, offset, limit))
+        if notes is None:
+            raise HttpError(404, f"Contact {contact_id} not found")
+        return {"notes": notes}
+
+    async def add_contact(self, query, data):
+        contact = _contact(data)
+        contact_id = await self.call(lambda repo: repo.add(contact))
+        self.cache.clear()
+        return {"id": contact_id}
+
+    async def add_contacts(self, query, data):
+        contacts = [_contact(contact) for contact in (data or {}).get("contacts", [])]
+        added = await self.call(lambda repo: repo.add_many(contacts))
+        self.cache.clear()
+        return {"added": added}
+
+    async def batch_contacts(self, query, data):
+        ids = _ids(data)
+        return {"contacts": await self.call(lambda repo: list(repo.iter_contacts(ids=ids)))}
+
+    async def contact_headers(self, query, data):
+        ids = _ids(data)
+        return {"contacts": await self.call(lambda repo: list(repo.iter_headers(ids)))}
+
+    async def update_contacts(self, query, data):
+        ids = _ids(data)
+        values = data.get("values")
+        if not isinstance(values, dict) or not values or not set(values) <= set(BULK_FIELDS):
+            raise HttpError(400, f"Expected \"values\" with some of {', '.join(BULK_FIELDS)}")
+        values = {field: str(value or "").strip() for field, value in values.items()}
+        for field, value in values.items():
+            length = FIELD_LENGTHS.get(field)
+            if length and len(value) > length:
+                raise HttpError(422, f"{field} is longer than {length} characters")
+        updated = await self.call(lambda repo: repo.update_many(ids, values))
+        self.cache.clear()
+        return {"updated": updated}
+
+    async def delete_contacts(self, query, data):
+        ids = _ids(data)
+        deleted = await self.call(lambda repo: repo.delete_many(ids))
+        self.cache.clear()
+        return {"deleted": deleted}
+
+    async def changed_contacts(self, query, data):
+        since = _param(query, "since") or None
+        after_id = _int_param(query, "after", 0)
+        limit = _int_param(query, "limit", 1000, MAX_LIMIT)
+        return {"contacts": await self.call(lambda repo: repo.changed_since(since, after_id, limit))}
+
+    async def contact_ids(self, query, data):
+        after_id = _int_param(query, "after", 0)
+        limit = _int_param(query, "limit", MAX_LIMIT, MAX_LIMIT)
+        criteria = _criteria(query)
+        return {"ids": await self.call(lambda repo: repo.contact_ids(after_id, limit, criteria))}
+
+    async def change_feed(self, query, data):
+        if "token" not in query:
+            return {"token": await self.call(lambda repo: repo.change_token())}
+        token = _int_param(query, "token", 0)
+        limit = _int_param(query, "limit", 1000, MAX_LIMIT)
+        result = await self.call(lambda repo: repo.changes_since(token, limit))
+        if result is None:
+            raise HttpError(410, f"Change token {token} has expired, reload the contacts")
+        token, changes = result
+        return {"token": token, "changes": changes}
+
+    async def duplicates(self, query, data):
+        threshold = _threshold(_param(query, "threshold", self.settings["dedupe_threshold"]))
+        workers = self.settings["dedupe_workers"]
+        groups = await self.call(lambda repo: repo.find_duplicates(threshold, workers))
+        return {"groups": [{"score": group.score, "contacts": group.records} for group in groups]}
+
+    async def similar_contacts(self, query, data):
+        data = data if isinstance(data, dict) else {}
+        contact = _contact(data.get("contact"))
+        threshold = _threshold(data.get("threshold", self.settings["dedupe_threshold"]))
+        exclude_id = data.get("exclude")
+        limit = data.get("limit", 5)
+        if not isinstance(limit, int) or not 0 < limit <= MAX_LIMIT:
+            raise HttpError(400, f"limit must be an integer from 1 to {MAX_LIMIT}")
+        matches = await self.call(lambda repo: repo.find_similar(contact, threshold, exclude_id, limit))
+        return {"matches": [{"score": score, "contact": record} for record, score in matches]}
+
+    async def merge_contacts(self, query, data):
+        data = data if isinstance(data, dict) else {}
+        keep_id = data.get("keep")
+        merged_ids = data.get("merge")
+        if not isinstance(keep_id, int) or not isinstance(merged_ids, list) or \
+                not all(isinstance(contact_id, int) for contact_id in merged_ids):
+            raise HttpError(400, "Expected {\"keep\": integer, \"merge\": [integer, ...], \"contact\": {...}}")
+        contact = _contact(data.get("contact"))
+        found = await self.call(lambda repo: repo.merge(keep_id, merged_ids, contact))
+        self.cache.clear()
+        if not found:
+            raise HttpError(404, f"Contact {keep_id} not found")
+        return {"kept": keep_id, "deleted": [contact_id for contact_id in merged_ids if contact_id != keep_id]}
+
+
+def serve(settings, host=None, port=None):
+    """Run the API server until interrupted"""
+    server = ContactServer(settings)
+    try:
+        asyncio.run(server.serve(host or settings["api_host"], port or settings["api_port"]))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,182 @@
+"""Local read-only copy of the contacts for a fast, offline-capable start
+
+The desktop application keeps the contacts it last saw in a SQLite file
+(the "snapshot_path" setting) with the same schema and search indexes as the
+SQLite backend. At startup the list is shown from this file right away,
+while the connection to the real database is still being opened, and it
+stays readable when that database cannot be reached.
+
+``sync_snapshot`` brings the copy up to date in the background by following
+the change log of the database, so only changes travel. The first sync pages
+through the contacts in (modified_date, id) order instead, then walks the ids
+of the database to drop the contacts that were deleted there.
+"""
+
+import logging
+import time
+from datetime import datetime
+
+from . import fuzzy, textindex
+from .storage import CONTACT_COLUMNS, WRITE_COLUMNS, SqliteContactRepository
+
+# Contacts written to the snapshot per transaction
+SYNC_BATCH_SIZE = 500
+
+# Ids compared per round trip when looking for deleted contacts
+ID_BATCH_SIZE = 10000
+
+# Columns written for a copied record, ids and dates included
+SNAPSHOT_COLUMNS = ("id",) + WRITE_COLUMNS + ("created_date", "modified_date")
+
+
+def _text(value):
+    """Dates as the text SQLite stores them in"""
+    return value if value is None or isinstance(value, str) else str(value)
+
+
+class SnapshotRepository(SqliteContactRepository):
+    """SQLite copy of the contacts, written only by sync_snapshot"""
+
+    def create_schema(self):
+        """The SQLite schema plus a table for the sync position"""
+        super().create_schema()
+        self.conn.execute("CREATE TABLE IF NOT EXISTS snapshot_state (name TEXT PRIMARY KEY, value TEXT)")
+        self.conn.commit()
+
+    def state(self, name, default=None):
+        """Stored sync state value"""
+        row = self.execute("SELECT value FROM snapshot_state WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else default
+
+    def set_state(self, name, value):
+        """Store a sync state value, committed with the next batch"""
+        self.conn.execute("INSERT OR REPLACE INTO snapshot_state (name, value) VALUES (?, ?)", (name, value))
+
+    def store(self, records):
+        """Insert or replace full records, keeping their ids and dates, and index them"""
+        if not records:
+            return
+        cursor = self.conn.cursor()
+        ids = [record[0] for record in records]
+        for table in ("contact_trigrams", "contact_names"):
+            cursor.execute(f"DELETE FROM {table} WHERE contact_id IN ({', '.join('?' for _ in ids)})", ids)
+        rows, grams, names = [], [], []
+        for record in records:
+            contact = dict(zip(CONTACT_COLUMNS, record))
+            rows.append([record[0]] + self.write_values(contact)
+                        + [_text(contact["created_date"]), _text(contact["modified_date"])])
+            grams += textindex.index_rows(record[0], contact)
+            names += fuzzy.index_rows(record[0], contact)
+        cursor.executemany(f"INSERT OR REPLACE INTO contacts ({', '.join(SNAPSHOT_COLUMNS)}) "
+                           f"VALUES ({', '.join('?' for _ in SNAPSHOT_COLUMNS)})", rows)
+        if grams:
+            cursor.executemany("INSERT INTO contact_trigrams (trigram, field, contact_id) VALUES (?, ?, ?)", grams)
+        self.index_names(cursor, names)
+
+    def remove(self, ids):
+        """Delete copies of contacts that no longer exist"""
+        cursor = self.conn.cursor()
+        for start in range(0, len(ids), SYNC_BATCH_SIZE):
+            chunk = ids[start:start + SYNC_BATCH_SIZE]
+            placeholders = ", ".join("?" for _ in chunk)
+            for table, column in (("contacts", "id"), ("contact_trigrams", "contact_id"), ("contact_names", "contact_id")):
+                cursor.execute(f"DELETE FROM {table} WHERE {column} IN ({placeholders})", chunk)
+
+    def remove_missing(self, after_id, last_id, ids):
+        """Delete the copies with ids in (after_id, last_id] that are not in ids, returns how many
+
+        last_id None means every id after after_id.
+        """
+        where, params = "id > ?", [after_id]
+        if last_id is not None:
+            where += " AND id <= ?"
+            params.append(last_id)
+        present = set(ids)
+        missing = [row[0] for row in self.execute(f"SELECT id FROM contacts WHERE {where}", params).fetchall()
+                   if row[0] not in present]
+        self.remove(missing)
+        return len(missing)
+
+
+def open_snapshot(settings):
+    """Open the snapshot file of the settings, creating its schema if needed"""
+    repo = SnapshotRepository.connect({**settings, "sqlite_path": settings["snapshot_path"]})
+    repo.create_schema()
+    return repo
+
+
+def sync_snapshot(repo, snapshot, batch_size=SYNC_BATCH_SIZE):
+    """Copy the contacts changed since the last sync from repo into snapshot, returns (stored, removed)
+
+    A snapshot that has a change token follows the change log. The first
+    sync, or one whose token has expired, copies the contacts modified since
+    the last record it has, in (modified_date, id) order, and walks the ids
+    to find deleted ones.
+    """
+    started = time.perf_counter()
+    token = snapshot.state("change_token")
+    result = follow_changes(repo, snapshot, int(token), batch_size) if token is not None else None
+    if result is None:
+        token = repo.change_token()
+        result = copy_modified(repo, snapshot, batch_size)
+        snapshot.set_state("change_token", str(token))
+
+    snapshot.set_state("synced_at", datetime.now().isoformat(" ", "seconds"))
+    snapshot.commit()
+    stored, removed = result
+    logging.info(f"Snapshot synced: {stored} contacts copied, {removed} removed "
+                 f"in {time.perf_counter() - started:.2f} s")
+    return result
+
+
+def follow_changes(repo, snapshot, token, batch_size):
+    """Apply the change log after token, returns (stored, removed) or None if the token has expired"""
+    stored = removed = 0
+    while True:
+        result = repo.changes_since(token, batch_size)
+        if result is None:
+            return None
+        token, changes = result
+        if not changes:
+            return stored, removed
+        records = [record for _, _, record in changes if record is not None]
+        deleted = [contact_id for contact_id, _, record in changes if record is None]
+        snapshot.store(records)
+        snapshot.remove(deleted)
+        snapshot.set_state("change_token", str(token))
+        snapshot.commit()
+        stored += len(records)
+        removed += len(deleted)
+
+
+def copy_modified(repo, snapshot, batch_size):
+    """Copy the contacts modified after the newest one copied and drop deleted ones, returns (stored, removed)
+
+    Pages continue after the (modified_date, id) of the last record, so a
+    bulk import that shares one timestamp is read once. A later copy starts
+    again at that modified_date with any id: contacts with lower ids may have
+    been changed within the same clock tick after the previous copy ended.
+    """
+    since = snapshot.state("synced_through")
+    after_id = 0
+    stored = 0
+    while True:
+        records = repo.changed_since(since, after_id, batch_size)
+        if not records:
+            break
+        snapshot.store(records)
+        since, after_id = records[-1][-1], records[-1][0]
+        snapshot.set_state("synced_through", _text(since))
+        snapshot.commit()
+        stored += len(records)
+
+    removed = 0
+    after_id = 0
+    while True:
+        ids = repo.contact_ids(after_id, ID_BATCH_SIZE)
+        last_id = ids[-1] if len(ids) == ID_BATCH_SIZE else None
+        removed += snapshot.remove_missing(after_id, last_id, ids)
+        if last_id is None:
+            break
+        after_id = last_id
+    return stored, removed
@@ -0,0 +1,992 @@
+"""Storage backends for the contacts table
+
+ContactRepository holds the SQL shared by every backend. The subclasses fill
+in the dialect specific parts: schema migrations, paging syntax and how the id
+of a new row is returned. A repository wraps a single connection and is
+used by one thread at a time; the query workers check repositories out of a
+ConnectionPool that opens them with ``open_repository``.
+"""
+
+import logging
+import sqlite3
+from collections import OrderedDict
+from datetime import datetime
+
+from . import fuzzy, migrations, phones, textindex
+
+# Columns of a list row
+LIST_COLUMNS = ("id", "first_name", "last_name", "phone", "email", "company")
+
+# Columns of a full contact record
+CONTACT_COLUMNS = ("id", "first_name", "last_name", "phone", "email", "address",
+                   "company", "notes", "created_date", "modified_date")
+
+# Columns of a contact header: a full record with only the start of the
+# notes, followed by the length of the whole notes
+HEADER_COLUMNS = CONTACT_COLUMNS + ("notes_length",)
+
+# Characters of the notes in a contact header
+NOTES_PREVIEW_LENGTH = 500
+
+# Characters of the notes read per request when they are shown in full
+NOTES_CHUNK_SIZE = 65536
+
+# Fields that can be written
+CONTACT_FIELDS = ("first_name", "last_name", "phone", "email", "address", "company", "notes")
+
+# Normalized phone columns derived from phone on every write
+PHONE_COLUMNS = ("phone_digits", "phone_e164", "phone_reversed")
+
+# Columns written by add and update
+WRITE_COLUMNS = CONTACT_FIELDS + PHONE_COLUMNS
+
+# Longest value the schema accepts for each field
+FIELD_LENGTHS = {
+    "first_name": 50,
+    "last_name": 50,
+    "phone": 20,
+    "email": 100,
+    "address": 255,
+    "company": 100,
+}
+
+# Search criteria fields
+SEARCH_FIELDS = ("first_name", "last_name", "phone")
+
+# Fields that can be set to one value on many contacts at once
+BULK_FIELDS = ("address", "company", "notes")
+
+# Ids per IN list of a bulk statement, SQL Server accepts 2100 parameters
+BULK_CHUNK_SIZE = 1000
+
+# List orders: sort column -> columns of the keyset key, each backed by an
+# index on exactly these columns (id is implied by the index on SQL Server
+# and SQLite alike)
+SORT_COLUMNS = {
+    "last_name": ("last_name", "first_name", "id"),
+    "first_name": ("first_name", "last_name", "id"),
+    "phone": ("phone", "id"),
+    "email": ("email", "id"),
+    "company": ("company", "id"),
+}
+DEFAULT_SORT = "last_name"
+
+# Columns read to verify and rank text search candidates
+TEXT_SEARCH_COLUMNS = LIST_COLUMNS + ("notes",)
+
+# List columns the change log keeps of a contact as it was before each change
+CHANGE_COLUMNS = LIST_COLUMNS[1:]
+
+
+def notes_truncated(record):
+    """True if a record is a contact header that has only the start of its notes"""
+    return len(record) > len(CONTACT_COLUMNS) and (record[-1] or 0) > len(record[7] or "")
+
+
+def sort_columns(sort=None):
+    """(key columns, descending) of a sort such as "email" or "-email" """
+    sort = sort or DEFAULT_SORT
+    columns = SORT_COLUMNS.get(sort.lstrip("-"))
+    if columns is None:
+        raise ValueError(f"Unknown sort column: {sort}")
+    return columns, sort.startswith("-")
+
+
+class ContactRepository:
+    """Data access for the contacts table"""
+
+    # SQL expression for the current time
+    NOW = "CURRENT_TIMESTAMP"
+
+    # Characters that must be escaped in LIKE patterns
+    LIKE_SPECIAL = "\\%_"
+
+    # Most statements that keep their own cursor on a connection
+    STATEMENT_CACHE_SIZE = 64
+
+    # Change log: the change token of an entry, the column entries are
+    # ordered by, the parameter a token is compared with, and the entries
+    # that are safe to hand out - none that an open transaction could still
+    # precede
+    CHANGE_TOKEN = "seq"
+    CHANGE_ORDER = "seq"
+    CHANGE_PARAM = "?"
+    CHANGE_VISIBLE = "1=1"
+
+    # SQL expression for the time a number of days (the parameter) ago
+    DAYS_AGO = "datetime('now', '-' || ? || ' days')"
+
+    # SQL expressions for a part of the notes (the parameters are its first
+    # character, counting from 1, and its length) and for their length
+    NOTES_PART = "substr(notes, ?, ?)"
+    NOTES_LENGTH = "length(notes)"
+
+    def __init__(self, conn, settings=None):
+        self.conn = conn
+        self.settings = settings or {}
+        self.statements = OrderedDict()
+
+    def close(self):
+        """Close the connection"""
+        self.statements.clear()
+        self.conn.close()
+
+    def ping(self):
+        """Run a trivial query, raising if the connection is dead"""
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT 1")
+        cursor.fetchone()
+        cursor.close()
+
+    def execute(self, query, params=()):
+        """Run a query on a cursor kept for its SQL text and return the cursor
+
+        pyodbc prepares a statement again only when the SQL text of a cursor
+        changes, so repeated page, count and detail queries skip the prepare
+        round-trip. The rows must be fetched before the statement runs again.
+        """
+        cursor = self.statements.pop(query, None) or self.conn.cursor()
+        self.statements[query] = cursor
+        if len(self.statements) > self.STATEMENT_CACHE_SIZE:
+            self.statements.popitem(last=False)[1].close()
+        cursor.execute(query, params)
+        return cursor
+
+    def commit(self):
+        """Commit the current transaction"""
+        self.conn.commit()
+
+    def rollback(self):
+        """Roll back the current transaction"""
+        self.conn.rollback()
+
+    # Schema migrations of the backend
+    MIGRATIONS = None
+
+    def create_schema(self):
+        """Create or upgrade the schema by applying missing migrations, then prune the change log"""
+        migrations.migrate(self, self.MIGRATIONS)
+        self.prune_changes(self.settings.get("change_log_days", 30))
+        logging.info("Contacts table created/verified")
+
+    def select_page(self, columns, where, params, order, limit, offset=None, table="contacts"):
+        """Run a SELECT that returns at most limit rows"""
+        raise NotImplementedError
+
+    def insert_contact(self, cursor, values):
+        """Insert a contact row and return its id"""
+        raise NotImplementedError
+
+    def insert_contacts(self, cursor, rows):
+        """Insert contact rows in batched statements and return their ids, in the order of rows"""
+        raise NotImplementedError
+
+    def executemany(self, cursor, query, rows):
+        """Run a statement for many parameter rows"""
+        cursor.executemany(query, rows)
+
+    def write_values(self, contact):
+        """Values of WRITE_COLUMNS for a contact dict"""
+        country_code = self.settings.get("default_country_code", "")
+        # Empty strings rather than NULL, so keyset comparisons on sortable columns hold
+        return ([contact.get(field) or "" for field in CONTACT_FIELDS]
+                + list(phones.normalize(contact.get("phone"), country_code)))
+
+    def backfill_phone_columns(self, batch_size=1000):
+        """Fill the normalized phone columns of rows written before they existed
+
+        Runs before the trigram index exists; rebuild_search_index indexes
+        the phone numbers of these rows afterwards.
+        """
+        cursor = self.conn.cursor()
+        country_code = self.settings.get("default_country_code", "")
+        updated = 0
+        while True:
+            rows = self.select_page(("id", "phone"), "phone_digits IS NULL", [], "id", batch_size)
+            if not rows:
+                break
+            self.executemany(cursor, "UPDATE contacts SET phone_digits=?, phone_e164=?, phone_reversed=? WHERE id=?",
+                             [list(phones.normalize(phone, country_code)) + [contact_id] for contact_id, phone in rows])
+            self.conn.commit()
+            updated += len(rows)
+        if updated:
+            logging.info(f"Normalized phone numbers of {updated} contacts")
+
+    def index_contact(self, cursor, contact_id, contact, replace=False):
+        """Store the search index trigrams and name words of a contact"""
+        if replace:
+            cursor.execute("DELETE FROM contact_trigrams WHERE contact_id = ?", (contact_id,))
+            cursor.execute("DELETE FROM contact_names WHERE contact_id = ?", (contact_id,))
+        rows = textindex.index_rows(contact_id, contact)
+        if rows:
+            self.executemany(cursor, "INSERT INTO contact_trigrams (trigram, field, contact_id) VALUES (?, ?, ?)", rows)
+        self.index_names(cursor, fuzzy.index_rows(contact_id, contact))
+
+    def index_names(self, cursor, rows):
+        """Store (word, field code, contact id) rows and the phonetic keys of new words"""
+        if not rows:
+            return
+        self.executemany(cursor, "INSERT INTO contact_names (word, field, contact_id) VALUES (?, ?, ?)", rows)
+        self.executemany(cursor, "INSERT INTO name_words (word, phonetic_key) SELECT ?, ? "
+                                 "WHERE NOT EXISTS (SELECT 1 FROM name_words WHERE word = ?)",
+                         [(word, key, word) for word, key in fuzzy.vocabulary(rows)])
+
+    def index_missing(self, cursor, after_id, batch_size):
+        """Index up to batch_size contacts after after_id that have no trigrams yet
+
+        Returns the number of contacts indexed and the last id looked at.
+        """
+        columns = ("id",) + tuple(textindex.FIELD_CODES)
+        where = "id > ? AND NOT EXISTS (SELECT 1 FROM contact_trigrams t WHERE t.contact_id = contacts.id)"
+        rows = self.select_page(columns, where, [after_id], "id", batch_size)
+        grams = [gram for row in rows for gram in textindex.index_rows(row[0], dict(zip(columns, row)))]
+        if grams:
+            self.executemany(cursor, "INSERT INTO contact_trigrams (trigram, field, contact_id) VALUES (?, ?, ?)", grams)
+        return len(rows), rows[-1][0] if rows else after_id
+
+    def index_missing_names(self, cursor, after_id, batch_size):
+        """Index the name words of up to batch_size contacts after after_id that have none yet
+
+        Returns the number of contacts looked at and the last id looked at.
+        """
+        columns = ("id",) + fuzzy.NAME_FIELDS
+        where = "id > ? AND NOT EXISTS (SELECT 1 FROM contact_names n WHERE n.contact_id = contacts.id)"
+        rows = self.select_page(columns, where, [after_id], "id", batch_size)
+        self.index_names(cursor, [name for row in rows for name in fuzzy.index_rows(row[0], dict(zip(columns, row)))])
+        return len(rows), rows[-1][0] if rows else after_id
+
+    def rebuild_name_index(self, batch_size=1000):
+        """Index the name words of contacts missing from contact_names, e.g. after an upgrade"""
+        cursor = self.conn.cursor()
+        last_id = 0
+        indexed = 0
+        while True:
+            count, last_id = self.index_missing_names(cursor, last_id, batch_size)
+            if not count:
+                break
+            self.conn.commit()
+            indexed += count
+        if indexed:
+            logging.info(f"Name index built for {indexed} contacts")
+
+    def rebuild_search_index(self, batch_size=1000):
+        """Index contacts that are missing from contact_trigrams, e.g. after an upgrade"""
+        cursor = self.conn.cursor()
+        last_id = 0
+        indexed = 0
+        while True:
+            count, last_id = self.index_missing(cursor, last_id, batch_size)
+            if not count:
+                break
+            self.conn.commit()
+            indexed += count
+        if indexed:
+            logging.info(f"Search index built for {indexed} contacts")
+
+    def like_pattern(self, value):
+        """LIKE pattern matching value anywhere, with wildcards escaped
+
+        Search terms are plain text, so the in-memory search cache can refine
+        results with the same meaning as the database.
+        """
+        for char in self.LIKE_SPECIAL:
+            value = value.replace(char, "\\" + char)
+        return f"%{value}%"
+
+    def build_filter(self, criteria):
+        """WHERE clause and parameters for search criteria
+
+        Terms of three or more characters are narrowed with the trigram index
+        first; LIKE then only checks the remaining candidates.
+        """
+        where = "1=1"
+        params = []
+        for field in SEARCH_FIELDS:
+            value = (criteria or {}).get(field)
+            if not value:
+                continue
+            column = field
+            if field == "phone":
+                # Phone numbers match by digits, whatever their formatting
+                if not phones.digits_only(value):
+                    where += " AND phone LIKE ? ESCAPE '\\'"
+                    params.append(self.like_pattern(value))
+                    continue
+                column, value = "phone_digits", phones.digits_only(value)
+            grams = textindex.query_trigrams([value.casefold()])
+            if grams:
+                where += (" AND id IN (SELECT contact_id FROM contact_trigrams WHERE field = ? "
+                          f"AND trigram IN ({', '.join('?' for _ in grams)}) "
+                          "GROUP BY contact_id HAVING COUNT(*) = ?)")
+                params += [textindex.FIELD_CODES[field]] + grams + [len(grams)]
+            where += f" AND {column} LIKE ? ESCAPE '\\'"
+            params.append(self.like_pattern(value))
+        return where, params
+
+    def count(self, criteria=None):
+        """Number of contacts matching the criteria"""
+        where, params = self.build_filter(criteria)
+        return self.execute(f"SELECT COUNT(*) FROM contacts WHERE {where}", params).fetchone()[0]
+
+    @staticmethod
+    def order_by(sort=None, reverse=False):
+        """ORDER BY clause of a sort, or of its reverse"""
+        columns, descending = sort_columns(sort)
+        return ", ".join(f"{column} DESC" if descending != reverse else column for column in columns)
+
+    @staticmethod
+    def keyset_filter(sort, key, forward):
+        """WHERE clause and parameters for the rows after (or before) a key in a sort
+
+        For the default sort and forward this is
+        last_name >= ? AND (last_name > ? OR (last_name = ? AND (first_name > ? OR (first_name = ? AND id > ?))))
+        The redundant leading bound lets the index seek to the key instead of scanning up to it.
+        """
+        columns, descending = sort_columns(sort)
+        if len(key) != len(columns):
+            raise ValueError(f"Expected a key of {', '.join(columns)}")
+        greater = forward != descending
+        compare, bound = (">", ">=") if greater else ("<", "<=")
+        clause, params = f"{columns[-1]} {compare} ?", [key[-1]]
+        for column, value in zip(reversed(columns[:-1]), reversed(key[:-1])):
+            clause = f"{column} {compare} ? OR ({column} = ? AND ({clause}))"
+            params = [value, value] + params
+        return f"{columns[0]} {bound} ? AND ({clause})", [key[0]] + params
+
+    def fetch_at(self, criteria, offset, limit, sort=None):
+        """List rows starting at an absolute position"""
+        where, params = self.build_filter(criteria)
+        return self.select_page(LIST_COLUMNS, where, params, self.order_by(sort), limit, offset)
+
+    def fetch_after(self, criteria, key, limit, sort=None):
+        """List rows that follow a key of the sort columns"""
+        where, params = self.build_filter(criteria)
+        keyset, keyset_params = self.keyset_filter(sort, key, forward=True)
+        return self.select_page(LIST_COLUMNS, f"{where} AND {keyset}", params + keyset_params,
+                                self.order_by(sort), limit)
+
+    def fetch_before(self, criteria, key, limit, sort=None):
+        """List rows that precede a key of the sort columns, in list order"""
+        where, params = self.build_filter(criteria)
+        keyset, keyset_params = self.keyset_filter(sort, key, forward=False)
+        return self.select_page(LIST_COLUMNS, f"{where} AND {keyset}", params + keyset_params,
+                                self.order_by(sort, reverse=True), limit)[::-1]
+
+    def search_text(self, text, criteria=None, limit=200, max_candidates=5000):
+        """Contacts containing every word of text in an indexed field, best matches first
+
+        Candidates are found through the trigram index (words shorter than
+        three characters fall back to LIKE), then verified and ranked in
+        Python. When there are more than max_candidates, the ones whose
+        trigrams hit the most heavily weighted fields are kept. Returns list
+        rows.
+        """
+        words = textindex.split_words(text)
+        if not words:
+            return []
+        where, params = self.build_filter(criteria)
+        table, order, table_params = "contacts", "id", []
+        grams = textindex.query_trigrams(words)
+        if grams:
+            # Weighted trigram hits per contact, so the cap keeps the likely best matches
+            weights = " ".join(f"WHEN {code} THEN {textindex.FIELD_WEIGHTS[field]}"
+                               for field, code in textindex.FIELD_CODES.items())
+            table = ("contacts JOIN (SELECT contact_id, SUM(CASE field " + weights + " END) AS hits "
+                     f"FROM contact_trigrams WHERE trigram IN ({', '.join('?' for _ in grams)}) "
+                     "GROUP BY contact_id HAVING COUNT(DISTINCT trigram) = ?) matches "
+                     "ON matches.contact_id = contacts.id")
+            order = "matches.hits DESC, id"
+            table_params = grams + [len(grams)]
+        for word in words:
+            if len(word) < 3:
+                where += " AND (" + " OR ".join(f"{field} LIKE ? ESCAPE '\\'" for field in textindex.FIELD_CODES) + ")"
+                params += [self.like_pattern(word)] * len(textindex.FIELD_CODES)
+
+        candidates = self.select_page(TEXT_SEARCH_COLUMNS, where, table_params + params, order,
+                                      max_candidates, table=table)
+        ranked = []
+        for row in candidates:
+            rank = textindex.score(dict(zip(TEXT_SEARCH_COLUMNS, row)), words)
+            if rank:
+                ranked.append((-rank, (row[2] or "").casefold(), (row[1] or "").casefold(), row[0], row))
+        ranked.sort()
+        return [entry[-1][:len(LIST_COLUMNS)] for entry in ranked[:limit]]
+
+    def search_fuzzy(self, text, criteria=None, limit=200):
+        """Contacts whose names sound like the search, closest spellings first
+
+        The first and last name criteria match their own field, the words of
+        text match either name, the phone criterion filters as usual. Each
+        word is looked up by its phonetic key in name_words; the spellings
+        found are ranked by edit distance and the contacts with the closest
+        ones are fetched first through the index on contact_names, until
+        there are limit candidates. Returns list rows.
+        """
+        terms = fuzzy.query_terms({**(criteria or {}), "text": text})
+        if not terms:
+            return []
+        spellings = []
+        for _, word in terms:
+            rows = self.execute("SELECT word FROM name_words WHERE phonetic_key = ?",
+                                (fuzzy.phonetic_key(word),)).fetchall()
+            limit_distance = fuzzy.max_distance(word)
+            accepted = {}
+            for (spelling,) in rows:
+                edits = fuzzy.distance(word, spelling, limit_distance)
+                if edits <= limit_distance:
+                    accepted[spelling] = edits
+            if not accepted:
+                return []
+            spellings.append(accepted)
+
+        base_where, base_params = self.build_filter({"phone": (criteria or {}).get("phone")})
+        # The longest word is usually the rarest, its matches drive the query
+        order = sorted(range(len(terms)), key=lambda index: -len(terms[index][1]))
+        candidates = {}
+        for tier in sorted({edits for accepted in spellings for edits in accepted.values()}):
+            if any(min(accepted.values()) > tier for accepted in spellings):
+                continue
+            where, params = base_where, list(base_params)
+            for position, index in enumerate(order):
+                field, _ = terms[index]
+                words = [spelling for spelling, edits in spellings[index].items() if edits <= tier]
+                lookup = (f"FROM contact_names n WHERE n.word IN ({', '.join('?' for _ in words)})"
+                          + (" AND n.field = ?" if field else ""))
+                if position == 0:
+                    where += f" AND id IN (SELECT n.contact_id {lookup})"
+                else:
+                    where += f" AND EXISTS (SELECT 1 {lookup} AND n.contact_id = contacts.id)"
+                params += words + ([textindex.FIELD_CODES[field]] if field else [])
+            for row in self.select_page(LIST_COLUMNS, where, params, "id", limit):
+                candidates[row[0]] = row
+            if len(candidates) >= limit:
+                break
+
+        ranked = []
+        for row in candidates.values():
+            edits = fuzzy.rank(row[1], row[2], terms, spellings)
+            if edits is not None:
+                ranked.append((edits, fuzzy.fold(row[2]), fuzzy.fold(row[1]), row[0], tuple(row)))
+        ranked.sort()
+        return [entry[-1] for entry in ranked[:limit]]
+
+    def lookup_by_phone(self, number, min_suffix=phones.MIN_SUFFIX_DIGITS):
+        """Full record of the contact an incoming number belongs to, or None
+
+        A number with the same digits wins. Otherwise the contact whose number
+        shares the most trailing digits (at least min_suffix) is returned, so
+        "+1 555 123 4567" finds "555-1234567"; the longest shared suffix is
+        found by binary search over its length, each probe an index seek.
+        """
+        digits = phones.digits_only(number)
+        if not digits:
+            return None
+        query = f"SELECT {', '.join(CONTACT_COLUMNS)} FROM contacts WHERE phone_digits = ? ORDER BY id"
+        row = self.execute(query, (digits,)).fetchone()
+        if row:
+            return tuple(row)
+        if len(digits) < min_suffix:
+            return None
+        reversed_digits = digits[::-1]
+        best = None
+        low, high = min_suffix, len(digits)
+        while low <= high:
+            length = (low + high) // 2
+            rows = self.select_page(CONTACT_COLUMNS, "phone_reversed LIKE ?", [reversed_digits[:length] + "%"], "id", 1)
+            if rows:
+                best, low = rows[0], length + 1
+            else:
+                high = length - 1
+        return tuple(best) if best else None
+
+    def iter_contacts(self, criteria=None, ids=None, chunk_size=1000, sort=None):
+        """Yield full contact records with constant memory
+
+        Either every contact matching criteria in the order of sort, read with
+        fetchmany, or the contacts in ids in the given order, read with
+        chunked IN lists.
+        """
+        columns = ", ".join(CONTACT_COLUMNS)
+        cursor = self.conn.cursor()
+        if ids is None:
+            where, params = self.build_filter(criteria)
+            cursor.execute(f"SELECT {columns} FROM contacts WHERE {where} ORDER BY {self.order_by(sort)}", params)
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield tuple(row)
+            return
+
+        ids = list(ids)
+        for start in range(0, len(ids), chunk_size):
+            chunk = ids[start:start + chunk_size]
+            cursor.execute(f"SELECT {columns} FROM contacts WHERE id IN ({', '.join('?' for _ in chunk)})", chunk)
+            found = {row[0]: tuple(row) for row in cursor.fetchall()}
+            for contact_id in chunk:
+                if contact_id in found:
+                    yield found[contact_id]
+
+    def iter_headers(self, ids, chunk_size=1000):
+        """Yield the headers (HEADER_COLUMNS) of the contacts in ids, in the given order
+
+        Only the first NOTES_PREVIEW_LENGTH characters of the notes are read,
+        so browsing contacts does not move long notes; read_notes reads the
+        rest when they are shown.
+        """
+        columns = ", ".join(self.NOTES_PART if column == "notes" else column for column in CONTACT_COLUMNS)
+        cursor = self.conn.cursor()
+        ids = list(ids)
+        for start in range(0, len(ids), chunk_size):
+            chunk = ids[start:start + chunk_size]
+            cursor.execute(f"SELECT {columns}, {self.NOTES_LENGTH} FROM contacts "
+                           f"WHERE id IN ({', '.join('?' for _ in chunk)})", [1, NOTES_PREVIEW_LENGTH] + chunk)
+            found = {row[0]: tuple(row) for row in cursor.fetchall()}
+            for contact_id in chunk:
+                if contact_id in found:
+                    yield found[contact_id]
+
+    def get_header(self, contact_id):
+        """Contact header, or None"""
+        return next(self.iter_headers([contact_id]), None)
+
+    def read_notes(self, contact_id, offset=0, limit=NOTES_CHUNK_SIZE):
+        """Up to limit characters of a contact's notes from offset, "" past their end or None if it does not exist"""
+        row = self.execute(f"SELECT {self.NOTES_PART} FROM contacts WHERE id = ?",
+                           (offset + 1, limit, contact_id)).fetchone()
+        if row is None:
+            return None
+        return row[0] or ""
+
+    def timestamp(self, value):
+        """Database parameter of a modified_date read back as text"""
+        return value
+
+    def changed_since(self, since=None, after_id=0, limit=1000):
+        """Full records modified after (since, after_id), in (modified_date, id) order
+
+        Copies of the table page through the changes by passing the
+        modified_date and id of the last record received; since None starts
+        from the oldest contact.
+        """
+        where, params = "1=1", []
+        if since is not None:
+            since = self.timestamp(since)
+            where = "modified_date >= ? AND (modified_date > ? OR (modified_date = ? AND id > ?))"
+            params = [since, since, since, after_id]
+        return [tuple(row) for row in self.select_page(CONTACT_COLUMNS, where, params, "modified_date, id", limit)]
+
+    def contact_ids(self, after_id=0, limit=10000, criteria=None):
+        """Ids greater than after_id in order, of every contact or of those matching criteria
+
+        Used to find the contacts a copy still has after they were deleted,
+        and to select every contact of a result without reading its rows.
+        """
+        where, params = self.build_filter(criteria)
+        return [row[0] for row in self.select_page(("id",), f"id > ? AND {where}", [after_id] + params, "id", limit)]
+
+    def log_changes(self, cursor, operation, where, params):
+        """Append the contacts matching where to the change log with their current list columns
+
+        Called before an update or delete, so the log keeps the row as it
+        was; operation is "I", "U" or "D".
+        """
+        columns = ", ".join(CHANGE_COLUMNS)
+        cursor.execute(f"INSERT INTO contact_changes (contact_id, operation, {columns}) "
+                       f"SELECT id, ?, {columns} FROM contacts WHERE {where}", [operation] + list(params))
+
+    def pruned_through(self):
+        """Newest change token removed from the log, older tokens cannot be followed"""
+        return self.execute("SELECT pruned_through FROM change_log").fetchone()[0]
+
+    def change_token(self):
+        """Token of the newest change, to follow the changes made after a full load"""
+        rows = self.select_page((self.CHANGE_TOKEN,), self.CHANGE_VISIBLE, [], f"{self.CHANGE_ORDER} DESC", 1,
+                                table="contact_changes")
+        return rows[0][0] if rows else self.pruned_through()
+
+    def changes_since(self, token, limit=1000):
+        """(token, changes) of the contacts changed after a change token, None if it has expired
+
+        changes holds (id, list row before the first change or None if it was
+        added, full record now or None if deleted) per contact. At most limit
+        log entries are read; pass the returned token to read the next ones.
+        """
+        if token < self.pruned_through():
+            return None
+        where = f"{self.CHANGE_ORDER} > {self.CHANGE_PARAM} AND {self.CHANGE_VISIBLE}"
+        rows = self.select_page((self.CHANGE_TOKEN, "contact_id", "operation") + CHANGE_COLUMNS, where, [token],
+                                self.CHANGE_ORDER, limit, table="contact_changes")
+        if not rows:
+            return token, []
+        old_rows = {}
+        for row in rows:
+            if row[1] not in old_rows:
+                old_rows[row[1]] = None if row[2] == "I" else (row[1],) + tuple(row[3:])
+        records = {record[0]: record for record in self.iter_contacts(ids=list(old_rows))}
+        return rows[-1][0], [(contact_id, old_row, records.get(contact_id)) for contact_id, old_row in old_rows.items()]
+
+    def prune_changes(self, days):
+        """Drop change log entries older than days, remembering the newest token dropped - returns how many"""
+        where = f"changed_date < {self.DAYS_AGO}"
+        newest = self.select_page((self.CHANGE_TOKEN,), where, [days], f"{self.CHANGE_ORDER} DESC", 1,
+                                  table="contact_changes")
+        if not newest:
+            return 0
+        cursor = self.conn.cursor()
+        cursor.execute(f"DELETE FROM contact_changes WHERE {where}", (days,))
+        pruned = cursor.rowcount
+        cursor.execute("UPDATE change_log SET pruned_through = ?", (newest[0][0],))
+        self.conn.commit()
+        logging.info(f"Pruned {pruned} change log entries older than {days} days")
+        return pruned
+
+    def duplicate_blocks(self, batch_size=5000):
+        """Lists of ids of contacts sharing a phone number, an email address or a name key
+
+        Phone and email blocks are grouped by the database, email addresses
+        by LOWER(email) whatever the collation of the column; name keys are
+        computed from the words and phonetic keys of the name index while the
+        names are streamed.
+        """
+        from .dedupe import name_key
+
+        for column, key in (("phone_digits", "phone_digits"), ("email", "LOWER(email)")):
+            rows = self.execute(f"SELECT {key}, id FROM contacts WHERE {key} IN "
+                                f"(SELECT {key} FROM contacts WHERE {column} <> '' "
+                                f"GROUP BY {key} HAVING COUNT(*) > 1) ORDER BY {key}, id").fetchall()
+            block, value = [], None
+            for row in rows:
+                if row[0] != value:
+                    if len(block) > 1:
+                        yield block
+                    block, value = [], row[0]
+                block.append(row[1])
+            if len(block) > 1:
+                yield block
+
+        keys = dict(self.execute("SELECT word, phonetic_key FROM name_words").fetchall())
+        blocks = {}
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT id, first_name, last_name FROM contacts")
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            for contact_id, first_name, last_name in rows:
+                blocks.setdefault(name_key(first_name, last_name, keys), []).append(contact_id)
+        yield from (block for key, block in blocks.items() if key and len(block) > 1)
+
+    def blocking_candidates(self, contact, limit=50):
+        """Ids of contacts sharing a blocking key with a contact dict, found through indexes"""
+        ids = set()
+        digits = phones.digits_only(contact.get("phone"))
+        if digits:
+            ids.update(row[0] for row in self.select_page(("id",), "phone_digits = ?", [digits], "id", limit))
+        email = (contact.get("email") or "").strip()
+        if email:
+            ids.update(row[0] for row in self.select_page(("id",), "email = ?", [email], "id", limit))
+        names = {field: contact.get(field) for field in fuzzy.NAME_FIELDS}
+        if all(fuzzy.name_words(name) for name in names.values()):
+            ids.update(row[0] for row in self.search_fuzzy("", names, limit))
+        return ids
+
+    def find_duplicates(self, threshold=0.75, workers=1):
+        """Groups of probable duplicates in the whole table (see dedupe.find_duplicates)"""
+        from .dedupe import find_duplicates
+        return find_duplicates(self, threshold, workers)
+
+    def find_similar(self, contact, threshold=0.75, exclude_id=None, limit=5):
+        """(record, score) of existing contacts a contact dict probably duplicates"""
+        from .dedupe import find_similar
+        return find_similar(self, contact, threshold, exclude_id, limit)
+
+    def get(self, contact_id):
+        """Full contact record, or None"""
+        row = self.execute(f"SELECT {', '.join(CONTACT_COLUMNS)} FROM contacts WHERE id = ?", (contact_id,)).fetchone()
+        return tuple(row) if row else None
+
+    def add(self, contact):
+        """Insert a contact and return its id"""
+        cursor = self.conn.cursor()
+        contact_id = self.insert_contact(cursor, self.write_values(contact))
+        self.index_contact(cursor, contact_id, contact)
+        self.log_changes(cursor, "I", "id = ?", [contact_id])
+        self.conn.commit()
+        return contact_id
+
+    def add_many(self, contacts):
+        """Insert a batch of contacts in one transaction, returns the number inserted
+
+        The rows go to the server in a few batched statements (see
+        insert_contacts) that report the ids given to them, then the new rows
+        are indexed and logged by those ids and the batch is committed once.
+        Rows inserted meanwhile by other connections are left to their own
+        writers.
+        """
+        if not contacts:
+            return 0
+        cursor = self.conn.cursor()
+        ids = self.insert_contacts(cursor, [self.write_values(contact) for contact in contacts])
+        grams = [gram for contact_id, contact in zip(ids, contacts) for gram in textindex.index_rows(contact_id, contact)]
+        if grams:
+            self.executemany(cursor, "INSERT INTO contact_trigrams (trigram, field, contact_id) VALUES (?, ?, ?)", grams)
+        self.index_names(cursor, [name for contact_id, contact in zip(ids, contacts)
+                                  for name in fuzzy.index_rows(contact_id, contact)])
+        for start in range(0, len(ids), BULK_CHUNK_SIZE):
+            chunk = ids[start:start + BULK_CHUNK_SIZE]
+            self.log_changes(cursor, "I", f"id IN ({', '.join('?' for _ in chunk)})", chunk)
+        self.conn.commit()
+        return len(contacts)
+
+    def update(self, contact_id, contact):
+        """Update a contact, returns True if it exists"""
+        assignments = ", ".join(f"{column}=?" for column in WRITE_COLUMNS)
+        query = f"UPDATE contacts SET {assignments}, modified_date={self.NOW} WHERE id=?"
+        cursor = self.conn.cursor()
+        self.log_changes(cursor, "U", "id = ?", [contact_id])
+        cursor.execute(query, self.write_values(contact) + [contact_id])
+        updated = cursor.rowcount > 0
+        if updated:
+            self.index_contact(cursor, contact_id, contact, replace=True)
+        self.conn.commit()
+        return updated
+
+    def merge(self, keep_id, merged_ids, contact):
+        """Replace keep_id with contact and delete merged_ids, in one transaction
+
+        Returns True if keep_id exists; nothing is deleted otherwise.
+        """
+        assignments = ", ".join(f"{column}=?" for column in WRITE_COLUMNS)
+        cursor = self.conn.cursor()
+        self.log_changes(cursor, "U", "id = ?", [keep_id])
+        cursor.execute(f"UPDATE contacts SET {assignments}, modified_date={self.NOW} WHERE id=?",
+                       self.write_values(contact) + [keep_id])
+        if cursor.rowcount <= 0:
+            self.conn.rollback()
+            return False
+        self.index_contact(cursor, keep_id, contact, replace=True)
+        merged_ids = [contact_id for contact_id in merged_ids if contact_id != keep_id]
+        if merged_ids:
+            placeholders = ", ".join("?" for _ in merged_ids)
+            self.log_changes(cursor, "D", f"id IN ({placeholders})", merged_ids)
+            for table, column in (("contacts", "id"), ("contact_trigrams", "contact_id"), ("contact_names", "contact_id")):
+                cursor.execute(f"DELETE FROM {table} WHERE {column} IN ({placeholders})", merged_ids)
+        self.conn.commit()
+        return True
+
+    def delete(self, contact_id):
+        """Delete a contact, returns True if it existed"""
+        cursor = self.conn.cursor()
+        self.log_changes(cursor, "D", "id = ?", [contact_id])
+        cursor.execute("DELETE FROM contacts WHERE id = ?", (contact_id,))
+        deleted = cursor.rowcount > 0
+        cursor.execute("DELETE FROM contact_trigrams WHERE contact_id = ?", (contact_id,))
+        cursor.execute("DELETE FROM contact_names WHERE contact_id = ?", (contact_id,))
+        self.conn.commit()
+        return deleted
+
+    def update_many(self, ids, values):
+        """Set the same BULK_FIELDS values on many contacts in one transaction, returns how many exist
+
+        One UPDATE per BULK_CHUNK_SIZE ids, with an IN list.
+        """
+        unknown = sorted(set(values) - set(BULK_FIELDS))
+        if unknown:
+            raise ValueError(f"Cannot update {', '.join(unknown)} of many contacts at once")
+        ids = list(ids)
+        if not ids or not values:
+            return 0
+        fields = list(values)
+        assignments = ", ".join(f"{field}=?" for field in fields)
+        params = [values[field] or "" for field in fields]
+        indexed = [field for field in fields if field in textindex.FIELD_CODES]
+        cursor = self.conn.cursor()
+        updated = 0
+        for start in range(0, len(ids), BULK_CHUNK_SIZE):
+            chunk = ids[start:start + BULK_CHUNK_SIZE]
+            placeholders = ", ".join("?" for _ in chunk)
+            self.log_changes(cursor, "U", f"id IN ({placeholders})", chunk)
+            cursor.execute(f"UPDATE contacts SET {assignments}, modified_date={self.NOW} WHERE id IN ({placeholders})",
+                           params + chunk)
+            updated += cursor.rowcount
+            if indexed:
+                codes = [textindex.FIELD_CODES[field] for field in indexed]
+                cursor.execute(f"DELETE FROM contact_trigrams WHERE field IN ({', '.join('?' for _ in codes)}) "
+                               f"AND contact_id IN ({placeholders})", codes + chunk)
+                cursor.execute(f"SELECT id FROM contacts WHERE id IN ({placeholders})", chunk)
+                existing = [row[0] for row in cursor.fetchall()]
+                grams = [gram for contact_id in existing
+                         for gram in textindex.index_rows(contact_id, values, fields=indexed)]
+                if grams:
+                    self.executemany(cursor, "INSERT INTO contact_trigrams (trigram, field, contact_id) VALUES (?, ?, ?)",
+                                     grams)
+        self.conn.commit()
+        return updated
+
+    def delete_many(self, ids):
+        """Delete many contacts in one transaction, returns how many existed
+
+        One DELETE per table and BULK_CHUNK_SIZE ids, with an IN list.
+        """
+        ids = list(ids)
+        cursor = self.conn.cursor()
+        deleted = 0
+        for start in range(0, len(ids), BULK_CHUNK_SIZE):
+            chunk = ids[start:start + BULK_CHUNK_SIZE]
+            placeholders = ", ".join("?" for _ in chunk)
+            self.log_changes(cursor, "D", f"id IN ({placeholders})", chunk)
+            cursor.execute(f"DELETE FROM contacts WHERE id IN ({placeholders})", chunk)
+            deleted += cursor.rowcount
+            for table in ("contact_trigrams", "contact_names"):
+                cursor.execute(f"DELETE FROM {table} WHERE contact_id IN ({placeholders})", chunk)
+        self.conn.commit()
+        return deleted
+
+
+class SqlServerContactRepository(ContactRepository):
+    """SQL Server backend through pyodbc"""
+
+    NOW = "GETDATE()"
+
+    # [ starts a character class in T-SQL patterns
+    LIKE_SPECIAL = "\\%_["
+
+    # IDENTITY values are taken in insert order but may commit out of order;
+    # rowversions below MIN_ACTIVE_ROWVERSION() are all committed
+    CHANGE_TOKEN = "CAST(version AS BIGINT)"
+    CHANGE_ORDER = "version"
+    CHANGE_PARAM = "CAST(CAST(? AS BIGINT) AS BINARY(8))"
+    CHANGE_VISIBLE = "version < MIN_ACTIVE_ROWVERSION()"
+
+    DAYS_AGO = "DATEADD(day, -?, GETDATE())"
+
+    # Notes are NVARCHAR(MAX) since migration 4; LEN ignores trailing spaces,
+    # so one character is appended and taken off again
+    NOTES_PART = "SUBSTRING(notes, ?, ?)"
+    NOTES_LENGTH = "LEN(notes + N'.') - 1"
+
+    MIGRATIONS = migrations.SQLSERVER
+
+    # Most parameters the server accepts in one statement, 2100 less a margin for the driver
+    MAX_PARAMETERS = 2000
+
+    @classmethod
+    def connect(cls, settings):
+        """Open a connection using the sqlserver settings"""
+        import pyodbc
+
+        base = f"DRIVER={{{settings['driver']}}};SERVER={settings['server']};DATABASE={settings['database']}"
+        if settings.get("username") and settings.get("password"):
+            connection_string = f"{base};UID={settings['username']};PWD={settings['password']}"
+        else:
+            connection_string = f"{base};Trusted_Connection=yes;"
+        return cls(pyodbc.connect(connection_string), settings)
+
+    def select_page(self, columns, where, params, order, limit, offset=None, table="contacts"):
+        """TOP for keyset pages, OFFSET ... FETCH for absolute positions"""
+        if offset is None:
+            query = f"SELECT TOP (?) {', '.join(columns)} FROM {table} WHERE {where} ORDER BY {order}"
+            cursor = self.execute(query, [limit] + list(params))
+        else:
+            query = (f"SELECT {', '.join(columns)} FROM {table} WHERE {where} "
+                     f"ORDER BY {order} OFFSET ? ROWS FETCH NEXT ? ROWS ONLY")
+            cursor = self.execute(query, list(params) + [offset, limit])
+        return [tuple(row) for row in cursor.fetchall()]
+
+    def timestamp(self, value):
+        """DATETIME parameter from the text form of a modified_date"""
+        return datetime.fromisoformat(value) if isinstance(value, str) else value
+
+    def executemany(self, cursor, query, rows):
+        """Send all parameter rows in one round-trip"""
+        cursor.fast_executemany = True
+        cursor.executemany(query, rows)
+
+    def insert_contact(self, cursor, values):
+        """INSERT ... OUTPUT INSERTED.id"""
+        query = (f"INSERT INTO contacts ({', '.join(WRITE_COLUMNS)}) OUTPUT INSERTED.id "
+                 f"VALUES ({', '.join('?' for _ in WRITE_COLUMNS)})")
+        cursor.execute(query, values)
+        return cursor.fetchone()[0]
+
+    def insert_contacts(self, cursor, rows):
+        """Multi-row INSERT ... SELECT ... OUTPUT INSERTED.id, up to MAX_PARAMETERS per statement
+
+        Identity values follow the ORDER BY of an INSERT ... SELECT, so the
+        output ids sorted ascending are the ids of the rows in order, even
+        though OUTPUT itself returns them in no particular order.
+        """
+        width = len(WRITE_COLUMNS) + 1
+        chunk_size = self.MAX_PARAMETERS // width
+        columns = ", ".join(WRITE_COLUMNS)
+        ids = []
+        for start in range(0, len(rows), chunk_size):
+            chunk = rows[start:start + chunk_size]
+            values = ", ".join("(" + ", ".join("?" for _ in range(width)) + ")" for _ in chunk)
+            cursor.execute(f"INSERT INTO contacts ({columns}) OUTPUT INSERTED.id "
+                           f"SELECT {columns} FROM (VALUES {values}) AS v (row_number, {columns}) "
+                           "ORDER BY row_number",
+                           [value for number, row in enumerate(chunk) for value in [number, *row]])
+            ids += sorted(row[0] for row in cursor.fetchall())
+        return ids
+
+
+class SqliteContactRepository(ContactRepository):
+    """Embedded SQLite backend in WAL mode"""
+
+    MIGRATIONS = migrations.SQLITE
+
+    @classmethod
+    def connect(cls, settings):
+        """Open the SQLite database file from the settings"""
+        # Pooled connections move between worker threads, one thread at a time
+        conn = sqlite3.connect(settings["sqlite_path"], timeout=30, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        return cls(conn, settings)
+
+    def select_page(self, columns, where, params, order, limit, offset=None, table="contacts"):
+        """LIMIT/OFFSET paging"""
+        query = (f"SELECT {', '.join(columns)} FROM {table} WHERE {where} "
+                 f"ORDER BY {order} LIMIT ? OFFSET ?")
+        return self.execute(query, list(params) + [limit, offset or 0]).fetchall()
+
+    def insert_contact(self, cursor, values):
+        """INSERT and read lastrowid"""
+        query = (f"INSERT INTO contacts ({', '.join(WRITE_COLUMNS)}) "
+                 f"VALUES ({', '.join('?' for _ in WRITE_COLUMNS)})")
+        cursor.execute(query, values)
+        return cursor.lastrowid
+
+    def insert_contacts(self, cursor, rows):
+        """One executemany, ids counted back from last_insert_rowid()
+
+        The first INSERT takes the database write lock until the commit, so
+        the AUTOINCREMENT ids of the batch are consecutive.
+        """
+        query = (f"INSERT INTO contacts ({', '.join(WRITE_COLUMNS)}) "
+                 f"VALUES ({', '.join('?' for _ in WRITE_COLUMNS)})")
+        self.executemany(cursor, query, rows)
+        last_id = cursor.execute("SELECT last_insert_rowid()").fetchone()[0]
+        return list(range(last_id - len(rows) + 1, last_id + 1))
+
+
+BACKENDS = {
+    "sqlserver": SqlServerContactRepository,
+    "sqlite": SqliteContactRepository,
+}
+
+
+def open_repository(settings):
+    """Open a repository for the configured backend"""
+    if settings["backend"] == "http":
+        from .client import HttpContactRepository
+        return HttpContactRepository.connect(settings)
+    try:
+        backend = BACKENDS[settings["backend"]]
+    except KeyError:
+        raise ValueError(f"Unknown storage backend: {settings['backend']}") from None
+    return backend.connect(settings)
@@ -0,0 +1,104 @@
+"""Trigram index for substring search
+
+Every indexed field of a contact is split into the overlapping three
+character pieces of its case-folded text and stored in the
+``contact_trigrams`` side table. Any substring of three or more characters
+contains only trigrams of the field it came from, so a substring search can
+first narrow the candidates with an index lookup on those trigrams and then
+verify and rank the few remaining rows in Python, instead of scanning the
+whole table with ``LIKE '%term%'``.
+"""
+
+import re
+
+from .phones import digits_only, looks_like_phone
+
+# Indexed fields and the small integer stored for them in contact_trigrams
+FIELD_CODES = {
+    "first_name": 1,
+    "last_name": 2,
+    "phone": 3,
+    "email": 4,
+    "company": 5,
+    "notes": 6,
+}
+
+# Ranking weight of a match in each field
+FIELD_WEIGHTS = {
+    "first_name": 5,
+    "last_name": 5,
+    "phone": 3,
+    "email": 3,
+    "company": 3,
+    "notes": 1,
+}
+
+# Most trigrams used to narrow one query, the rest is checked in Python
+MAX_QUERY_TRIGRAMS = 30
+
+
+def trigrams(text):
+    """Set of trigrams of a text"""
+    text = (text or "").casefold()
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def field_text(field, value):
+    """Text that is indexed for a field - phone numbers by their digits"""
+    return digits_only(value) if field == "phone" else value
+
+
+def index_rows(contact_id, contact, fields=FIELD_CODES):
+    """(trigram, field code, contact id) rows to store for a contact dict"""
+    return [(gram, FIELD_CODES[field], contact_id)
+            for field in fields
+            for gram in trigrams(field_text(field, contact.get(field)))]
+
+
+def split_words(text):
+    """Case-folded words of a search text"""
+    return [word for word in (text or "").casefold().split() if word]
+
+
+def query_word(word):
+    """Form of a search word that is looked up - phone-like words by their digits"""
+    return digits_only(word) if looks_like_phone(word) else word
+
+
+def query_trigrams(words):
+    """Distinct trigrams of the words long enough to use the index"""
+    grams = set()
+    for word in words:
+        grams |= trigrams(query_word(word))
+    return sorted(grams)[:MAX_QUERY_TRIGRAMS]
+
+
+_WORD_START = re.compile(r"[\W_]+")
+
+
+def score(values, words):
+    """Rank of a contact for a text search, 0 if some word does not match
+
+    values maps field names to text. A word scores more for matching a whole
+    field than for the start of a word in it, and more for the start of a
+    word than for the middle; the match is weighted by field.
+    """
+    folded = {field: (field_text(field, values.get(field)) or "").casefold() for field in FIELD_CODES}
+    total = 0
+    for word in words:
+        best = 0
+        for field, text in folded.items():
+            needle = query_word(word) if field == "phone" else word
+            if not needle or needle not in text:
+                continue
+            if text == needle:
+                strength = 3
+            elif text.startswith(needle) or any(part.startswith(needle) for part in _WORD_START.split(text)):
+                strength = 2
+            else:
+                strength = 1
+            best = max(best, strength * FIELD_WEIGHTS[field])
+        if not best:
+            return 0
+        total += best
+    return total
@@ -0,0 +1,83 @@
+import asyncio
+import os
+import socket
+import sys
+import threading
+import time
+
+import pytest
+
+# The tests run against the phonebook package of this checkout
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from phonebook.client import HttpContactRepository  # noqa: E402
+from phonebook.config import DEFAULTS  # noqa: E402
+from phonebook.server import ContactServer  # noqa: E402
+from phonebook.storage import SqliteContactRepository  # noqa: E402
+
+
+@pytest.fixture
+def settings(tmp_path):
+    """Default settings with an SQLite database in a temporary directory"""
+    return {**DEFAULTS, "backend": "sqlite", "sqlite_path": str(tmp_path / "contacts.db"),
+            "snapshot_path": str(tmp_path / "snapshot.db"), "log_path": ""}
+
+
+@pytest.fixture
+def repo(settings):
+    """Empty SQLite repository at the latest schema version"""
+    repo = SqliteContactRepository.connect(settings)
+    repo.create_schema()
+    yield repo
+    repo.close()
+
+
+@pytest.fixture
+def api(settings):
+    """HttpContactRepository of an API server on a free local port, serving the settings' database"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    server = ContactServer(settings)
+    loop = asyncio.new_event_loop()
+    task = loop.create_task(server.serve("127.0.0.1", port))
+
+    def run():
+        try:
+            loop.run_until_complete(task)
+        except asyncio.CancelledError:
+            pass
+        finally:
+            loop.close()
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    client = HttpContactRepository(f"http://127.0.0.1:{port}", timeout=10)
+    deadline = time.monotonic() + 10
+    while True:
+        try:
+            client.ping()
+            break
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.05)
+    yield client
+    client.close()
+    loop.call_soon_threadsafe(task.cancel)
+    thread.join(10)
+
+
+def make_contact(number, **fields):
+    """Contact dict with distinct names and phone number"""
+    contact = {
+        "first_name": f"First{number:05d}",
+        "last_name": f"Last{(number * 7919) % 1000:05d}",
+        "phone": f"555-{number:07d}",
+        "email": f"person{number}@example.com",
+        "address": f"{number} Main Street",
+        "company": f"Company {(number * 31) % 97}",
+        "notes": f"Note for contact {number}",
+    }
+    contact.update(fields)
+    return contact
@@ -0,0 +1,46 @@
+import importlib.util
+import json
+import os
+
+import pytest
+
+
+@pytest.fixture(scope="module")
+def bench():
+    """benchmarks/bench.py, which is a script rather than a module of the package"""
+    path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks", "bench.py")
+    spec = importlib.util.spec_from_file_location("bench", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_percentiles_use_the_nearest_rank(bench):
+    samples = [i / 1000 for i in range(1, 101)]
+    assert bench.percentile(samples, 0.5) == 0.05
+    assert bench.percentile(samples, 0.95) == 0.095
+    assert bench.percentile(samples, 0.99) == 0.099
+    assert bench.percentile(samples[:99], 0.95) == 0.095
+    assert bench.percentile([0.2], 0.95) == 0.2
+    summary = bench.summarize([0.002, 0.001, 0.003], items=10)
+    assert summary["p50_ms"] == 2.0 and summary["max_ms"] == 3.0
+    assert summary["ops_per_second"] == 500.0 and summary["rows_per_second"] == 5000.0
+
+
+def test_benchmark_run_reuses_and_restores_its_database(bench, tmp_path):
+    output = tmp_path / "before.json"
+    args = ["--sizes", "300", "--repeat", "3", "--db-dir", str(tmp_path), "--output", str(output)]
+    assert bench.main(args) == 0
+    first = json.loads(output.read_text(encoding="utf-8"))["results"][0]
+    assert first["size"] == 300 and first["seed_seconds"] is not None
+    operations = first["operations"]
+    for name in ("load_contacts", "scroll_page", "sort[-company]", "search[first_name+last_name+phone]",
+                 "search[fuzzy]", "store_search[phone]", "insert", "snapshot_cold_start", "bulk_insert"):
+        assert operations[name]["count"] >= 1, name
+    assert operations["insert"]["count"] == 3
+
+    # The writes were undone, so the seeded database is used again as it is
+    assert bench.main(args) == 0
+    second = json.loads(output.read_text(encoding="utf-8"))["results"][0]
+    assert second["seed_seconds"] is None
+    assert second["operations"].keys() == operations.keys()
@@ -0,0 +1,84 @@
+import pytest
+
+from phonebook import storage
+from phonebook.columnar import ContactStore, StorePageSource
+from phonebook.paging import ContactPageSource, SearchPageSource
+
+from conftest import make_contact
+
+
+@pytest.fixture
+def small_chunks(monkeypatch):
+    """Bulk statements of 7 ids, so that a few contacts span several chunks"""
+    monkeypatch.setattr(storage, "BULK_CHUNK_SIZE", 7)
+
+
+def test_update_many_spans_chunks(repo, small_chunks):
+    repo.add_many([make_contact(number) for number in range(30)])
+    token = repo.change_token()
+    ids = [row[0] for row in repo.fetch_at(None, 0, 100)][:25] + [9999]
+
+    assert repo.update_many(ids, {"company": "Acme Widgets", "notes": "bulk"}) == 25
+    records = list(repo.iter_contacts(ids=ids))
+    assert {(record[6], record[7]) for record in records} == {("Acme Widgets", "bulk")}
+    # The trigram index and the change log follow
+    assert {row[0] for row in repo.search_text("widgets", limit=100)} == set(ids[:25])
+    assert len(repo.changes_since(token)[1]) == 25
+
+
+def test_update_many_only_takes_bulk_fields(repo):
+    contact_id = repo.add(make_contact(1))
+    with pytest.raises(ValueError):
+        repo.update_many([contact_id], {"phone": "555"})
+
+
+def test_delete_many_spans_chunks(repo, small_chunks):
+    repo.add_many([make_contact(number) for number in range(30)])
+    ids = [row[0] for row in repo.fetch_at(None, 0, 100)][:20]
+    token = repo.change_token()
+
+    assert repo.delete_many(ids + [9999]) == 20
+    assert repo.count() == 10
+    assert not set(ids) & {row[0] for row in repo.search_text("note", limit=100)}
+    assert not repo.execute("SELECT COUNT(*) FROM contact_names WHERE contact_id IN "
+                            f"({', '.join(map(str, ids))})").fetchone()[0]
+    changes = repo.changes_since(token)[1]
+    assert sorted(contact_id for contact_id, _, record in changes if record is None) == sorted(ids)
+
+
+def test_all_ids_pages_through_the_result(repo):
+    repo.add_many([make_contact(number, last_name="Smith" if number % 3 else "Jones") for number in range(50)])
+    smiths = sorted(row[0] for row in repo.fetch_at({"last_name": "smith"}, 0, 100))
+    assert ContactPageSource({"last_name": "smith"}).all_ids(repo, page_size=4) == smiths
+    assert len(ContactPageSource().all_ids(repo, page_size=7)) == 50
+
+    source = SearchPageSource({"last_name": "smith"}, max_rows=100)
+    source.load(repo, 5)
+    assert sorted(source.all_ids(repo)) == smiths
+
+    store_source = StorePageSource(ContactStore.load(repo), {"last_name": "smith"})
+    store_source.load(repo, 5)
+    assert sorted(store_source.all_ids(repo)) == smiths
+
+
+def test_http_bulk_requests_are_chunked(repo, api, monkeypatch):
+    repo.add_many([make_contact(number) for number in range(25)])
+    monkeypatch.setattr(api, "MAX_IDS", 10)
+    ids = [row[0] for row in repo.fetch_at(None, 0, 100)]
+
+    assert api.update_many(ids, {"company": "Chunked"}) == 25
+    assert {record[6] for record in api.iter_contacts(ids=ids)} == {"Chunked"}
+    assert ContactPageSource({"last_name": ""}).all_ids(api, page_size=10) == sorted(ids)
+    assert api.delete_many(ids[:22]) == 22
+    assert api.count() == 3
+
+
+def test_http_bulk_update_of_notes(repo, api):
+    # Notes have no FIELD_LENGTHS entry, any length is accepted
+    repo.add_many([make_contact(number) for number in range(3)])
+    ids = [row[0] for row in repo.fetch_at(None, 0, 10)]
+    notes = "Moved to the new office. " * 100
+
+    assert api.update_many(ids, {"notes": notes}) == 3
+    assert {record[7] for record in repo.iter_contacts(ids=ids)} == {notes.strip()}
+    assert {row[0] for row in repo.search_text("new office")} == set(ids)
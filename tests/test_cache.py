@@ -0,0 +1,53 @@
+from phonebook.cache import ContactCache
+
+
+def record(contact_id, first_name="Ada"):
+    return (contact_id, first_name, "Lovelace", "555-0100", "", "", "", "")
+
+
+def test_least_recently_used_records_are_evicted():
+    cache = ContactCache(max_entries=3)
+    cache.put_many([record(1), record(2), record(3)])
+    assert cache.get(1) == record(1)
+    cache.put(record(4))
+    # 2 was used least recently
+    assert cache.missing([1, 2, 3, 4]) == [2]
+    assert len(cache) == 3
+    cache.put_many([None, [5, "Grace", "Hopper", "", "", "", "", ""]])
+    assert cache.get(5) == (5, "Grace", "Hopper", "", "", "", "", "")
+
+
+def test_writes_replace_the_cached_record():
+    cache = ContactCache()
+    cache.put(record(1))
+    cache.put(record(1, "Augusta"))
+    assert cache.get(1)[1] == "Augusta"
+
+
+def test_records_read_before_a_change_are_not_cached():
+    cache = ContactCache()
+    cache.put(record(1))
+    generation = cache.generation
+    # A read is in flight when the contact is edited
+    cache.discard(1)
+    cache.put(record(1), generation)
+    assert cache.get(1) is None
+    cache.put(record(1, "Augusta"), cache.generation)
+    assert cache.get(1)[1] == "Augusta"
+
+    generation = cache.generation
+    cache.clear()
+    cache.put_many([record(2), record(3)], generation)
+    assert len(cache) == 0
+
+
+def test_hit_rate():
+    cache = ContactCache()
+    assert cache.hit_rate == 0.0
+    cache.put(record(1))
+    cache.get(1)
+    cache.get(1)
+    cache.get(2)
+    # missing() does not count as a lookup
+    cache.missing([3])
+    assert cache.stats() == {"entries": 1, "hits": 2, "misses": 1, "hit_rate": 0.667}
@@ -0,0 +1,51 @@
+from phonebook.paging import list_row
+
+from conftest import make_contact
+
+
+def test_changes_since_reports_each_contact_once(repo):
+    kept = repo.add(make_contact(1))
+    removed = repo.add(make_contact(2))
+    token = repo.change_token()
+
+    before = repo.get(kept)
+    repo.update(kept, make_contact(1, first_name="Changed"))
+    repo.update(kept, make_contact(1, first_name="Twice"))
+    repo.delete(removed)
+    added = repo.add(make_contact(3))
+
+    new_token, changes = repo.changes_since(token)
+    changes = {contact_id: (old_row, record) for contact_id, old_row, record in changes}
+    # The row before the first change, the record as it is now
+    assert changes[kept][0] == list_row(before)
+    assert changes[kept][1][1] == "Twice"
+    assert changes[removed][1] is None
+    assert changes[added] == (None, repo.get(added))
+    assert repo.changes_since(new_token) == (new_token, [])
+
+
+def test_changes_are_read_in_pages(repo):
+    token = repo.change_token()
+    repo.add_many([make_contact(number) for number in range(10)])
+    seen = []
+    while True:
+        token, changes = repo.changes_since(token, limit=3)
+        if not changes:
+            break
+        assert len(changes) <= 3
+        seen += [contact_id for contact_id, _, _ in changes]
+    assert sorted(seen) == sorted(row[0] for row in repo.fetch_at(None, 0, 100))
+
+
+def test_pruned_tokens_expire(repo):
+    token = repo.change_token()
+    repo.add_many([make_contact(number) for number in range(5)])
+    repo.execute("UPDATE contact_changes SET changed_date = '2000-01-01'")
+    repo.commit()
+    newest = repo.change_token()
+
+    assert repo.prune_changes(30) == 5
+    assert repo.pruned_through() == newest
+    assert repo.changes_since(token) is None
+    assert repo.changes_since(newest) == (newest, [])
+    assert repo.prune_changes(30) == 0
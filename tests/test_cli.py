@@ -0,0 +1,68 @@
+import json
+
+import pytest
+
+from phonebook.__main__ import build_parser, main
+from phonebook.storage import SqliteContactRepository
+
+
+@pytest.fixture
+def config(settings, tmp_path):
+    """Settings file of the test database"""
+    path = tmp_path / "phonebook.json"
+    path.write_text(json.dumps({"backend": "sqlite", "sqlite_path": settings["sqlite_path"], "log_path": ""}))
+    return str(path)
+
+
+def run(config, *args):
+    return main(["--config", config, *args])
+
+
+def test_parser_requires_a_command():
+    with pytest.raises(SystemExit):
+        build_parser().parse_args([])
+    args = build_parser().parse_args(["get", "--phone-number", "555 0100"])
+    assert args.phone_number and args.id == "555 0100"
+
+
+def test_write_commands_create_the_schema(config, capsys):
+    assert run(config, "add", "--first-name", "Ada", "--last-name", "Lovelace", "--phone", "555-0100") == 0
+    contact_id = int(capsys.readouterr().out)
+
+    assert run(config, "get", "--phone-number", "+1 (555) 0100", "--json") == 0
+    assert json.loads(capsys.readouterr().out)["id"] == contact_id
+
+    assert run(config, "update", str(contact_id), "--company", "Analytical Engines") == 0
+    assert run(config, "search", "--text", "engines", "--json") == 0
+    assert [row["last_name"] for row in json.loads(capsys.readouterr().out)] == ["Lovelace"]
+
+    assert run(config, "delete", str(contact_id), "999") == 1
+    assert "Contact 999 not found" in capsys.readouterr().err
+    assert run(config, "get", str(contact_id)) == 1
+
+
+def test_add_rejects_invalid_contacts(config, capsys):
+    assert run(config, "add", "--first-name", "", "--last-name", "X", "--phone", "1") == 2
+    assert capsys.readouterr().err
+
+
+def test_read_commands_do_not_write(config, settings, monkeypatch, capsys):
+    # Before migrate, a lookup asks for it instead of creating the schema
+    assert run(config, "list") == 1
+    assert "migrate" in capsys.readouterr().err
+    repo = SqliteContactRepository.connect(settings)
+    assert repo.execute("SELECT name FROM sqlite_master WHERE name = 'contacts'").fetchall() == []
+    repo.close()
+
+    assert run(config, "migrate") == 0
+    assert capsys.readouterr().out.startswith("Schema at version ")
+
+    def no_writes(self):
+        raise AssertionError("read command migrated the schema")
+
+    monkeypatch.setattr(SqliteContactRepository, "create_schema", no_writes)
+    monkeypatch.setattr(SqliteContactRepository, "prune_changes", no_writes)
+    for args in (["list", "--json"], ["search", "--last-name", "x"], ["get", "--phone-number", "555"],
+                 ["duplicates"]):
+        assert run(config, *args) in (0, 1)
+    assert json.loads(capsys.readouterr().out.splitlines()[0]) == []
@@ -0,0 +1,56 @@
+from array import array
+
+import pytest
+
+from phonebook import columnar
+from phonebook.columnar import ContactStore
+from phonebook.paging import list_row, sort_rows
+
+from conftest import make_contact
+
+SORTS = [None, "first_name", "-company", "-phone"]
+
+
+def expected_ids(store, sort, criteria=None):
+    """Ids of a fresh sort of the store's rows"""
+    rows = store.rows(store.ids)
+    if criteria:
+        rows = [row for row in rows if criteria["last_name"] in row[2].casefold()]
+    return [row[0] for row in sort_rows(rows, sort)]
+
+
+def changes(repo, start):
+    """Updated, new and deleted rows, {id: row or None}"""
+    result = {}
+    for number in range(start, start + 6):
+        result[number] = list_row(repo.get(number))[:1] + (f"renamed{number % 3}", f"last{number:05d}",
+                                                           "555", "e@x", f"Co {number % 5}")
+    result[1000 + start] = (1000 + start, "new", "Last00999", "1", "n@x", "Co 9")
+    result[start + 10] = None
+    return result
+
+
+@pytest.mark.parametrize("sort", SORTS)
+def test_patched_order_matches_a_new_sort(repo, sort):
+    repo.add_many([make_contact(number, last_name=f"Last{number % 50:05d}") for number in range(1, 201)])
+    store = ContactStore.load(repo)
+    searched = store.search(None, sort)
+    shared = array("q", searched)
+    for start in (1, 20, 40):
+        store.apply(changes(repo, start))
+        assert store.orders, "a small batch patches the cached order"
+        assert list(store.search(None, sort)) == expected_ids(store, sort)
+        criteria = {"last_name": "last0001"}
+        assert list(store.search(criteria, sort)) == expected_ids(store, sort, criteria)
+    # Results already handed out are not changed
+    assert searched == shared
+
+
+def test_large_batch_drops_the_order(repo, monkeypatch):
+    repo.add_many([make_contact(number) for number in range(1, 101)])
+    store = ContactStore.load(repo)
+    store.search(None, "email")
+    monkeypatch.setattr(columnar, "MAX_PATCHED_ROWS", 3)
+    store.apply(changes(repo, 1))
+    assert not store.orders
+    assert list(store.search(None, "email")) == expected_ids(store, "email")
@@ -0,0 +1,22 @@
+from phonebook import dedupe
+
+from conftest import make_contact
+
+
+def test_find_duplicates_in_spawned_workers(repo, monkeypatch):
+    repo.add_many([make_contact(number) for number in range(20)]
+                  + [make_contact(3, email="other@example.com"),
+                     make_contact(7, first_name="First00007", phone="555 000 0007"),
+                     make_contact(11, last_name="Someone Else", email="x@example.com", phone="555-1111111")])
+    # One block per task, so the comparisons are spread over the processes
+    monkeypatch.setattr(dedupe, "TASK_COMPARISONS", 1)
+    serial = dedupe.find_duplicates(repo, workers=1)
+    spawned = dedupe.find_duplicates(repo, workers=2)
+    assert [(group.ids, group.score) for group in spawned] == [(group.ids, group.score) for group in serial]
+    assert [group.ids for group in serial] == [[4, 21], [8, 22]]
+
+
+def test_email_blocks_ignore_case(repo):
+    repo.add_many([make_contact(1, email="Ada.Lovelace@Example.com"), make_contact(2, email="ada.lovelace@example.com"),
+                   make_contact(3, email="ADA.LOVELACE@EXAMPLE.COM"), make_contact(4, email="")])
+    assert [1, 2, 3] in [sorted(block) for block in repo.duplicate_blocks()]
@@ -0,0 +1,102 @@
+import threading
+import time
+
+import pytest
+
+from phonebook.executor import QueryExecutor
+from phonebook.metrics import Metrics
+from phonebook.pool import ConnectionPool
+from phonebook.storage import SqliteContactRepository
+
+from conftest import make_contact
+
+
+@pytest.fixture
+def executor(repo, settings):
+    """Executor with one worker, so tasks run in submit order"""
+    pool = ConnectionPool(lambda: SqliteContactRepository.connect(settings), min_size=1, max_size=1, timeout=5)
+    executor = QueryExecutor(pool, workers=1, metrics=Metrics())
+    yield executor
+    executor.shutdown()
+
+
+def poll_until(executor, done, timeout=5):
+    """Deliver results on this thread until done() is true"""
+    deadline = time.monotonic() + timeout
+    while not done():
+        assert time.monotonic() < deadline, "results were not delivered"
+        executor.poll()
+        time.sleep(0.005)
+
+
+def test_results_are_delivered_by_poll_in_order(executor, repo):
+    repo.add_many([make_contact(number) for number in range(3)])
+    delivered = []
+    for number in range(5):
+        executor.submit(lambda worker_repo, n: (n, worker_repo.count(), threading.current_thread().name), number,
+                        on_success=lambda result: delivered.append((result, threading.current_thread().name)))
+    time.sleep(0.05)
+    assert delivered == [], "callbacks only run in poll"
+    poll_until(executor, lambda: len(delivered) == 5)
+    assert [result[0] for result, _ in delivered] == [0, 1, 2, 3, 4]
+    assert {result[1] for result, _ in delivered} == {3}
+    # The query ran on a worker, the callback on the polling thread
+    assert {result[2] for result, _ in delivered} == {"query-worker-0"}
+    assert {thread for _, thread in delivered} == {threading.current_thread().name}
+
+
+def test_newer_query_with_the_same_key_cancels_the_older(executor):
+    started, release = threading.Event(), threading.Event()
+
+    def blocking(repo):
+        started.set()
+        release.wait(5)
+        return "blocking"
+
+    delivered = []
+    executor.submit(blocking, on_success=delivered.append)
+    started.wait(5)
+    # Queued behind the blocking task: the first search is skipped, not run
+    ran = []
+    executor.submit(lambda repo: ran.append("first") or "first", on_success=delivered.append, key="search")
+    executor.submit(lambda repo: "second", on_success=delivered.append, key="search")
+    executor.submit(lambda repo: "cancelled", on_success=delivered.append, key="details")
+    executor.cancel("details")
+    release.set()
+    poll_until(executor, lambda: "second" in delivered)
+    executor.poll()
+    assert delivered == ["blocking", "second"]
+    assert ran == []
+    assert executor.latest == {}
+
+
+def test_running_query_result_is_dropped_when_cancelled(executor):
+    started, release = threading.Event(), threading.Event()
+
+    def slow(repo):
+        started.set()
+        release.wait(5)
+        return "stale"
+
+    delivered = []
+    executor.submit(slow, on_success=delivered.append, key="search")
+    started.wait(5)
+    executor.submit(lambda repo: "fresh", on_success=delivered.append, key="search")
+    release.set()
+    poll_until(executor, lambda: delivered)
+    assert delivered == ["fresh"]
+
+
+def test_errors_go_to_on_error_and_the_connection_is_reused(executor):
+    errors, results = [], []
+
+    def failing(repo):
+        repo.execute("SELECT * FROM no_such_table")
+
+    executor.submit(failing, on_success=results.append, on_error=errors.append, name="failing")
+    executor.submit(lambda repo: repo.count(), on_success=results.append)
+    poll_until(executor, lambda: errors and results)
+    assert "no_such_table" in str(errors[0])
+    assert results == [0]
+    assert executor.pool.stats()["size"] == 1
+    assert executor.metrics.snapshot()["counters"][("query_errors_total", "failing")] == 1
@@ -0,0 +1,64 @@
+import pytest
+
+from phonebook import fuzzy
+
+from conftest import make_contact
+
+
+@pytest.mark.parametrize("spellings", [
+    ("Jon", "John", "Jhon"),
+    ("Mohamad", "Mohammed", "Muhammad"),
+    ("Catherine", "Kathryn", "Katharine"),
+    ("Stephen", "Steven"),
+    ("Knight", "Night"),
+])
+def test_spellings_that_sound_alike_share_a_key(spellings):
+    assert len({fuzzy.phonetic_key(spelling) for spelling in spellings}) == 1
+
+
+def test_keys_keep_consonants_and_a_leading_vowel():
+    assert fuzzy.phonetic_key("Smith") == "smt"
+    assert fuzzy.phonetic_key("Schmidt") == "skmt"
+    assert fuzzy.phonetic_key("Ella") == "al"
+    # Keys are coarse, edit distance tells John from Jane
+    assert fuzzy.phonetic_key("Jane") == fuzzy.phonetic_key("John")
+    # Other scripts are their own key
+    assert fuzzy.phonetic_key("Иван") == "иван"
+
+
+def test_name_words_are_folded():
+    assert fuzzy.name_words("Mary-Ann O'Brien") == ["mary", "ann", "o", "brien"]
+    assert fuzzy.name_words("José Ångström") == ["jose", "angstrom"]
+    assert fuzzy.name_words("Søren Łukasz 3rd") == ["soren", "lukasz", "rd"]
+    assert fuzzy.name_words(None) == []
+
+
+def test_distance():
+    assert fuzzy.distance("john", "jhon") == 1
+    assert fuzzy.distance("mohammed", "muhammad") == 2
+    assert fuzzy.distance("kitten", "sitting") == 3
+    assert fuzzy.distance("", "abc") == 3
+    # Over the limit the exact distance is not worked out
+    assert fuzzy.distance("kitten", "sitting", limit=1) == 2
+    assert fuzzy.distance("a", "abcdef", limit=2) == 3
+
+
+def test_search_finds_misspelled_names_closest_first(repo):
+    ids = [repo.add(make_contact(number, first_name=first, last_name=last))
+           for number, (first, last) in enumerate([("John", "Smith"), ("Jon", "Smyth"), ("Joan", "Smith"),
+                                                   ("Muhammad", "Karimi"), ("Jane", "Doe")])]
+    # Joan Smith and Jon Smyth are both two edits away, then ordered by last name
+    assert [row[0] for row in repo.search_fuzzy("jhon smith")] == [ids[0], ids[2], ids[1]]
+    assert [row[0] for row in repo.search_fuzzy("", {"first_name": "Mohammed"})] == [ids[3]]
+    # Field criteria only match their own field
+    assert repo.search_fuzzy("", {"last_name": "John"}) == []
+    assert repo.search_fuzzy("xyzzy") == []
+
+
+def test_search_follows_edits(repo):
+    contact_id = repo.add(make_contact(1, first_name="Catherine", last_name="Zeta"))
+    repo.update(contact_id, make_contact(1, first_name="Katharine", last_name="Hepburn"))
+    assert [row[0] for row in repo.search_fuzzy("kathryn hepburn")] == [contact_id]
+    assert repo.search_fuzzy("zeta") == []
+    repo.delete(contact_id)
+    assert repo.search_fuzzy("kathryn") == []
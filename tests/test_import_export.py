@@ -0,0 +1,160 @@
+import gzip
+import json
+
+import pytest
+
+from phonebook.exporter import detect_format, export_contacts
+from phonebook.importer import import_contacts
+from phonebook.storage import (CONTACT_COLUMNS, CONTACT_FIELDS, WRITE_COLUMNS, SqliteContactRepository,
+                               SqlServerContactRepository)
+
+from conftest import make_contact
+
+
+def contact_fields(repo):
+    """Field values of every contact, in id order"""
+    return [tuple(record[CONTACT_COLUMNS.index(field)] for field in CONTACT_FIELDS)
+            for record in repo.iter_contacts()]
+
+
+@pytest.fixture
+def source(repo):
+    contacts = [make_contact(number) for number in range(25)]
+    contacts.append(make_contact(25, notes="Line one\nline two; with, punctuation", company="O'Brien & Sons"))
+    contacts.append(make_contact(26, first_name="Zoë", last_name="Ångström", address=""))
+    repo.add_many(contacts)
+    return repo
+
+
+@pytest.mark.parametrize("name", ["contacts.csv", "contacts.vcf"])
+def test_export_import_round_trip(source, settings, tmp_path, name):
+    path = str(tmp_path / name)
+    report = export_contacts(source, path)
+    assert report.exported == 27
+
+    target = SqliteContactRepository.connect({**settings, "sqlite_path": str(tmp_path / "copy.db")})
+    try:
+        target.create_schema()
+        report = import_contacts(target, path, batch_size=10)
+        assert report.imported == 27
+        assert contact_fields(target) == contact_fields(source)
+        # Imported rows are searchable
+        assert [row[1] for row in target.search_text("Ångström")] == ["Zoë"]
+    finally:
+        target.close()
+
+
+def test_export_compressed_json_lines(source, tmp_path):
+    path = str(tmp_path / "contacts.jsonl.gz")
+    export_contacts(source, path, criteria={"last_name": "Ångström"})
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        lines = f.read().splitlines()
+    assert len(lines) == 1 and "Zoë" in lines[0]
+
+
+def test_add_many_logs_only_its_own_rows(repo, settings):
+    other = SqliteContactRepository.connect(settings)
+    write_values = repo.write_values
+    inserted = []
+
+    def write_values_with_concurrent_insert(contact):
+        # Another connection adds a contact while the batch is being written
+        if not inserted:
+            inserted.append(other.add(make_contact(99)))
+        return write_values(contact)
+
+    repo.write_values = write_values_with_concurrent_insert
+    try:
+        repo.add_many([make_contact(number) for number in range(3)])
+    finally:
+        other.close()
+    logged = repo.execute("SELECT contact_id FROM contact_changes WHERE operation = 'I' "
+                          "ORDER BY contact_id").fetchall()
+    assert [row[0] for row in logged] == sorted([row[0] for row in repo.fetch_at(None, 0, 10)])
+
+
+def test_add_many_inserts_a_batch_in_one_statement(repo, monkeypatch):
+    statements = []
+    executemany = repo.executemany
+
+    def counting_executemany(cursor, query, rows):
+        statements.append(query)
+        executemany(cursor, query, rows)
+
+    monkeypatch.setattr(repo, "executemany", counting_executemany)
+    monkeypatch.setattr(repo, "insert_contact", None)
+    assert repo.add_many([make_contact(number) for number in range(500)]) == 500
+    assert sum(query.startswith("INSERT INTO contacts ") for query in statements) == 1
+    # Each id carries its own contact
+    assert all(repo.get(number + 1)[1] == f"First{number:05d}" for number in range(0, 500, 37))
+
+
+class _OutputCursor:
+    """Cursor that numbers inserted rows like an IDENTITY column and outputs the ids in reverse"""
+
+    def __init__(self):
+        self.next_id = 100
+        self.statements = []
+        self.rows = []
+
+    def execute(self, query, params):
+        self.statements.append((query, params))
+        count = query.count("(?, ")
+        self.rows = [(self.next_id + number,) for number in reversed(range(count))]
+        self.next_id += count
+
+    def fetchall(self):
+        return self.rows
+
+
+def test_sqlserver_insert_contacts_batches_rows_and_orders_ids():
+    repo = SqlServerContactRepository(None)
+    cursor = _OutputCursor()
+    rows = [[f"value{number}"] * len(WRITE_COLUMNS) for number in range(450)]
+    ids = repo.insert_contacts(cursor, rows)
+    assert ids == list(range(100, 550))
+    per_statement = repo.MAX_PARAMETERS // (len(WRITE_COLUMNS) + 1)
+    assert len(cursor.statements) == -(-450 // per_statement)
+    assert all(len(params) <= repo.MAX_PARAMETERS for _, params in cursor.statements)
+    # The row numbers the ORDER BY sorts on lead each row's values
+    query, params = cursor.statements[0]
+    assert "ORDER BY row_number" in query and params[:2] == [0, "value0"]
+
+
+def test_vcard_lines_are_folded_at_75_octets(repo, tmp_path):
+    repo.add(make_contact(1, notes="ü" * 100, company="x" * 200))
+    path = tmp_path / "contacts.vcf"
+    export_contacts(repo, str(path))
+    data = path.read_bytes()
+    lines = data.split(b"\r\n")
+    assert max(len(line) for line in lines) <= 75
+    # Multi-byte characters are never split across lines
+    text = data.decode("utf-8").replace("\r\n ", "")
+    assert "NOTE:" + "ü" * 100 in text and "ORG:" + "x" * 200 in text
+
+
+def test_export_ids_in_the_given_order(source, tmp_path):
+    path = tmp_path / "contacts.jsonl"
+    report = export_contacts(source, str(path), ids=[27, 3, 14])
+    assert report.total == report.exported == 3
+    assert [json.loads(line)["id"] for line in path.read_text(encoding="utf-8").splitlines()] == [27, 3, 14]
+
+
+def test_cancelled_export_stops_after_the_chunk(source, tmp_path):
+    path = tmp_path / "contacts.csv"
+    calls = []
+
+    def cancel(report):
+        calls.append(report.exported)
+        report.cancel_requested = True
+
+    report = export_contacts(source, str(path), chunk_size=10, progress=cancel)
+    assert report.exported == 10 and calls == [10, 10]
+    # The header and the rows written so far stay in the file
+    assert len(path.read_text(encoding="utf-8").splitlines()) == 11
+
+
+def test_unsupported_export_format(source, tmp_path):
+    assert detect_format("contacts.VCF.gz") == "vcf"
+    with pytest.raises(ValueError, match="Unsupported export format"):
+        export_contacts(source, str(tmp_path / "contacts.xlsx"))
@@ -0,0 +1,95 @@
+import json
+import logging
+import time
+
+import pytest
+
+from phonebook.logs import AUDIT_LOGGER, audit, setup_logging
+
+from conftest import make_contact
+
+
+@pytest.fixture
+def start_logging(settings):
+    """setup_logging with settings overrides, undone after the test"""
+    root = logging.getLogger()
+    saved = root.handlers[:], root.level
+    writers = []
+
+    def start(**overrides):
+        writers.append(setup_logging({**settings, **overrides}))
+        return writers[-1]
+
+    yield start
+    for writer in writers:
+        writer.stop()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.handlers[:], root.level = saved
+    audit_logger = logging.getLogger(AUDIT_LOGGER)
+    audit_logger.handlers.clear()
+    audit_logger.setLevel(logging.NOTSET)
+
+
+def test_records_are_written_in_batches(start_logging, tmp_path):
+    path = tmp_path / "phonebook.log"
+    writer = start_logging(log_path=str(path), log_flush_interval=60)
+    for number in range(10):
+        logging.info(f"Record {number}")
+    time.sleep(0.2)
+    # Handled, but not flushed to the file yet
+    assert path.read_text(encoding="utf-8") == ""
+    writer.stop()
+    lines = path.read_text(encoding="utf-8").splitlines()
+    assert [line.split(" - ", 2)[1:] for line in lines] == [["INFO", f"Record {number}"] for number in range(10)]
+
+
+def test_flush_interval(start_logging, tmp_path):
+    path = tmp_path / "phonebook.log"
+    start_logging(log_path=str(path), log_flush_interval=0.05)
+    logging.warning("Soon on disk")
+    deadline = time.monotonic() + 5
+    while "Soon on disk" not in path.read_text(encoding="utf-8"):
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_log_file_rotates_by_size(start_logging, tmp_path):
+    path = tmp_path / "phonebook.log"
+    writer = start_logging(log_path=str(path), log_max_bytes=1000, log_backup_count=2)
+    for number in range(100):
+        logging.info(f"Record {number:03d} " + "x" * 40)
+    writer.stop()
+    assert sorted(p.name for p in tmp_path.iterdir() if p.name.startswith("phonebook.log")) == [
+        "phonebook.log", "phonebook.log.1", "phonebook.log.2"]
+    assert all(p.stat().st_size <= 1000 for p in tmp_path.iterdir() if p.name.startswith("phonebook.log"))
+    assert "Record 099" in path.read_text(encoding="utf-8")
+
+
+def test_audit_lines(start_logging, repo, tmp_path):
+    log_path, audit_path = tmp_path / "phonebook.log", tmp_path / "audit.jsonl"
+    writer = start_logging(log_path=str(log_path), audit_log_path=str(audit_path))
+    contact_id = repo.add(make_contact(1))
+    old = repo.get(contact_id)
+    repo.update(contact_id, make_contact(1, company="Analytical Engines", notes="Ünïcode"))
+    audit("update", contact_id, old, repo.get(contact_id), source="test")
+    audit("delete", contact_id, repo.get(contact_id), None)
+    writer.stop()
+
+    first, second = [json.loads(line) for line in audit_path.read_text(encoding="utf-8").splitlines()]
+    assert first["action"] == "update" and first["contact_id"] == contact_id and first["source"] == "test"
+    # Only changed columns, never the dates
+    assert first["changes"] == {"company": ["Company 31", "Analytical Engines"],
+                                "notes": ["Note for contact 1", "Ünïcode"]}
+    assert first["user"] and first["host"] and first["time"]
+    assert second["changes"]["first_name"] == ["First00001", None]
+    # The audit trail stays out of the application log
+    assert "Contact " not in log_path.read_text(encoding="utf-8")
+
+
+def test_audit_is_off_without_a_path(start_logging, tmp_path):
+    writer = start_logging(log_path=str(tmp_path / "phonebook.log"))
+    assert not logging.getLogger(AUDIT_LOGGER).isEnabledFor(logging.INFO)
+    audit("delete", 1, None, None)
+    writer.stop()
+    assert "Contact 1" not in (tmp_path / "phonebook.log").read_text(encoding="utf-8")
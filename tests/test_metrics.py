@@ -0,0 +1,93 @@
+import socket
+
+from phonebook import metrics as metrics_module
+from phonebook.metrics import BUCKETS, RECENT_SAMPLES, Histogram, Metrics, StatsdClient
+
+
+def test_percentiles_of_the_recent_samples():
+    histogram = Histogram()
+    assert histogram.percentile(0.5) == 0.0
+    for ms in range(100, 0, -1):
+        histogram.observe(ms / 1000)
+    assert histogram.percentile(0.50) == 0.05
+    assert histogram.percentile(0.95) == 0.095
+    assert histogram.percentile(0.99) == 0.099
+    assert histogram.percentile(1.0) == 0.1
+    assert histogram.summary() == {"count": 100, "mean_ms": 50.5, "p50_ms": 50.0, "p95_ms": 95.0, "p99_ms": 99.0,
+                                   "max_ms": 100.0}
+
+
+def test_percentiles_only_use_the_latest_samples():
+    histogram = Histogram()
+    histogram.observe(10.0)
+    for _ in range(RECENT_SAMPLES):
+        histogram.observe(0.001)
+    assert histogram.percentile(1.0) == 0.001
+    # The totals still count every sample
+    assert histogram.count == RECENT_SAMPLES + 1 and histogram.max == 10.0
+
+
+def test_bucket_bounds_are_inclusive():
+    histogram = Histogram()
+    for seconds in (0.0, BUCKETS[0], 0.0006, BUCKETS[-1], 60.0):
+        histogram.observe(seconds)
+    assert histogram.buckets[0] == 2
+    assert histogram.buckets[1] == 1
+    assert histogram.buckets[-2] == 1 and histogram.buckets[-1] == 1
+
+
+def test_prometheus_text():
+    metrics = Metrics()
+    metrics.observe("query_seconds", 0.003, "search")
+    metrics.observe("query_seconds", 20.0, "search")
+    metrics.increment("query_errors_total", "search", 2)
+    metrics.increment("reloads_total")
+    metrics.gauge("pool", lambda: {"size": 2, "idle": 1.5, "closed": False})
+    metrics.gauge("broken", lambda: 1 / 0)
+    lines = metrics.prometheus_text().splitlines()
+    assert "# TYPE phonebook_query_seconds histogram" in lines
+    assert 'phonebook_query_seconds_bucket{operation="search",le="0.0025"} 0' in lines
+    assert 'phonebook_query_seconds_bucket{operation="search",le="0.005"} 1' in lines
+    assert 'phonebook_query_seconds_bucket{operation="search",le="10.0"} 1' in lines
+    assert 'phonebook_query_seconds_bucket{operation="search",le="+Inf"} 2' in lines
+    assert 'phonebook_query_seconds_sum{operation="search"} 20.003000' in lines
+    assert 'phonebook_query_seconds_count{operation="search"} 2' in lines
+    assert 'phonebook_query_errors_total{operation="search"} 2' in lines
+    assert "phonebook_reloads_total 1" in lines
+    assert "phonebook_pool_size 2" in lines and "phonebook_pool_idle 1.5" in lines
+    # Flags and failing gauges are left out
+    assert not any("closed" in line or "broken" in line for line in lines)
+
+
+def test_timer_and_snapshot(monkeypatch):
+    clock = iter([10.0, 10.25])
+    monkeypatch.setattr(metrics_module.time, "perf_counter", lambda: next(clock))
+    metrics = Metrics()
+    with metrics.timer("query_seconds", "details"):
+        pass
+    snapshot = metrics.snapshot()
+    assert snapshot["histograms"][("query_seconds", "details")]["max_ms"] == 250.0
+    assert snapshot["counters"] == {} and snapshot["gauges"] == {}
+
+
+def test_statsd_packets():
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as receiver:
+        receiver.bind(("127.0.0.1", 0))
+        receiver.settimeout(5)
+        statsd = StatsdClient("127.0.0.1", receiver.getsockname()[1], "pb")
+        metrics = Metrics(statsd)
+        metrics.observe("query_seconds", 0.0125, "search")
+        metrics.increment("reloads_total")
+        assert receiver.recv(100) == b"pb.query_seconds.search:12.500|ms"
+        assert receiver.recv(100) == b"pb.reloads_total:1|c"
+        metrics.close()
+
+
+def test_prometheus_file_is_written_on_close(tmp_path):
+    path = tmp_path / "phonebook.prom"
+    metrics = Metrics()
+    metrics.start_export(str(path), interval=3600)
+    metrics.increment("reloads_total")
+    metrics.close()
+    assert path.read_text(encoding="utf-8") == "# TYPE phonebook_reloads_total counter\nphonebook_reloads_total 1\n"
+    assert [p.name for p in tmp_path.iterdir()] == ["phonebook.prom"]
@@ -0,0 +1,38 @@
+import sqlite3
+
+from phonebook import migrations
+from phonebook.storage import SqliteContactRepository
+
+
+def test_empty_database_reaches_latest_version(repo):
+    assert migrations.current_version(repo) == migrations.SQLITE.latest
+    # Running again applies nothing
+    assert migrations.migrate(repo, migrations.SQLITE) == 0
+
+
+def test_populated_version_1_database_is_upgraded(settings):
+    conn = sqlite3.connect(settings["sqlite_path"])
+    conn.execute(migrations.SQLITE.version_table)
+    for step in migrations.SQLITE.migrations[0].steps:
+        conn.execute(step)
+    conn.execute("INSERT INTO schema_version (version, description) VALUES (1, 'Create contacts table')")
+    conn.executemany("INSERT INTO contacts (first_name, last_name, phone, email, company, notes) "
+                     "VALUES (?, ?, ?, ?, ?, ?)",
+                     [(f"Ada{i}", "Lovelace", f"+1 (555) 010-{i:04d}", None, None, "analytical engine")
+                      for i in range(1500)])
+    conn.commit()
+    conn.close()
+
+    repo = SqliteContactRepository.connect(settings)
+    try:
+        repo.create_schema()
+        assert migrations.current_version(repo) == migrations.SQLITE.latest
+        assert repo.count() == 1500
+        assert repo.execute("SELECT COUNT(*) FROM contacts WHERE phone_digits IS NULL").fetchone()[0] == 0
+        assert repo.lookup_by_phone("15550100042")[1] == "Ada42"
+        assert [row[1] for row in repo.search_text("0100042")] == ["Ada42"]
+        assert len(repo.search_text("analytical", limit=2000)) == 1500
+        # NULLs of the sortable columns were replaced
+        assert repo.execute("SELECT COUNT(*) FROM contacts WHERE email IS NULL").fetchone()[0] == 0
+    finally:
+        repo.close()
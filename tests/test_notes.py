@@ -0,0 +1,42 @@
+from phonebook.storage import CONTACT_COLUMNS, HEADER_COLUMNS, NOTES_PREVIEW_LENGTH, notes_truncated
+
+from conftest import make_contact
+
+LONG_NOTES = "".join(f"Line {number:05d} ünïcode\n" for number in range(5000))
+
+
+def test_headers_carry_the_start_of_long_notes(repo):
+    repo.add_many([make_contact(1), make_contact(2, notes=LONG_NOTES), make_contact(3, notes="")])
+    short, long, empty = 1, 2, 3
+    headers = list(repo.iter_headers([long, 99, short, empty], chunk_size=2))
+    assert [header[0] for header in headers] == [long, short, empty]
+    assert all(len(header) == len(HEADER_COLUMNS) for header in headers)
+    long_header, short_header, empty_header = headers
+    assert long_header[7] == LONG_NOTES[:NOTES_PREVIEW_LENGTH] and long_header[-1] == len(LONG_NOTES)
+    assert notes_truncated(long_header)
+    assert not notes_truncated(short_header) and short_header[:-1] == repo.get(short)
+    assert not notes_truncated(empty_header) and empty_header[-1] == 0
+    # Full records are never truncated
+    assert len(repo.get(long)) == len(CONTACT_COLUMNS) and not notes_truncated(repo.get(long))
+
+
+def test_notes_are_read_in_parts(repo):
+    contact_id = repo.add(make_contact(1, notes=LONG_NOTES))
+    parts, offset = [], 0
+    while True:
+        part = repo.read_notes(contact_id, offset, 10000)
+        if not part:
+            break
+        parts.append(part)
+        offset += len(part)
+    assert "".join(parts) == LONG_NOTES and len(parts) == -(-len(LONG_NOTES) // 10000)
+    assert repo.read_notes(contact_id, len(LONG_NOTES)) == ""
+    assert repo.read_notes(999) is None
+
+
+def test_notes_over_http(repo, api):
+    contact_id = repo.add(make_contact(1, notes=LONG_NOTES))
+    assert api.get_header(contact_id) == repo.get_header(contact_id)
+    assert api.read_notes(contact_id, 100, 50) == LONG_NOTES[100:150]
+    assert api.read_notes(999) is None
+
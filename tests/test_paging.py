@@ -0,0 +1,151 @@
+import pytest
+
+from phonebook.paging import (ContactPageSource, SearchPageSource, TextSearchSource, insert_position, list_row,
+                              sort_rows)
+from phonebook.storage import SORT_COLUMNS
+
+from conftest import make_contact
+
+SORTS = [sort for column in SORT_COLUMNS for sort in (column, f"-{column}")]
+
+
+@pytest.fixture
+def filled(repo):
+    """Repository with 300 contacts, some sharing last names and companies"""
+    repo.add_many([make_contact(number, last_name=f"Name{number % 40:02d}") for number in range(300)])
+    return repo
+
+
+def expected_rows(repo, sort, criteria=None):
+    """Every matching row, sorted in Python"""
+    rows = repo.fetch_at(criteria, 0, 10000)
+    return sort_rows(rows, sort)
+
+
+def page_forward(source, repo, page_size):
+    rows = source.fetch_at(repo, 0, page_size)
+    result = list(rows)
+    while rows:
+        rows = source.fetch_after(repo, source.key(rows[-1]), page_size)
+        result += rows
+    return result
+
+
+@pytest.mark.parametrize("sort", SORTS)
+def test_keyset_pages_follow_every_sort(filled, sort):
+    source = ContactPageSource(sort=sort)
+    expected = expected_rows(filled, sort)
+    assert page_forward(source, filled, 37) == expected
+
+    # Backwards from the end
+    rows = expected[-37:]
+    result = list(rows)
+    while rows:
+        rows = source.fetch_before(filled, source.key(rows[0]), 37)
+        result[:0] = rows
+    assert result == expected
+
+    # Jumping to a position
+    assert source.fetch_at(filled, 150, 20) == expected[150:170]
+
+
+@pytest.mark.parametrize("sort", ["phone", "-company", "email"])
+def test_large_search_result_is_paged_in_the_chosen_order(filled, sort):
+    criteria = {"last_name": "name"}
+    source = SearchPageSource(criteria, max_rows=50, sort=sort)
+    total, first_page = source.load(filled, 25)
+    expected = expected_rows(filled, sort, criteria)
+    assert total == len(expected) > source.max_rows
+    assert source.rows is None
+    assert first_page == expected[:25]
+    rows, result = first_page, list(first_page)
+    while rows:
+        rows = source.fetch_after(filled, source.key(rows[-1]), 25)
+        result += rows
+    assert result == expected
+
+
+def test_small_search_result_is_kept_in_memory(filled):
+    source = SearchPageSource({"last_name": "name07"}, max_rows=50, sort="-phone")
+    total, rows = source.load(filled, 5)
+    assert total == len(source.rows) == 8
+    assert source.rows == expected_rows(filled, "-phone", {"last_name": "name07"})
+    assert rows == source.rows[:5]
+
+
+@pytest.mark.parametrize("sort", SORTS)
+def test_insert_position_keeps_the_order(filled, sort):
+    rows = expected_rows(filled, sort)
+    for row in rows[::29]:
+        others = [other for other in rows if other[0] != row[0]]
+        assert insert_position(others, row, sort) == rows.index(row)
+
+
+def test_memory_source_apply_change(filled):
+    source = SearchPageSource({"last_name": "name07"}, max_rows=50, sort="first_name")
+    source.load(filled, 5)
+    shared = source.rows
+    changed = list_row(filled.get(shared[0][0]))
+    changed = (changed[0], "Zoe") + changed[2:]
+    source.apply_change(changed[0], changed)
+    assert source.rows[-1] == changed
+    assert shared[0][0] == changed[0] and shared[0][1] != "Zoe"
+    source.apply_change(changed[0], None)
+    assert changed[0] not in [row[0] for row in source.rows]
+    assert len(source.rows) == 7
+
+
+@pytest.mark.parametrize("sort", [None, "-last_name", "company", "-email"])
+def test_pages_break_ties_on_id(repo, sort):
+    # Whole pages of contacts with the same names, company and email, differing only in case
+    repo.add_many([make_contact(number, first_name="Jo" if number % 2 else "JO", last_name="Smith",
+                                company="Acme", email="jo@example.com") for number in range(45)]
+                  + [make_contact(number) for number in range(45, 60)])
+    source = ContactPageSource(sort=sort)
+    expected = expected_rows(repo, sort)
+    result = page_forward(source, repo, 10)
+    assert result == expected
+    assert len({row[0] for row in result}) == 60
+
+    rows = expected[-10:]
+    backwards = list(rows)
+    while rows:
+        rows = source.fetch_before(repo, source.key(rows[0]), 10)
+        backwards[:0] = rows
+    assert backwards == expected
+
+
+def test_key_must_match_the_sort(repo):
+    with pytest.raises(ValueError):
+        repo.fetch_after(None, ("Smith", 1), 10, "last_name")
+
+
+def test_new_contacts_are_inserted_in_list_order(filled):
+    source = SearchPageSource({"last_name": "name07"}, max_rows=50)
+    source.load(filled, 5)
+    contact_id = filled.add(make_contact(1000, last_name="Name07", first_name="Aaron"))
+    row = list_row(filled.get(contact_id))
+    assert source.matches(row)
+    source.apply_change(contact_id, row)
+    assert source.rows == expected_rows(filled, None, {"last_name": "name07"})
+    assert source.fetch_after(filled, source.key(row), 100) == source.rows[source.rows.index(row) + 1:]
+    # Contacts that do not match stay out of the result
+    assert not source.matches(list_row(filled.get(1)))
+
+
+def test_text_search_results_keep_their_rank_order(repo):
+    repo.add_many([make_contact(1, notes="harbour"), make_contact(2, last_name="Harbour"),
+                   make_contact(3, company="Harbour Freight")])
+    source = TextSearchSource("harbour")
+    source.load(repo, 10)
+    assert source.all_ids(repo) == [2, 3, 1]
+    # An edited row stays where it was ranked, whatever its new names
+    renamed = list_row(repo.get(2))
+    renamed = (2, "Zed", "Zulu") + renamed[3:]
+    source.apply_change(2, renamed)
+    assert source.rows[0] == renamed
+    # New contacts are not ranked, deleted ones disappear
+    source.apply_change(4, (4, "Harbour", "New", "555-0000004", "", ""))
+    source.apply_change(3, None)
+    assert source.all_ids(repo) == [2, 1]
+    assert source.fetch_after(repo, (2,), 10) == source.rows[1:]
@@ -0,0 +1,50 @@
+import pytest
+
+from phonebook import phones
+from phonebook.storage import SqliteContactRepository
+
+from conftest import make_contact
+
+
+@pytest.mark.parametrize("phone, country_code, expected", [
+    ("+1 (555) 010-0042", "", ("15550100042", "+15550100042", "24000105551")),
+    ("0044 20 7946 0958", "", ("00442079460958", "+442079460958", "85906497024400")),
+    ("020 7946 0958", "+44", ("02079460958", "+442079460958", "85906497020")),
+    ("020 7946 0958", "", ("02079460958", None, "85906497020")),
+    # E.164 numbers have 7 to 15 digits
+    ("+1 555", "", ("1555", None, "5551")),
+    ("+1234567890123456", "", ("1234567890123456", None, "6543210987654321")),
+    ("", "", ("", None, "")),
+    (None, "49", ("", None, "")),
+])
+def test_normalize(phone, country_code, expected):
+    assert phones.normalize(phone, country_code) == expected
+
+
+def test_looks_like_phone():
+    assert phones.looks_like_phone("+1 (555) 010-0042")
+    assert phones.looks_like_phone("555.0100/12")
+    assert not phones.looks_like_phone("ext. 12")
+    assert not phones.looks_like_phone("() -")
+    assert not phones.looks_like_phone(None)
+
+
+def test_common_suffix_length():
+    assert phones.common_suffix_length("15550100042", "5550100042") == 10
+    assert phones.common_suffix_length("123", "124") == 0
+    assert phones.common_suffix_length("", "1") == 0
+
+
+def test_phone_columns_use_the_default_country_code(settings):
+    repo = SqliteContactRepository.connect(dict(settings, default_country_code="+44"))
+    try:
+        repo.create_schema()
+        contact_id = repo.add(make_contact(1, phone="020 7946 0958"))
+        assert repo.execute("SELECT phone_digits, phone_e164, phone_reversed FROM contacts WHERE id = ?",
+                            [contact_id]).fetchone() == ("02079460958", "+442079460958", "85906497020")
+        # Updates normalize the new number
+        repo.update(contact_id, make_contact(1, phone="+1 555 010 0042"))
+        assert repo.execute("SELECT phone_e164 FROM contacts WHERE id = ?", [contact_id]).fetchone() == (
+            "+15550100042",)
+    finally:
+        repo.close()
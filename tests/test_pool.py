@@ -0,0 +1,139 @@
+import pytest
+
+from phonebook import pool as pool_module
+from phonebook.pool import ConnectionPool, PoolTimeout
+
+
+class _Repo:
+    """Connection stand-in that can be made to fail its ping"""
+
+    def __init__(self, number):
+        self.number = number
+        self.alive = True
+        self.closed = False
+
+    def ping(self):
+        if not self.alive:
+            raise ConnectionError("server closed the connection")
+
+    def close(self):
+        self.closed = True
+
+
+class _Connector:
+    """connect function that fails a number of times before it succeeds"""
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.opened = []
+
+    def __call__(self):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("server unavailable")
+        self.opened.append(_Repo(len(self.opened)))
+        return self.opened[-1]
+
+
+class _Clock:
+    """Stands in for the time module, sleeping only advances the clock"""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    perf_counter = monotonic
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(pool_module, "time", clock)
+    return clock
+
+
+def test_reconnects_with_exponential_backoff(clock):
+    connect = _Connector(failures=5)
+    pool = ConnectionPool(connect, max_size=2, timeout=60, max_backoff=2)
+    repo = pool.acquire()
+    assert repo is connect.opened[0]
+    assert clock.sleeps == [0.25, 0.5, 1.0, 2.0, 2.0]
+    assert pool.stats()["reconnects"] == 5
+    assert pool.stats()["max_wait_ms"] == 5750.0
+
+
+def test_gives_up_reconnecting_at_the_deadline(clock):
+    pool = ConnectionPool(_Connector(failures=100), max_size=1, timeout=1)
+    with pytest.raises(ConnectionError):
+        pool.acquire()
+    # The next delay would have passed the deadline
+    assert clock.sleeps == [0.25, 0.5]
+    assert pool.stats()["size"] == pool.stats()["in_use"] == 0
+
+
+def test_fill_opens_min_size_connections():
+    connect = _Connector()
+    pool = ConnectionPool(connect, min_size=2, max_size=4)
+    pool.fill()
+    assert pool.stats()["idle"] == pool.stats()["size"] == 2
+    assert pool.acquire() in connect.opened
+
+
+def test_exhausted_pool_times_out():
+    pool = ConnectionPool(_Connector(), max_size=1)
+    repo = pool.acquire()
+    with pytest.raises(PoolTimeout, match="1 of 1 in use"):
+        pool.acquire(timeout=0.05)
+    pool.release(repo)
+    assert pool.acquire(timeout=0.05) is repo
+    assert pool.stats()["timeouts"] == 1
+
+
+def test_dead_idle_connection_is_replaced():
+    connect = _Connector()
+    pool = ConnectionPool(connect, max_size=1, ping_interval=0)
+    first = pool.acquire()
+    pool.release(first)
+    first.alive = False
+    second = pool.acquire()
+    assert second is not first and first.closed
+    assert pool.stats()["failed_pings"] == 1
+    assert pool.stats()["size"] == 1
+
+
+def test_idle_connection_is_not_pinged_within_the_interval():
+    pool = ConnectionPool(_Connector(), max_size=1, ping_interval=60)
+    repo = pool.acquire()
+    pool.release(repo)
+    repo.alive = False
+    assert pool.acquire() is repo
+
+
+def test_broken_connection_is_closed_on_release():
+    connect = _Connector()
+    pool = ConnectionPool(connect, max_size=1)
+    repo = pool.acquire()
+    pool.release(repo, broken=True)
+    assert repo.closed
+    assert pool.stats()["size"] == pool.stats()["in_use"] == 0
+    assert pool.acquire() is connect.opened[1]
+
+
+def test_close():
+    pool = ConnectionPool(_Connector(), max_size=2)
+    idle, in_use = pool.acquire(), pool.acquire()
+    pool.release(idle)
+    pool.close()
+    assert idle.closed and not in_use.closed
+    with pytest.raises(PoolTimeout, match="closed"):
+        pool.acquire()
+    pool.release(in_use)
+    assert in_use.closed
+    assert pool.stats()["size"] == 0
@@ -0,0 +1,97 @@
+from phonebook.search import SearchCache, normalize_criteria
+
+from conftest import make_contact
+
+
+def test_text_search_ranks_name_matches_first(repo):
+    repo.add_many([make_contact(1, notes="met at the harbour"),
+                   make_contact(2, last_name="Harbour"),
+                   make_contact(3, company="Harbour Freight"),
+                   make_contact(4)])
+    rows = repo.search_text("harbour")
+    assert [row[0] for row in rows] == [2, 3, 1]
+
+
+def test_text_search_cap_keeps_best_candidates(repo):
+    # Many weak matches in the notes come before the one name match in id order
+    repo.add_many([make_contact(number, notes="call about the zebra project") for number in range(50)])
+    repo.add_many([make_contact(50, first_name="Zebra")])
+    rows = repo.search_text("zebra", max_candidates=5)
+    assert rows[0][1] == "Zebra"
+
+
+def test_text_search_every_word_must_match(repo):
+    repo.add_many([make_contact(1, first_name="Ada", company="Lovelace Labs"),
+                   make_contact(2, first_name="Ada", company="Babbage Works")])
+    assert [row[0] for row in repo.search_text("ada lovelace")] == [1]
+    # Short words are matched with LIKE
+    assert [row[0] for row in repo.search_text("ad babbage")] == [2]
+
+
+def test_text_search_applies_criteria(repo):
+    repo.add_many([make_contact(1, company="Orbit", last_name="Stone"),
+                   make_contact(2, company="Orbit", last_name="Rivers")])
+    rows = repo.search_text("orbit", {"last_name": "Riv"})
+    assert [row[0] for row in rows] == [2]
+
+
+def test_text_search_finds_phone_digits(repo):
+    repo.add_many([make_contact(1, phone="(555) 010-2030"), make_contact(2)])
+    assert [row[0] for row in repo.search_text("010-2030")] == [1]
+
+
+def test_lookup_by_phone(repo):
+    repo.add_many([make_contact(1, phone="555-1234567"), make_contact(2, phone="+44 20 7946 0958")])
+    assert repo.lookup_by_phone("5551234567")[0] == 1
+    # Longest common suffix when the digits differ
+    assert repo.lookup_by_phone("+1 555 123 4567")[0] == 1
+    assert repo.lookup_by_phone("020 7946 0958")[0] == 2
+    assert repo.lookup_by_phone("999 888 7777") is None
+    assert repo.lookup_by_phone("") is None
+
+
+def test_lookup_by_phone_finds_the_longest_suffix_among_many(repo):
+    # 60 numbers end in the same seven digits, the one added last shares ten
+    repo.add_many([make_contact(number, phone=f"+44 {number:03d} 123 4567") for number in range(60)])
+    best = repo.add(make_contact(60, phone="020 9876 1234567"))
+    assert repo.lookup_by_phone("+1 (876) 123-4567")[0] == best
+    # "+44 009 123 4567" shares eight digits, the others seven
+    assert repo.lookup_by_phone("999 1234567")[0] == 10
+
+
+def test_refined_search_matches_the_database(repo):
+    repo.add_many([make_contact(number, first_name=name, phone=f"(555) 01{number}-2030")
+                   for number, name in enumerate(["John", "Joan", "Johanna", "Bo", "JOHNNY"])])
+    cache = SearchCache()
+    cache.put({"first_name": "jo"}, repo.fetch_at({"first_name": "jo"}, 0, 100))
+    for criteria in ({"first_name": "JOH"}, {"first_name": "john"}, {"first_name": "jo", "phone": "5550112"},
+                     {"first_name": "jo", "phone": "(555) 013"}):
+        assert cache.get(criteria) == repo.fetch_at(criteria, 0, 100)
+    assert cache.stats()["refinements"] == 4
+    # Refined results are cached in their own right
+    assert cache.get({"first_name": "john"}) == repo.fetch_at({"first_name": "john"}, 0, 100)
+    assert cache.hits == 1
+
+
+def test_search_cache_misses():
+    cache = SearchCache(max_entries=2, max_rows=2)
+    cache.put({"last_name": "lo"}, [(1, "Ada", "Lovelace", "555", "", "")])
+    # Criteria that widen the search or search other fields are not refinements
+    assert cache.get({"last_name": "l"}) is None
+    assert cache.get({"first_name": "ada"}) is None
+    # Ranked text searches and results over max_rows are not cached
+    cache.put({"text": "ada"}, [])
+    cache.put({"first_name": "a"}, [(1,), (2,), (3,)])
+    assert len(cache.entries) == 1
+
+    generation = cache.generation
+    cache.clear()
+    cache.put({"last_name": "lo"}, [], generation)
+    assert cache.get({"last_name": "lo"}) is None
+    assert cache.hit_rate == 0.0
+
+
+def test_normalized_criteria():
+    assert normalize_criteria({"first_name": " Ada ", "last_name": "", "phone": "+1 (555) 010"}) == (
+        ("first_name", "ada"), ("phone", "1555010"))
+    assert normalize_criteria({"phone": "ext."}) == (("phone", "ext."),)
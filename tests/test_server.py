@@ -0,0 +1,85 @@
+import socket
+
+from phonebook.paging import ContactPageSource
+
+from conftest import make_contact
+
+
+def test_contact_round_trip(repo, api):
+    contact_id = api.add(make_contact(1, first_name="Ada", last_name="Lovelace", phone="+1 555 010 0042"))
+    record = api.get(contact_id)
+    assert record == repo.get(contact_id)
+    assert record[1:4] == ("Ada", "Lovelace", "+1 555 010 0042")
+
+    api.update(contact_id, make_contact(1, first_name="Augusta", last_name="Lovelace", phone="+1 555 010 0042"))
+    assert api.get(contact_id)[1] == "Augusta"
+    assert api.lookup_by_phone("15550100042")[0] == contact_id
+    assert [row[0] for row in api.search_text("augusta")] == [contact_id]
+
+    api.delete(contact_id)
+    assert api.get(contact_id) is None
+    assert api.lookup_by_phone("15550100042") is None
+    # Like the database repositories, a missing contact is reported as False
+    assert api.delete(contact_id) is False
+
+
+def test_pages_match_the_repository(repo, api):
+    assert api.add_many([make_contact(number) for number in range(60)]) == 60
+    assert api.count() == repo.count() == 60
+    for sort in ("last_name", "-email", "company"):
+        first = api.fetch_at(None, 0, 20, sort)
+        assert first == repo.fetch_at(None, 0, 20, sort)
+        key = ContactPageSource(sort=sort).key(first[-1])
+        assert api.fetch_after(None, key, 20, sort) == repo.fetch_after(None, key, 20, sort)
+        assert api.fetch_before(None, key, 5, sort) == repo.fetch_before(None, key, 5, sort)
+    assert list(api.iter_contacts(ids=[3, 1, 2])) == list(repo.iter_contacts(ids=[3, 1, 2]))
+
+
+def test_unchanged_pages_are_revalidated(api, monkeypatch):
+    api.add(make_contact(1))
+    first = api.fetch_at(None, 0, 10)
+    statuses = []
+    getresponse = api.conn.getresponse
+
+    def record_status():
+        response = getresponse()
+        statuses.append(response.status)
+        return response
+
+    monkeypatch.setattr(api.conn, "getresponse", record_status)
+    assert api.fetch_at(None, 0, 10) == first
+    assert statuses == [304]
+
+
+def test_change_feed_sees_writes_made_directly_in_the_database(repo, api):
+    api.add(make_contact(1))
+    token = api.change_token()
+    assert api.changes_since(token) == (token, [])
+    assert api.contact_ids() == [1]
+
+    # Not through the server, so its response cache is not cleared
+    contact_id = repo.add(make_contact(2))
+    assert api.change_token() > token
+    new_token, changes = api.changes_since(token)
+    assert [change[0] for change in changes] == [contact_id]
+    assert api.contact_ids() == [1, contact_id]
+    assert [record[0] for record in api.changed_since()] == [1, contact_id]
+
+
+def test_writes_to_a_deleted_contact_report_false(repo, api):
+    contact_id = api.add(make_contact(1))
+    assert api.update(contact_id, make_contact(1, company="Still here")) is True
+    assert repo.delete(contact_id) is True
+    assert api.update(contact_id, make_contact(1, company="Gone")) is False
+    assert api.delete(contact_id) is False
+    assert repo.update(contact_id, make_contact(1)) is False
+
+
+def test_overlong_request_line_is_answered_with_400(api):
+    host, port = api.netloc.split(":")
+    with socket.create_connection((host, int(port)), timeout=10) as sock:
+        sock.sendall(b"GET /contacts?first_name=" + b"a" * 70000 + b" HTTP/1.1\r\n\r\n")
+        response = sock.recv(4096)
+    assert response.startswith(b"HTTP/1.1 400 ")
+    # The server keeps answering other clients
+    assert api.count() == 0
@@ -0,0 +1,70 @@
+from phonebook import snapshot as snapshot_module
+from phonebook.snapshot import open_snapshot, sync_snapshot
+
+from conftest import make_contact
+
+
+def records(repo):
+    return list(repo.iter_contacts())
+
+
+def test_first_sync_copies_then_changes_follow_the_log(repo, settings):
+    repo.add_many([make_contact(number) for number in range(30)])
+    repo.delete(5)
+    snapshot = open_snapshot(settings)
+    try:
+        assert sync_snapshot(repo, snapshot, batch_size=7) == (29, 0)
+        assert records(snapshot) == records(repo)
+        assert snapshot.state("synced_at") is not None
+
+        added = repo.add(make_contact(100, first_name="Grace", last_name="Hopper"))
+        repo.update(1, make_contact(1, company="Analytical Engines"))
+        repo.delete(2)
+        assert sync_snapshot(repo, snapshot) == (2, 1)
+        assert records(snapshot) == records(repo)
+        # The copies are indexed like the database
+        assert [row[0] for row in snapshot.search_text("analytical")] == [1]
+        assert [row[0] for row in snapshot.search_fuzzy("grays hoper")] == [added]
+        assert sync_snapshot(repo, snapshot) == (0, 0)
+    finally:
+        snapshot.close()
+
+
+def test_expired_change_token_falls_back_to_a_copy(repo, settings, monkeypatch):
+    monkeypatch.setattr(snapshot_module, "ID_BATCH_SIZE", 4)
+    repo.add_many([make_contact(number) for number in range(20)])
+    snapshot = open_snapshot(settings)
+    try:
+        sync_snapshot(repo, snapshot)
+        # Usually within the same second as the last copied contact, 20
+        repo.update(3, make_contact(3, first_name="Changed"))
+        for contact_id in (2, 9, 20):
+            repo.delete(contact_id)
+        # The log entries were pruned before this client caught up
+        repo.execute("UPDATE contact_changes SET changed_date = '2000-01-01'")
+        repo.commit()
+        repo.prune_changes(30)
+        assert repo.changes_since(int(snapshot.state("change_token"))) is None
+
+        stored, removed = sync_snapshot(repo, snapshot)
+        assert removed == 3
+        assert records(snapshot) == records(repo)
+    finally:
+        snapshot.close()
+
+
+def test_snapshot_state_survives_reopening(repo, settings):
+    repo.add(make_contact(1))
+    snapshot = open_snapshot(settings)
+    sync_snapshot(repo, snapshot)
+    token, synced_at = snapshot.state("change_token"), snapshot.state("synced_at")
+    snapshot.close()
+
+    snapshot = open_snapshot(settings)
+    try:
+        assert snapshot.state("change_token") == token == str(repo.change_token())
+        assert snapshot.state("synced_at") == synced_at
+        assert snapshot.state("missing", "default") == "default"
+        assert snapshot.fetch_at(None, 0, 10) == repo.fetch_at(None, 0, 10)
+    finally:
+        snapshot.close()
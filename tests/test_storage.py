@@ -0,0 +1,94 @@
+import pytest
+
+from phonebook import migrations
+from phonebook.storage import SqliteContactRepository, SqlServerContactRepository, open_repository
+
+
+class _RecordingConnection:
+    """pyodbc connection stand-in that records statements and answers with canned rows"""
+
+    def __init__(self, version=0):
+        self.version = version
+        self.statements = []
+        self.commits = 0
+
+    def cursor(self):
+        return _RecordingCursor(self)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        pass
+
+
+class _RecordingCursor:
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.rows = []
+
+    def execute(self, query, params=()):
+        self.conn.statements.append((" ".join(query.split()), list(params)))
+        self.rows = [(self.conn.version or None,)] if "MAX(version)" in query else []
+
+    def fetchone(self):
+        return self.rows[0] if self.rows else None
+
+    def fetchall(self):
+        return self.rows
+
+    def close(self):
+        pass
+
+
+def test_open_repository_picks_the_backend(settings):
+    repo = open_repository(settings)
+    try:
+        assert isinstance(repo, SqliteContactRepository)
+    finally:
+        repo.close()
+    with pytest.raises(ValueError, match="Unknown storage backend"):
+        open_repository(dict(settings, backend="oracle"))
+
+
+def test_backends_have_the_same_migration_versions():
+    assert ([migration.version for migration in migrations.SQLSERVER.migrations]
+            == [migration.version for migration in migrations.SQLITE.migrations])
+    assert migrations.SQLSERVER.latest == migrations.SQLITE.latest
+
+
+def test_sqlserver_pages_use_top_and_offset_fetch():
+    conn = _RecordingConnection()
+    repo = SqlServerContactRepository(conn)
+    repo.fetch_after(None, ("Lovelace", "Ada", 7), 20)
+    query, params = conn.statements[-1]
+    assert query.startswith("SELECT TOP (?) ")
+    # TOP comes before the WHERE clause, so its parameter is the first
+    assert params == [20, "Lovelace", "Lovelace", "Lovelace", "Ada", "Ada", 7]
+
+    repo.fetch_at(None, 40, 20)
+    query, params = conn.statements[-1]
+    assert query.endswith("OFFSET ? ROWS FETCH NEXT ? ROWS ONLY") and params[-2:] == [40, 20]
+
+
+def test_sqlserver_like_patterns_escape_brackets():
+    repo = SqlServerContactRepository(None)
+    assert repo.like_pattern("50%_[a]") == "%50\\%\\_\\[a]%"
+    # SQLite has no character classes in LIKE
+    assert SqliteContactRepository(None).like_pattern("[a]") == "%[a]%"
+
+
+def test_sqlserver_upgrade_from_version_3_applies_the_rest_in_order():
+    conn = _RecordingConnection(version=3)
+    repo = SqlServerContactRepository(conn)
+    assert migrations.migrate(repo, migrations.SQLSERVER) == migrations.SQLSERVER.latest - 3
+    recorded = [params[0] for query, params in conn.statements if query.startswith("INSERT INTO schema_version")]
+    assert recorded == list(range(4, migrations.SQLSERVER.latest + 1))
+    queries = [query for query, _ in conn.statements]
+    assert any("ALTER COLUMN notes NVARCHAR(MAX)" in query for query in queries)
+    assert any("CREATE TABLE contact_changes" in query for query in queries)
+    # Migrations up to 3 were not run again
+    assert not any("CREATE TABLE contact_trigrams" in query for query in queries)
+    # Migration 7 indexed the names of the contacts lacking them
+    assert any(query.startswith("SELECT TOP (?) ") and "contact_names" in query for query in queries)